@@ -0,0 +1,49 @@
+"""
+Zip archives streamed while they are written.
+
+zipfile writes to any file object with write(); on one that cannot seek
+it emits each entry's sizes in a trailing data descriptor, so finished
+entries can be sent to the client immediately instead of building the
+whole archive in memory or on disk first.
+"""
+import zipfile
+from typing import AsyncIterable, AsyncIterator, Tuple
+
+
+class _ChunkBuffer:
+    """Write-only, unseekable file object collecting bytes until they are taken"""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def write(self, data: bytes) -> int:
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self):
+        pass
+
+    def take(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+async def stream_zip(entries: AsyncIterable[Tuple[str, bytes]]) -> AsyncIterator[bytes]:
+    """Yield a deflated zip archive of (name, data) entries, one entry at a time"""
+    buffer = _ChunkBuffer()
+    with zipfile.ZipFile(buffer, mode="w", compression=zipfile.ZIP_DEFLATED) as archive:
+        async for name, data in entries:
+            archive.writestr(name, data)
+            chunk = buffer.take()
+            if chunk:
+                yield chunk
+    # Closing the archive wrote the central directory
+    chunk = buffer.take()
+    if chunk:
+        yield chunk
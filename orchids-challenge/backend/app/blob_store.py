@@ -0,0 +1,155 @@
+import asyncio
+import base64
+import hashlib
+import logging
+import mmap
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+
+from .cache import atomic_write
+
+logger = logging.getLogger(__name__)
+
+# File extensions for the media types we store
+_EXTENSIONS = {
+    "image/jpeg": ".jpg",
+    "image/webp": ".webp",
+    "image/png": ".png",
+}
+
+
+class BlobStore:
+    """
+    Content-addressed store for binary payloads such as screenshots.
+
+    Blobs are written once under the sha256 of their bytes and referenced
+    from cache entries by a small dict ({"sha256", "media_type", "bytes"}),
+    so JSON records never carry base64 image data. Reads are lazy and use
+    mmap; the store is bounded by a byte budget and evicts the least
+    recently read blobs, tracked in an in-memory index built once at startup.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = 1024 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        self._stats = {"writes": 0, "dedup_hits": 0, "reads": 0, "missing": 0, "evictions": 0}
+        # path -> size, least recently used first; puts and reads run in worker threads
+        self._index: "OrderedDict[str, int]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._load_index()
+
+    def _load_index(self):
+        """Index the blobs already on disk, oldest access first"""
+        blobs = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.startswith(".tmp-"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                blobs.append((st.st_mtime, path, st.st_size))
+        for _, path, size in sorted(blobs):
+            self._index[path] = size
+            self._bytes += size
+
+    async def put(self, data: bytes, media_type: str = "image/jpeg") -> Dict[str, Any]:
+        """Store data and return a reference to it"""
+        return await asyncio.to_thread(self._put, data, media_type)
+
+    async def read(self, ref: Dict[str, Any]) -> Optional[bytes]:
+        """Load the bytes for a reference, or None if the blob is gone"""
+        return await asyncio.to_thread(self._read, ref)
+
+    async def read_base64(self, ref: Dict[str, Any]) -> Optional[str]:
+        """Load a blob as a base64 string for API payloads"""
+        def _encode():
+            data = self._read(ref)
+            return base64.b64encode(data).decode("utf-8") if data is not None else None
+        return await asyncio.to_thread(_encode)
+
+    def has(self, ref: Dict[str, Any]) -> bool:
+        """Whether the blob a reference points to is still stored"""
+        return self._path(ref["sha256"], ref.get("media_type", "image/jpeg")) in self._index
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self._stats, "blobs": len(self._index), "bytes": self._bytes, "max_bytes": self.max_bytes}
+
+    def _path(self, sha256: str, media_type: str) -> str:
+        return os.path.join(self.directory, sha256[:2], sha256 + _EXTENSIONS.get(media_type, ".bin"))
+
+    def _put(self, data: bytes, media_type: str) -> Dict[str, Any]:
+        sha256 = hashlib.sha256(data).hexdigest()
+        path = self._path(sha256, media_type)
+        with self._lock:
+            stored = path in self._index
+            if stored:
+                # Identical content is already stored
+                self._index.move_to_end(path)
+                self._stats["dedup_hits"] += 1
+        if stored:
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            atomic_write(path, data)
+            with self._lock:
+                self._stats["writes"] += 1
+                # Another thread may have stored the same content meanwhile
+                if path not in self._index:
+                    self._bytes += len(data)
+                self._index[path] = len(data)
+            self._evict()
+        return {"sha256": sha256, "media_type": media_type, "bytes": len(data)}
+
+    def _read(self, ref: Dict[str, Any]) -> Optional[bytes]:
+        path = self._path(ref["sha256"], ref.get("media_type", "image/jpeg"))
+        try:
+            with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                data = mapped[:]
+        except (OSError, ValueError):
+            logger.warning(f"Blob {ref.get('sha256')} is missing from the blob store")
+            with self._lock:
+                self._stats["missing"] += 1
+                size = self._index.pop(path, None)
+                if size is not None:
+                    self._bytes -= size
+            return None
+        with self._lock:
+            if path in self._index:
+                self._index.move_to_end(path)
+            self._stats["reads"] += 1
+        # Touch so the access order survives a restart
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return data
+
+    def _evict(self):
+        """Remove the least recently used blobs until under the byte budget"""
+        evicted = []
+        with self._lock:
+            while self._bytes > self.max_bytes and self._index:
+                path, size = self._index.popitem(last=False)
+                self._bytes -= size
+                evicted.append(path)
+        removed = 0
+        for path in evicted:
+            try:
+                os.unlink(path)
+                removed += 1
+            except OSError:
+                pass
+        if removed:
+            with self._lock:
+                self._stats["evictions"] += removed
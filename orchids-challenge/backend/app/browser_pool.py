@@ -0,0 +1,272 @@
+import asyncio
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, Any, Optional, Set
+
+from playwright.async_api import async_playwright
+
+logger = logging.getLogger(__name__)
+
+# psutil is optional; without it the memory-based recycling is disabled
+try:
+    import psutil
+    PSUTIL_AVAILABLE = True
+except ImportError:
+    PSUTIL_AVAILABLE = False
+
+
+class _PooledBrowser:
+    """A launched Chromium instance and its usage bookkeeping"""
+
+    def __init__(self, browser, generation: int):
+        self.browser = browser
+        self.generation = generation
+        self.uses = 0
+        self.active_contexts = 0
+        self.retiring = False
+        self.launched_at = time.monotonic()
+        # Root process of this browser's Chromium tree, when psutil could find it
+        self.pid: Optional[int] = None
+        self.memory_mb = 0.0
+        self.memory_checked_at = self.launched_at
+
+
+class BrowserPool:
+    """
+    Long-lived Chromium pool shared by all scrape jobs.
+
+    A single Playwright driver is started once and hands out one isolated
+    BrowserContext per job. Browsers are recycled after a number of uses or
+    when the current browser's process tree exceeds a memory threshold, and
+    the number of concurrently open contexts is capped. Memory is sampled in
+    a thread at most every memory_check_interval seconds, and retired
+    browsers still finishing their jobs are not counted against the new one.
+    """
+
+    def __init__(
+        self,
+        max_contexts: Optional[int] = None,
+        max_uses_per_browser: Optional[int] = None,
+        max_memory_mb: Optional[int] = None,
+        memory_check_interval: Optional[float] = None,
+        headless: bool = True,
+    ):
+        self.max_contexts = max_contexts or int(os.getenv("BROWSER_POOL_MAX_CONTEXTS", "4"))
+        self.max_uses_per_browser = max_uses_per_browser or int(os.getenv("BROWSER_POOL_MAX_USES", "50"))
+        self.max_memory_mb = max_memory_mb or int(os.getenv("BROWSER_POOL_MAX_MEMORY_MB", "1536"))
+        self.memory_check_interval = (memory_check_interval if memory_check_interval is not None
+                                      else float(os.getenv("BROWSER_POOL_MEMORY_CHECK_SECONDS", "10")))
+        self.headless = headless
+
+        self._playwright = None
+        self._current: Optional[_PooledBrowser] = None
+        self._retired = []
+        self._generation = 0
+        self._semaphore = asyncio.Semaphore(self.max_contexts)
+        self._launch_lock = asyncio.Lock()
+        self._started = False
+
+        # Stats reported through the API
+        self._stats = {
+            "warm_acquisitions": 0,
+            "cold_acquisitions": 0,
+            "browsers_launched": 0,
+            "browsers_recycled": 0,
+            "total_wait_seconds": 0.0,
+            "max_wait_seconds": 0.0,
+        }
+
+    @property
+    def started(self) -> bool:
+        return self._started
+
+    async def start(self):
+        """Start the Playwright driver and launch the first browser"""
+        if self._started:
+            return
+        self._playwright = await async_playwright().start()
+        try:
+            async with self._launch_lock:
+                await self._launch()
+        except Exception:
+            await self._playwright.stop()
+            self._playwright = None
+            raise
+        self._started = True
+        logger.info(f"Browser pool started (max_contexts={self.max_contexts})")
+
+    async def stop(self):
+        """Close every browser and stop the Playwright driver"""
+        if not self._started:
+            return
+        self._started = False
+        browsers = self._retired + ([self._current] if self._current else [])
+        self._current = None
+        self._retired = []
+        for pooled in browsers:
+            await self._close_browser(pooled)
+        await self._playwright.stop()
+        self._playwright = None
+        logger.info("Browser pool stopped")
+
+    @asynccontextmanager
+    async def context(self, **context_options):
+        """Acquire an isolated BrowserContext for the duration of a job"""
+        if not self._started:
+            raise RuntimeError("Browser pool is not started")
+
+        wait_started = time.monotonic()
+        async with self._semaphore:
+            waited = time.monotonic() - wait_started
+            self._stats["total_wait_seconds"] += waited
+            self._stats["max_wait_seconds"] = max(self._stats["max_wait_seconds"], waited)
+
+            pooled, cold = await self._get_browser()
+            self._stats["cold_acquisitions" if cold else "warm_acquisitions"] += 1
+            pooled.uses += 1
+            pooled.active_contexts += 1
+
+            context = None
+            try:
+                context = await pooled.browser.new_context(**context_options)
+                yield context
+            finally:
+                if context is not None:
+                    try:
+                        await context.close()
+                    except Exception as e:
+                        logger.warning(f"Error closing browser context: {e}")
+                pooled.active_contexts -= 1
+                await self._maybe_recycle(pooled)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return pool statistics"""
+        acquisitions = self._stats["warm_acquisitions"] + self._stats["cold_acquisitions"]
+        return {
+            **self._stats,
+            "acquisitions": acquisitions,
+            "avg_wait_seconds": self._stats["total_wait_seconds"] / acquisitions if acquisitions else 0.0,
+            "max_contexts": self.max_contexts,
+            "open_contexts": self.max_contexts - self._semaphore._value,
+            "open_browsers": len(self._retired) + (1 if self._current else 0),
+            "current_browser_uses": self._current.uses if self._current else 0,
+            # Last sample of the current browser's process tree
+            "chromium_memory_mb": round(self._current.memory_mb, 1) if self._current else 0.0,
+        }
+
+    async def _get_browser(self):
+        """Return the current browser, launching a new one if needed"""
+        if self._current is not None and not self._current.retiring and self._current.browser.is_connected():
+            return self._current, False
+        async with self._launch_lock:
+            # Another task may have launched while we waited for the lock
+            if self._current is not None and not self._current.retiring and self._current.browser.is_connected():
+                return self._current, False
+            if self._current is not None:
+                self._retire(self._current)
+            return await self._launch(), True
+
+    async def _launch(self) -> _PooledBrowser:
+        # Launches are serialized by _launch_lock, so the Chromium processes
+        # that appear during this one belong to the new browser
+        before = await asyncio.to_thread(_chromium_pids) if PSUTIL_AVAILABLE else set()
+        browser = await self._playwright.chromium.launch(headless=self.headless)
+        self._generation += 1
+        pooled = _PooledBrowser(browser, self._generation)
+        if PSUTIL_AVAILABLE:
+            pooled.pid = await asyncio.to_thread(_browser_root_pid, before)
+        self._current = pooled
+        self._stats["browsers_launched"] += 1
+        logger.info(f"Launched pooled browser #{self._generation}")
+        return pooled
+
+    def _retire(self, pooled: _PooledBrowser):
+        pooled.retiring = True
+        if pooled is self._current:
+            self._current = None
+        if pooled not in self._retired:
+            self._retired.append(pooled)
+
+    async def _maybe_recycle(self, pooled: _PooledBrowser):
+        """Retire browsers past their use or memory budget and close idle retired ones"""
+        if not pooled.retiring:
+            if pooled.uses >= self.max_uses_per_browser:
+                logger.info(f"Recycling browser #{pooled.generation} after {pooled.uses} uses")
+                self._retire(pooled)
+            elif await self._over_memory(pooled):
+                logger.info(f"Recycling browser #{pooled.generation} at {pooled.memory_mb:.0f} MB, over memory threshold")
+                self._retire(pooled)
+
+        for retired in list(self._retired):
+            if retired.active_contexts == 0:
+                self._retired.remove(retired)
+                self._stats["browsers_recycled"] += 1
+                await self._close_browser(retired)
+
+    async def _close_browser(self, pooled: _PooledBrowser):
+        try:
+            await pooled.browser.close()
+        except Exception as e:
+            logger.warning(f"Error closing pooled browser #{pooled.generation}: {e}")
+
+    async def _over_memory(self, pooled: _PooledBrowser) -> bool:
+        """Whether a browser's process tree is over the memory threshold, sampling it if the last sample is stale"""
+        if not PSUTIL_AVAILABLE or pooled.pid is None:
+            return False
+        now = time.monotonic()
+        if now - pooled.memory_checked_at < self.memory_check_interval:
+            return False
+        pooled.memory_checked_at = now
+        pooled.memory_mb = await asyncio.to_thread(_process_tree_memory_mb, pooled.pid)
+        return pooled.memory_mb > self.max_memory_mb
+
+
+def _chromium_pids() -> Set[int]:
+    """PIDs of the Chromium processes spawned by this process"""
+    pids = set()
+    try:
+        for child in psutil.Process().children(recursive=True):
+            try:
+                if "chrom" in child.name().lower():
+                    pids.add(child.pid)
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                continue
+    except psutil.Error:
+        pass
+    return pids
+
+
+def _browser_root_pid(before: Set[int]) -> Optional[int]:
+    """Top process of the Chromium tree started since the `before` snapshot"""
+    started = _chromium_pids() - before
+    for pid in started:
+        try:
+            if psutil.Process(pid).ppid() not in started:
+                return pid
+        except psutil.Error:
+            continue
+    return None
+
+
+def _process_tree_memory_mb(pid: int) -> float:
+    """
+    Memory of a process and its descendants.
+
+    Uses PSS where the platform has it (USS otherwise), so pages shared
+    between Chromium's processes are not counted once per process.
+    """
+    try:
+        root = psutil.Process(pid)
+        processes = [root] + root.children(recursive=True)
+    except psutil.Error:
+        return 0.0
+    total = 0
+    for process in processes:
+        try:
+            info = process.memory_full_info()
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            continue
+        total += getattr(info, "pss", None) or getattr(info, "uss", 0)
+    return total / (1024 * 1024)
@@ -0,0 +1,347 @@
+import asyncio
+import gzip
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+import zlib
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+
+from .metrics import CACHE_LOOKUPS, CACHE_OPERATION_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# zstandard is optional; entries fall back to gzip without it
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+# What reading a truncated or corrupt entry file can raise
+_UNREADABLE_ERRORS = (OSError, ValueError, EOFError, zlib.error) + ((zstandard.ZstdError,) if ZSTD_AVAILABLE else ())
+
+
+def cache_key(*parts) -> str:
+    """Content address for a cache entry: sha256 of its canonical JSON key parts"""
+    canonical = json.dumps(parts, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def _compress(raw: bytes):
+    if ZSTD_AVAILABLE:
+        return zstandard.ZstdCompressor(level=3).compress(raw), '.zst'
+    return gzip.compress(raw, compresslevel=6), '.gz'
+
+
+def _decompress(payload: bytes, suffix: str) -> bytes:
+    if suffix == '.zst':
+        return zstandard.ZstdDecompressor().decompress(payload)
+    return gzip.decompress(payload)
+
+
+def atomic_write(path: str, data: bytes):
+    """Write to a temp file in the same directory and rename it into place"""
+    directory = os.path.dirname(path)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+class _DiskEntry:
+    """Index record for an entry in the on-disk tier"""
+
+    __slots__ = ('path', 'size', 'expires_at', 'last_access')
+
+    def __init__(self, path: str, size: int, expires_at: float, last_access: float):
+        self.path = path
+        self.size = size
+        self.expires_at = expires_at
+        self.last_access = last_access
+
+
+class TieredCache:
+    """
+    Two-tier JSON cache: an in-process LRU in front of compressed files on disk.
+
+    Entries are addressed by the sha256 of their key, written atomically and
+    carry a per-entry TTL. Both tiers are bounded by a byte budget and evict
+    least recently used entries. Disk I/O and (de)compression run in worker
+    threads so the event loop is never blocked.
+
+    Values are returned as shallow copies, so callers may add or pop top-level
+    keys without affecting the cached entry.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        default_ttl: float = 86400,
+        max_bytes: int = 512 * 1024 * 1024,
+        memory_max_bytes: int = 64 * 1024 * 1024,
+        memory_max_entries: int = 32,
+        name: Optional[str] = None,
+    ):
+        self.directory = directory
+        # Label of the cache's metrics
+        self.name = name or os.path.basename(os.path.normpath(directory))
+        self.default_ttl = default_ttl
+        self.max_bytes = max_bytes
+        self.memory_max_bytes = memory_max_bytes
+        self.memory_max_entries = memory_max_entries
+
+        # key -> (value, size, expires_at)
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self._memory_bytes = 0
+        self._disk: Dict[str, _DiskEntry] = {}
+        self._disk_bytes = 0
+        self._pending_writes = set()
+        # key -> (value, expires_at) for set_nowait entries still being serialized
+        self._pending_values: Dict[str, tuple] = {}
+
+        self._stats = {
+            'memory_hits': 0,
+            'disk_hits': 0,
+            'misses': 0,
+            'expired': 0,
+            'memory_evictions': 0,
+            'disk_evictions': 0,
+            'writes': 0,
+            'write_errors': 0,
+        }
+
+        os.makedirs(directory, exist_ok=True)
+        self._load_index()
+
+    def _load_index(self):
+        """Rebuild the disk index from the entry files already on disk"""
+        now = time.time()
+        for name in os.listdir(self.directory):
+            if name.startswith('.tmp-') or not name.endswith('.meta.json'):
+                continue
+            key = name[:-len('.meta.json')]
+            try:
+                with open(os.path.join(self.directory, name), 'r') as f:
+                    meta = json.load(f)
+                path = os.path.join(self.directory, key + meta['suffix'])
+                size = os.path.getsize(path)
+            except (OSError, ValueError, KeyError):
+                continue
+            self._disk[key] = _DiskEntry(path, size, meta['expires_at'], os.path.getmtime(path))
+            self._disk_bytes += size
+        # Drop anything that expired while the process was down
+        for key in [k for k, e in self._disk.items() if e.expires_at <= now]:
+            self._remove_disk_entry(key)
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return the cached value for key, or None on a miss"""
+        with CACHE_OPERATION_SECONDS.labels(cache=self.name, operation="read").time():
+            value = await self._get(key)
+        CACHE_LOOKUPS.labels(cache=self.name, result="miss" if value is None else "hit").inc()
+        return value
+
+    async def _get(self, key: str) -> Optional[Dict[str, Any]]:
+        now = time.time()
+
+        pending = self._pending_values.get(key)
+        if pending is not None and pending[1] > now:
+            self._stats['memory_hits'] += 1
+            return dict(pending[0])
+
+        expired = False
+        cached = self._memory.get(key)
+        if cached is not None:
+            value, size, expires_at = cached
+            if expires_at > now:
+                self._memory.move_to_end(key)
+                self._stats['memory_hits'] += 1
+                return dict(value)
+            self._drop_memory(key)
+            expired = True
+
+        entry = self._disk.get(key)
+        if entry is not None and entry.expires_at <= now:
+            await self._remove_disk_entries([key])
+            expired = True
+            entry = None
+        # The same entry expiring from both tiers counts once
+        if expired:
+            self._stats['expired'] += 1
+
+        if entry is None:
+            self._stats['misses'] += 1
+            return None
+
+        try:
+            value, size = await asyncio.to_thread(self._read_entry, entry.path)
+        except _UNREADABLE_ERRORS as e:
+            logger.warning(f"Dropping unreadable cache entry {key}: {e}")
+            await self._remove_disk_entries([key])
+            self._stats['misses'] += 1
+            return None
+
+        entry.last_access = now
+        self._stats['disk_hits'] += 1
+        self._put_memory(key, value, size, entry.expires_at)
+        return dict(value)
+
+    async def set(self, key: str, value: Dict[str, Any], ttl: Optional[float] = None):
+        """Store value in both tiers and wait for the disk write"""
+        expires_at = time.time() + (ttl if ttl is not None else self.default_ttl)
+        await self._store(key, dict(value), expires_at)
+
+    def set_nowait(self, key: str, value: Dict[str, Any], ttl: Optional[float] = None):
+        """Make value readable immediately and store it in the background"""
+        expires_at = time.time() + (ttl if ttl is not None else self.default_ttl)
+        value = dict(value)
+        self._pending_values[key] = (value, expires_at)
+        task = asyncio.get_running_loop().create_task(self._store(key, value, expires_at))
+        self._pending_writes.add(task)
+
+        def _done(done_task):
+            self._pending_writes.discard(done_task)
+            if self._pending_values.get(key, (None,))[0] is value:
+                del self._pending_values[key]
+
+        task.add_done_callback(_done)
+
+    async def _store(self, key: str, value: Dict[str, Any], expires_at: float):
+        with CACHE_OPERATION_SECONDS.labels(cache=self.name, operation="write").time():
+            raw = await asyncio.to_thread(
+                lambda: json.dumps(value, separators=(',', ':')).encode('utf-8')
+            )
+            self._put_memory(key, value, len(raw), expires_at)
+            await self._write_to_disk(key, raw, expires_at)
+
+    async def delete(self, key: str):
+        """Remove an entry from both tiers"""
+        self._pending_values.pop(key, None)
+        self._drop_memory(key)
+        await self._remove_disk_entries([key])
+
+    async def flush(self):
+        """Wait for background disk writes to finish"""
+        if self._pending_writes:
+            await asyncio.gather(*list(self._pending_writes), return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        hits = self._stats['memory_hits'] + self._stats['disk_hits']
+        lookups = hits + self._stats['misses']
+        return {
+            **self._stats,
+            'hits': hits,
+            'hit_ratio': hits / lookups if lookups else 0.0,
+            'memory_entries': len(self._memory),
+            'memory_bytes': self._memory_bytes,
+            'disk_entries': len(self._disk),
+            'disk_bytes': self._disk_bytes,
+            'max_bytes': self.max_bytes,
+            'codec': 'zstd' if ZSTD_AVAILABLE else 'gzip',
+        }
+
+    # ---- memory tier ----
+
+    def _put_memory(self, key: str, value: Dict[str, Any], size: int, expires_at: float):
+        # Entries bigger than the whole memory budget only live on disk
+        if size > self.memory_max_bytes:
+            self._drop_memory(key)
+            return
+        self._drop_memory(key)
+        self._memory[key] = (value, size, expires_at)
+        self._memory_bytes += size
+        while self._memory and (self._memory_bytes > self.memory_max_bytes or
+                                len(self._memory) > self.memory_max_entries):
+            oldest = next(iter(self._memory))
+            self._drop_memory(oldest)
+            self._stats['memory_evictions'] += 1
+
+    def _drop_memory(self, key: str):
+        cached = self._memory.pop(key, None)
+        if cached is not None:
+            self._memory_bytes -= cached[1]
+
+    # ---- disk tier ----
+
+    async def _write_to_disk(self, key: str, raw: bytes, expires_at: float):
+        try:
+            path, size = await asyncio.to_thread(self._write_entry, key, raw, expires_at)
+        except OSError as e:
+            self._stats['write_errors'] += 1
+            logger.error(f"Failed to write cache entry {key}: {e}")
+            return
+        previous = self._disk.get(key)
+        if previous is not None:
+            self._disk_bytes -= previous.size
+        self._disk[key] = _DiskEntry(path, size, expires_at, time.time())
+        self._disk_bytes += size
+        self._stats['writes'] += 1
+        await self._evict_disk()
+
+    def _write_entry(self, key: str, raw: bytes, expires_at: float):
+        payload, suffix = _compress(raw)
+        path = os.path.join(self.directory, key + suffix)
+        atomic_write(path, payload)
+        meta = {'suffix': suffix, 'expires_at': expires_at, 'raw_bytes': len(raw)}
+        atomic_write(os.path.join(self.directory, key + '.meta.json'), json.dumps(meta).encode('utf-8'))
+        return path, len(payload)
+
+    def _read_entry(self, path: str):
+        with open(path, 'rb') as f:
+            raw = _decompress(f.read(), os.path.splitext(path)[1])
+        return json.loads(raw), len(raw)
+
+    async def _evict_disk(self):
+        """Drop expired entries, then least recently used ones until under budget"""
+        now = time.time()
+        expired = [k for k, e in self._disk.items() if e.expires_at <= now]
+        self._stats['expired'] += len(expired)
+        evicted = []
+        remaining = self._disk_bytes - sum(self._disk[k].size for k in expired)
+        if remaining > self.max_bytes:
+            live = [(k, e) for k, e in self._disk.items() if e.expires_at > now]
+            for key, entry in sorted(live, key=lambda item: item[1].last_access):
+                if remaining <= self.max_bytes:
+                    break
+                evicted.append(key)
+                remaining -= entry.size
+        self._stats['disk_evictions'] += len(evicted)
+        await self._remove_disk_entries(expired + evicted)
+
+    async def _remove_disk_entries(self, keys):
+        """Remove entries from the index, then delete their files off the loop"""
+        paths = []
+        for key in keys:
+            entry = self._disk.pop(key, None)
+            if entry is None:
+                continue
+            self._disk_bytes -= entry.size
+            paths.extend([entry.path, os.path.join(self.directory, key + '.meta.json')])
+        if paths:
+            await asyncio.to_thread(self._unlink_files, paths)
+
+    def _remove_disk_entry(self, key: str):
+        """Synchronous removal, only used while loading the index at startup"""
+        entry = self._disk.pop(key, None)
+        if entry is None:
+            return
+        self._disk_bytes -= entry.size
+        self._unlink_files([entry.path, os.path.join(self.directory, key + '.meta.json')])
+
+    @staticmethod
+    def _unlink_files(paths):
+        for path in paths:
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
@@ -0,0 +1,273 @@
+"""
+Fit the design context sent to the model into a per-model token budget.
+
+Fields are added in priority order. A field that does not fit is shrunk
+(fewer list items, a shallower layout tree, shorter text) to whatever room
+is left, or dropped. CSS is deduplicated and minified first, and the
+result is serialized as compact JSON.
+"""
+import json
+import logging
+import math
+import os
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# JSON, CSS and markup run at roughly 3.5 characters per token; err on the high side
+CHARS_PER_TOKEN = 3.5
+
+# context_window / max_output_tokens come from the provider model; context_budget is
+# the share of input tokens the design context may use, and image_tokens what the
+# screenshot costs (Claude scales images to ~1.15 MP, Gemini charges per 768px tile)
+MODEL_BUDGETS = {
+    "claude": {"context_window": 200000, "max_output_tokens": 4000, "context_budget": 20000, "image_tokens": 1600},
+    "gemini": {"context_window": 1048576, "max_output_tokens": 8192, "context_budget": 30000, "image_tokens": 1032},
+}
+
+# Room kept for the instructions around the design context
+PROMPT_RESERVE_TOKENS = 1000
+
+# Share of the context budget the context shared by a crawled site's pages may use
+SITE_CONTEXT_SHARE = 0.5
+
+# Fields in the order they are included; the first group is always sent
+REQUIRED_FIELDS = ("url", "base_domain", "title", "favicon")
+FIELD_PRIORITY = (
+    "headings",
+    "colors",
+    "fonts",
+    "navigation_links",
+    "meta_tags",
+    "ui_components",
+    "layout",
+    "breakpoints",
+    "css_rules",
+    "inline_styles",
+)
+
+# Single rules longer than this (inlined fonts, huge @media blocks) cost more than they help
+MAX_CSS_RULE_CHARS = 4000
+
+# Rules on these selectors carry the page's base look, so they are kept first
+_BASE_SELECTOR = re.compile(r'^\s*(:root|html|body|h[1-6]|p|a|button|input|header|nav|main|footer)\b', re.I)
+_CSS_COMMENT = re.compile(r'/\*.*?\*/', re.S)
+_CSS_SPACE_AROUND = re.compile(r'\s*([{}:;,>])\s*')
+_CSS_WHITESPACE = re.compile(r'\s+')
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count for prompt text"""
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def model_budget(model: str, image_count: int = 1) -> Dict[str, int]:
+    """Token budget for a model, with CONTEXT_TOKEN_BUDGET_<MODEL> overriding the context share"""
+    budget = dict(MODEL_BUDGETS[model])
+    override = os.getenv(f"CONTEXT_TOKEN_BUDGET_{model.upper()}")
+    if override:
+        budget["context_budget"] = int(override)
+    # Never plan for more input than the context window leaves room for
+    available = (budget["context_window"] - budget["max_output_tokens"]
+                 - budget["image_tokens"] * image_count - PROMPT_RESERVE_TOKENS)
+    budget["context_budget"] = max(0, min(budget["context_budget"], available))
+    return budget
+
+
+def minify_css(css: str) -> str:
+    """Strip comments and redundant whitespace from CSS text"""
+    css = _CSS_COMMENT.sub('', css)
+    css = _CSS_WHITESPACE.sub(' ', css)
+    css = _CSS_SPACE_AROUND.sub(r'\1', css)
+    return css.replace(';}', '}').strip()
+
+
+def compact_css_rules(css_rules: List[Dict[str, Any]]) -> List[str]:
+    """Minified, deduplicated rule text, base element rules first, oversized rules dropped"""
+    seen = set()
+    base, other = [], []
+    for rule in css_rules or []:
+        text = rule.get("cssText") if isinstance(rule, dict) else rule
+        if not text:
+            continue
+        text = minify_css(text)
+        if len(text) > MAX_CSS_RULE_CHARS or text in seen:
+            continue
+        seen.add(text)
+        (base if _BASE_SELECTOR.match(text) else other).append(text)
+    return base + other
+
+
+def _dumps(value: Any) -> str:
+    return json.dumps(value, separators=(',', ':'), ensure_ascii=False)
+
+
+def _prune_depth(node: Any, depth: int) -> Any:
+    """Copy of a layout tree without the levels below depth"""
+    if isinstance(node, dict):
+        pruned = {}
+        for key, value in node.items():
+            if key in ("children", "structure"):
+                if depth > 0:
+                    pruned[key] = _prune_depth(value, depth - 1)
+            else:
+                pruned[key] = value
+        return pruned
+    if isinstance(node, list):
+        return [_prune_depth(item, depth) for item in node]
+    return node
+
+
+def _tree_depth(node: Any) -> int:
+    if isinstance(node, dict):
+        return max([_tree_depth(v) + (1 if k in ("children", "structure") else 0)
+                    for k, v in node.items()] or [0])
+    if isinstance(node, list):
+        return max([_tree_depth(item) for item in node] or [0])
+    return 0
+
+
+def _shrink(name: str, value: Any, budget: int) -> Tuple[Optional[Any], Optional[str]]:
+    """Largest reduced form of a field that fits budget tokens, and a note on what was cut"""
+    if isinstance(value, str):
+        limit = int(budget * CHARS_PER_TOKEN) - 2
+        if limit <= 0:
+            return None, None
+        return value[:limit], f"{limit}/{len(value)} chars"
+
+    if name == "layout" and isinstance(value, dict):
+        for depth in range(_tree_depth(value) - 1, -1, -1):
+            pruned = _prune_depth(value, depth)
+            if estimate_tokens(_dumps(pruned)) <= budget:
+                return pruned, f"depth {depth}"
+        return None, None
+
+    if name == "breakpoints" and isinstance(value, dict):
+        # Cut every breakpoint's layout tree to the same depth
+        layouts = [bp.get("layout") for bp in value.values()]
+        for depth in range(max([_tree_depth(layout) for layout in layouts] or [0]) - 1, -1, -1):
+            pruned = {n: {**bp, "layout": _prune_depth(bp.get("layout"), depth)} for n, bp in value.items()}
+            if estimate_tokens(_dumps(pruned)) <= budget:
+                return pruned, f"layout depth {depth}"
+        return None, None
+
+    if isinstance(value, list):
+        # Take items in order, skipping any single item too big for what is left
+        chars_left = budget * CHARS_PER_TOKEN - 2
+        kept = []
+        for item in value:
+            size = len(_dumps(item)) + 1
+            if size <= chars_left:
+                kept.append(item)
+                chars_left -= size
+        if not kept:
+            return None, None
+        return kept, f"{len(kept)}/{len(value)} items"
+
+    if isinstance(value, dict):
+        # Keep the same share of every list-valued group (e.g. ui_components)
+        lengths = [len(v) for v in value.values() if isinstance(v, list)]
+        low, high = 0, max(lengths or [0])
+        while low < high:
+            mid = (low + high + 1) // 2
+            candidate = {k: v[:mid] if isinstance(v, list) else v for k, v in value.items()}
+            if estimate_tokens(_dumps(candidate)) <= budget:
+                low = mid
+            else:
+                high = mid - 1
+        if low == 0:
+            return None, None
+        return {k: v[:low] if isinstance(v, list) else v for k, v in value.items()}, f"{low} per group"
+
+    return None, None
+
+
+def compact_context(context: Dict[str, Any], model: str, image_count: int = 1,
+                    budget_tokens: Optional[int] = None) -> Tuple[str, Dict[str, Any]]:
+    """
+    Serialize the design context within the model's token budget.
+
+    Returns the compact JSON and a report of the budget, estimated tokens
+    and which fields were truncated or dropped. budget_tokens, when given,
+    replaces the model's context budget.
+    """
+    budget = model_budget(model, image_count)["context_budget"] if budget_tokens is None else budget_tokens
+    context = dict(context)
+    if context.get("css_rules"):
+        context["css_rules"] = compact_css_rules(context["css_rules"])
+    if context.get("inline_styles"):
+        context["inline_styles"] = minify_css(context["inline_styles"])
+
+    included = {name: context.get(name) for name in REQUIRED_FIELDS}
+    used = estimate_tokens(_dumps(included))
+    truncated, dropped = {}, []
+    for name in FIELD_PRIORITY:
+        value = context.get(name)
+        if value in (None, "", [], {}):
+            continue
+        # Key, quotes, colon and comma around the value
+        overhead = estimate_tokens(f'"{name}":,')
+        cost = estimate_tokens(_dumps(value)) + overhead
+        if used + cost <= budget:
+            included[name] = value
+            used += cost
+            continue
+        reduced, note = _shrink(name, value, budget - used - overhead)
+        if reduced is None:
+            dropped.append(name)
+            continue
+        included[name] = reduced
+        truncated[name] = note
+        used += estimate_tokens(_dumps(reduced)) + overhead
+
+    context_json = _dumps(included)
+    report = {
+        "budget_tokens": budget,
+        "estimated_tokens": estimate_tokens(context_json),
+        "truncated": truncated,
+        "dropped": dropped,
+    }
+    if truncated or dropped:
+        logger.info(f"Compacted design context for {model} to {report['estimated_tokens']} tokens: truncated {truncated}, dropped {dropped}")
+    return context_json, report
+
+
+def compact_site_context(shared: Dict[str, Any], budget_tokens: int) -> Tuple[str, Dict[str, Any]]:
+    """
+    Serialize the context shared by a crawled site's pages within budget_tokens.
+
+    shared is crawler.deduplicate_site's {"css_rules", "layout"}. Its layout
+    subtrees become "components", each with the id page layouts reference
+    it by. Rules and then components that do not fit are cut like a page's.
+    """
+    fields = (
+        ("css_rules", compact_css_rules(shared.get("css_rules"))),
+        ("components", [{"shared": fingerprint, "layout": shape} for fingerprint, shape in (shared.get("layout") or {}).items()]),
+    )
+    included, truncated, dropped = {}, {}, []
+    used = 0
+    for name, value in fields:
+        if not value:
+            continue
+        overhead = estimate_tokens(f'"{name}":,')
+        cost = estimate_tokens(_dumps(value)) + overhead
+        if used + cost <= budget_tokens:
+            included[name] = value
+            used += cost
+            continue
+        reduced, note = _shrink(name, value, budget_tokens - used - overhead)
+        if reduced is None:
+            dropped.append(name)
+            continue
+        included[name] = reduced
+        truncated[name] = note
+        used += estimate_tokens(_dumps(reduced)) + overhead
+
+    site_json = _dumps(included)
+    return site_json, {
+        "budget_tokens": budget_tokens,
+        "estimated_tokens": estimate_tokens(site_json),
+        "truncated": truncated,
+        "dropped": dropped,
+    }
@@ -0,0 +1,303 @@
+"""
+Multi-page crawl of a site for whole-site clones.
+
+Same-origin links found on each page are followed up to a depth and page
+budget. The frontier is a priority queue (shallow pages, short paths and
+links that come early on their page first) over normalized, deduplicated
+URLs, drained by a few concurrent workers that each scrape through the
+shared browser pool. Layout subtrees and CSS rules that repeat across
+pages (headers, footers, the site stylesheet) are split out once, and
+each page is generated from its own part after that shared context.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode, urlparse
+
+from .scraper import normalize_url
+
+logger = logging.getLogger(__name__)
+
+# Query parameters that only track where a visitor came from
+TRACKING_PARAMS = ("utm_source", "utm_medium", "utm_campaign", "utm_term", "utm_content", "gclid", "fbclid", "mc_cid", "mc_eid", "ref")
+
+# Links to files rather than pages
+SKIPPED_EXTENSIONS = (
+    ".pdf", ".zip", ".gz", ".tar", ".dmg", ".exe", ".jpg", ".jpeg", ".png", ".gif", ".webp",
+    ".svg", ".ico", ".mp3", ".mp4", ".webm", ".mov", ".css", ".js", ".json", ".xml", ".rss", ".txt",
+)
+
+# Layout subtrees smaller than this are not worth sharing
+MIN_SHARED_LAYOUT_NODES = 5
+
+
+def crawl_url(url: str) -> Optional[str]:
+    """Canonical form of a link for the frontier, or None if it does not lead to a page"""
+    parsed = urlparse(url)
+    if parsed.scheme not in ("http", "https") or not parsed.netloc:
+        return None
+    if parsed.path.lower().endswith(SKIPPED_EXTENSIONS):
+        return None
+    query = sorted((key, value) for key, value in parse_qsl(parsed.query, keep_blank_values=True)
+                   if key.lower() not in TRACKING_PARAMS)
+    path = parsed.path.rstrip("/") or "/"
+    return normalize_url(parsed._replace(path=path, query=urlencode(query), fragment="").geturl())
+
+
+def page_links(design_context: Dict[str, Any]) -> List[str]:
+    """Every link found on a scraped page, in document order"""
+    if design_context.get("page_links") is not None:
+        return design_context["page_links"]
+    # Entries scraped before page_links only kept the first navigation links
+    return [link.get("href", "") for link in design_context.get("navigation_links") or []]
+
+
+def _origin(url: str) -> str:
+    parsed = urlparse(url)
+    return f"{parsed.scheme}://{parsed.netloc}"
+
+
+class CrawlFrontier:
+    """
+    Priority queue of pages still to visit.
+
+    Every URL is normalized and enqueued at most once; links off the
+    crawl's origins or deeper than max_depth are ignored. The origins are
+    the start URL's and, once it has loaded, the one it redirected to (e.g.
+    http to https or the apex domain to www).
+    """
+
+    def __init__(self, start_url: str, max_depth: int):
+        self.origins = {_origin(crawl_url(start_url) or start_url)}
+        self.max_depth = max_depth
+        # URL -> order of discovery
+        self.seen: Dict[str, int] = {}
+        self._queue: asyncio.PriorityQueue = asyncio.PriorityQueue()
+
+    def add(self, url: str, depth: int, position: int = 0) -> bool:
+        """Enqueue a link found at depth-1, position being its index among its page's links"""
+        url = crawl_url(url)
+        if url is None or depth > self.max_depth or url in self.seen or _origin(url) not in self.origins:
+            return False
+        self.seen[url] = len(self.seen)
+        path_segments = len([segment for segment in urlparse(url).path.split("/") if segment])
+        self._queue.put_nowait(((depth, path_segments, position, self.seen[url]), url, depth))
+        return True
+
+    def allow_origin(self, url: str):
+        """Also follow links to url's origin"""
+        url = crawl_url(url)
+        if url is not None:
+            self.origins.add(_origin(url))
+
+    async def get(self) -> Tuple[str, int]:
+        _, url, depth = await self._queue.get()
+        return url, depth
+
+    def task_done(self):
+        self._queue.task_done()
+
+    async def join(self):
+        await self._queue.join()
+
+    def __len__(self) -> int:
+        return self._queue.qsize()
+
+
+class SiteCrawler:
+    """
+    Crawls a site by scraping pages through a caller-supplied loader.
+
+    load_page(url) returns (design_context, from_cache); the application
+    passes its cached, single-flight, stage-limited loader so crawled pages
+    share the scrape cache and browser pool with every other job.
+    """
+
+    def __init__(self, load_page: Callable[[str], Awaitable[Tuple[Dict[str, Any], bool]]], concurrency: Optional[int] = None):
+        self.load_page = load_page
+        self.concurrency = concurrency or int(os.getenv("CRAWL_CONCURRENCY", "4"))
+
+    async def crawl(self, start_url: str, max_depth: int, max_pages: int,
+                    on_page: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None) -> Dict[str, Any]:
+        """
+        Crawl from start_url and return {"pages", "stats"}.
+
+        pages are in crawl order, the start page first; each has url,
+        depth, from_cache and design_context, or error if it failed.
+        on_page is awaited after every page.
+        """
+        started = time.perf_counter()
+        frontier = CrawlFrontier(start_url, max_depth)
+        frontier.add(start_url, 0)
+        pages: List[Dict[str, Any]] = []
+        claimed = 0
+
+        async def worker():
+            nonlocal claimed
+            while True:
+                url, depth = await frontier.get()
+                try:
+                    if claimed >= max_pages:
+                        continue
+                    claimed += 1
+                    page = await self._visit(url, depth)
+                    pages.append(page)
+                    if "design_context" in page and depth == 0 and page["design_context"].get("final_url"):
+                        # Links on a redirected start page point at the origin it landed on
+                        frontier.allow_origin(page["design_context"]["final_url"])
+                    if "design_context" in page and depth < max_depth:
+                        for position, link in enumerate(page_links(page["design_context"])):
+                            frontier.add(link, depth + 1, position)
+                    if on_page is not None:
+                        try:
+                            await on_page(page)
+                        except Exception as e:
+                            # Progress reporting must not stop the crawl
+                            logger.warning(f"Crawl progress callback failed for {url}: {e}")
+                finally:
+                    frontier.task_done()
+
+        workers = [asyncio.create_task(worker()) for _ in range(self.concurrency)]
+        joined = asyncio.create_task(frontier.join())
+        try:
+            # Workers only return by raising; the frontier would then never drain
+            done, _ = await asyncio.wait([joined, *workers], return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task is not joined:
+                    task.result()
+        finally:
+            for task in [joined, *workers]:
+                task.cancel()
+            await asyncio.gather(joined, *workers, return_exceptions=True)
+
+        # Workers finish out of order; report pages in the order they were discovered
+        pages.sort(key=lambda page: (page["depth"], frontier.seen[page["url"]]))
+        return {
+            "pages": pages,
+            "stats": {
+                "pages": len(pages),
+                "failed": sum(1 for page in pages if "error" in page),
+                "cache_hits": sum(1 for page in pages if page.get("from_cache")),
+                "discovered": len(frontier.seen),
+                "max_depth_reached": max((page["depth"] for page in pages), default=0),
+                "duration_ms": round((time.perf_counter() - started) * 1000, 2),
+            },
+        }
+
+    async def _visit(self, url: str, depth: int) -> Dict[str, Any]:
+        try:
+            design_context, from_cache = await self.load_page(url)
+        except Exception as e:
+            logger.warning(f"Crawl could not scrape {url}: {e}")
+            return {"url": url, "depth": depth, "error": str(e)}
+        return {"url": url, "depth": depth, "from_cache": from_cache, "design_context": design_context}
+
+
+def _fingerprint(value: Any) -> str:
+    return hashlib.sha256(json.dumps(value, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+def _layout_shape(node: Any) -> Any:
+    """A layout subtree without positions, which differ between pages for the same component"""
+    if isinstance(node, dict):
+        return {key: _layout_shape(value) for key, value in node.items() if key != "position"}
+    if isinstance(node, list):
+        return [_layout_shape(item) for item in node]
+    return node
+
+
+def _count_nodes(node: Any) -> int:
+    if isinstance(node, dict):
+        return 1 + sum(_count_nodes(child) for child in node.get("children") or [])
+    return 0
+
+
+def _layout_subtrees(node: Any, found: Dict[str, Any]):
+    """Fingerprint -> shape of every layout subtree big enough to share"""
+    for child in (node.get("structure") or node.get("children") or []) if isinstance(node, dict) else []:
+        if _count_nodes(child) >= MIN_SHARED_LAYOUT_NODES:
+            shape = _layout_shape(child)
+            found.setdefault(_fingerprint(shape), shape)
+        _layout_subtrees(child, found)
+
+
+def _replace_shared(node: Any, shared: Dict[str, Any], used: set) -> Any:
+    """Copy of a layout with shared subtrees replaced by {"shared": fingerprint, "position": ...}"""
+    if not isinstance(node, dict):
+        return node
+    replaced = dict(node)
+    for key in ("structure", "children"):
+        if node.get(key):
+            children = []
+            for child in node[key]:
+                if isinstance(child, dict) and _count_nodes(child) >= MIN_SHARED_LAYOUT_NODES:
+                    fingerprint = _fingerprint(_layout_shape(child))
+                    if fingerprint in shared:
+                        used.add(fingerprint)
+                        children.append({"shared": fingerprint, "position": child.get("position")})
+                        continue
+                children.append(_replace_shared(child, shared, used))
+            replaced[key] = children
+    return replaced
+
+
+def deduplicate_site(pages: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Split what the crawled pages have in common from what is page specific.
+
+    Returns {"shared": {"css_rules", "layout"}, "pages": [{url, depth,
+    title, css_rules, layout}], "stats"}. CSS rules and layout subtrees found
+    on two or more pages move to "shared"; page layouts reference shared
+    subtrees by fingerprint.
+    """
+    contexts = [(page, page["design_context"]) for page in pages if "design_context" in page]
+
+    rule_pages: Dict[str, int] = {}
+    for _, context in contexts:
+        for text in {rule.get("cssText") for rule in context.get("css_rules") or [] if rule.get("cssText")}:
+            rule_pages[text] = rule_pages.get(text, 0) + 1
+    shared_rules = [text for text, count in rule_pages.items() if count > 1]
+    shared_rule_set = set(shared_rules)
+
+    subtree_pages: Dict[str, int] = {}
+    shapes: Dict[str, Any] = {}
+    for _, context in contexts:
+        found: Dict[str, Any] = {}
+        _layout_subtrees(context.get("layout") or {}, found)
+        for fingerprint, shape in found.items():
+            subtree_pages[fingerprint] = subtree_pages.get(fingerprint, 0) + 1
+            shapes[fingerprint] = shape
+    shared_layout = {fp: shapes[fp] for fp, count in subtree_pages.items() if count > 1}
+
+    # Subtrees inside a shared subtree are never referenced on their own
+    used: set = set()
+    site_pages = []
+    for page, context in contexts:
+        site_pages.append({
+            "url": page["url"],
+            "depth": page["depth"],
+            "title": context.get("title"),
+            "css_rules": [rule for rule in context.get("css_rules") or [] if rule.get("cssText") not in shared_rule_set],
+            "layout": _replace_shared(context.get("layout") or {}, shared_layout, used),
+        })
+    shared_layout = {fp: shape for fp, shape in shared_layout.items() if fp in used}
+
+    shared = {"css_rules": shared_rules, "layout": shared_layout}
+    full_size = sum(len(json.dumps({"css_rules": c.get("css_rules"), "layout": c.get("layout")})) for _, c in contexts)
+    deduplicated_size = len(json.dumps(shared)) + sum(
+        len(json.dumps({"css_rules": p["css_rules"], "layout": p["layout"]})) for p in site_pages
+    )
+    return {
+        "shared": shared,
+        "pages": site_pages,
+        "stats": {
+            "shared_css_rules": len(shared_rules),
+            "shared_layout_subtrees": len(shared_layout),
+            "bytes_before": full_size,
+            "bytes_after": deduplicated_size,
+        },
+    }
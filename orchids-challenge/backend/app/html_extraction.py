@@ -0,0 +1,319 @@
+"""
+Extraction of page structure from scraped HTML, run in the process worker pool.
+
+With lxml installed the document is parsed once and walked once, each
+element feeding every extractor (meta tags, images, links, headings,
+favicon, UI components, style tags) as it is visited. Without lxml the
+original BeautifulSoup passes are used. Both return the same fields.
+"""
+import logging
+from typing import Any, Dict, List, Tuple
+from urllib.parse import urljoin
+
+from bs4 import BeautifulSoup
+
+logger = logging.getLogger(__name__)
+
+# lxml's C parser is several times faster than html.parser; it is optional
+try:
+    import lxml.html
+    from lxml import etree
+    LXML_AVAILABLE = True
+except ImportError:
+    LXML_AVAILABLE = False
+
+# Characters of the page's HTML kept in the design context
+HTML_SAMPLE_CHARS = 100000
+
+# Elements kept per component type
+MAX_COMPONENTS = 5
+
+COMPONENT_SELECTORS = {
+    'buttons': ['button', '.btn', '.button', '[role="button"]'],
+    'forms': ['form'],
+    'inputs': ['input', 'textarea', 'select'],
+    'navigation': ['nav', '.nav', '.navigation', '.menu'],
+    'cards': ['.card', '.box', '.panel', '.item'],
+    'modals': ['.modal', '.dialog', '.popup', '.overlay'],
+    'headers': ['header', '.header', '#header'],
+    'footers': ['footer', '.footer', '#footer'],
+    'sidebars': ['aside', '.sidebar', '#sidebar'],
+}
+
+# Attributes BeautifulSoup splits into lists; kept the same way so both paths agree
+_MULTI_VALUED_ATTRIBUTES = ('class', 'rel', 'rev', 'accept-charset', 'headers', 'accesskey', 'dropzone')
+
+# Text inside these elements is not page text
+_NON_TEXT_TAGS = ('script', 'style', 'template')
+
+
+def extract_html_data(html_content: str, base_url: str) -> Dict[str, Any]:
+    """
+    Extract the structural fields of the design context from page HTML.
+
+    Returns meta_tags, images, navigation_links, structure (title and
+    h1-h3 headings), favicon, ui_components, inline_styles, html_sample and
+    used_selectors (the tags, classes and ids present, for CSS pruning).
+    Relative links and image sources are resolved against base_url, the
+    URL of the page itself.
+    """
+    if LXML_AVAILABLE:
+        try:
+            return _extract_with_lxml(html_content, base_url)
+        except (etree.ParserError, ValueError) as e:
+            # Empty documents and XML-declared strings trip lxml; html.parser copes
+            logger.warning(f"lxml could not parse page, falling back to BeautifulSoup: {e}")
+    return extract_with_soup(html_content, base_url)
+
+
+def _absolute(url: str, base_url: str) -> str:
+    """A link resolved against the URL of the page it was found on"""
+    return url if url.startswith(('http://', 'https://')) else urljoin(base_url, url)
+
+
+def _compile_selectors() -> Tuple[Dict[str, list], Dict[str, list], Dict[str, list], List[tuple]]:
+    """Index the component selectors by tag, class, id and attribute for lookup during the walk"""
+    by_tag, by_class, by_id, by_attribute = {}, {}, {}, []
+    for component_type, selectors in COMPONENT_SELECTORS.items():
+        for index, selector in enumerate(selectors):
+            target = (component_type, index)
+            if selector.startswith('.'):
+                by_class.setdefault(selector[1:], []).append(target)
+            elif selector.startswith('#'):
+                by_id.setdefault(selector[1:], []).append(target)
+            elif selector.startswith('['):
+                name, _, value = selector[1:-1].partition('=')
+                by_attribute.append((name, value.strip('"\''), target))
+            else:
+                by_tag.setdefault(selector, []).append(target)
+    return by_tag, by_class, by_id, by_attribute
+
+
+_SELECTOR_INDEX = _compile_selectors()
+
+
+def _element_text(element) -> str:
+    """Stripped text of an element, joined without separators like BeautifulSoup's get_text(strip=True)"""
+    parts: List[str] = []
+    _collect_text(element, parts)
+    return ''.join(parts)
+
+
+def _collect_text(element, parts: List[str]):
+    if element.text and element.tag not in _NON_TEXT_TAGS:
+        text = element.text.strip()
+        if text:
+            parts.append(text)
+    for child in element:
+        # Comments and processing instructions have non-string tags; only their tail is text
+        if isinstance(child.tag, str) and child.tag not in _NON_TEXT_TAGS:
+            _collect_text(child, parts)
+        if child.tail:
+            tail = child.tail.strip()
+            if tail:
+                parts.append(tail)
+
+
+def _attributes(element) -> Dict[str, Any]:
+    return {
+        name: value.split() if name in _MULTI_VALUED_ATTRIBUTES else value
+        for name, value in element.attrib.items()
+    }
+
+
+def _extract_with_lxml(html_content: str, base_url: str) -> Dict[str, Any]:
+    document = lxml.html.document_fromstring(html_content)
+    by_tag, by_class, by_id, by_attribute = _SELECTOR_INDEX
+
+    meta_tags, images, navigation_links = [], [], []
+    headings = {'h1': [], 'h2': [], 'h3': []}
+    title = None
+    favicon = None
+    style_parts = []
+    tags, classes_used, ids = set(), set(), set()
+    # Matches per (component type, selector), in document order
+    matches: Dict[Tuple[str, int], list] = {}
+
+    def match(targets, element):
+        for target in targets:
+            found = matches.setdefault(target, [])
+            if len(found) < MAX_COMPONENTS:
+                found.append(element)
+
+    for element in document.iter():
+        tag = element.tag
+        if not isinstance(tag, str):
+            continue
+        attrib = element.attrib
+        tags.add(tag)
+
+        if tag == 'meta':
+            if attrib.get('name') or attrib.get('property'):
+                meta_tags.append({
+                    'name': attrib['name'] if 'name' in attrib else attrib.get('property'),
+                    'content': attrib.get('content'),
+                })
+        elif tag == 'img':
+            if 'src' in attrib:
+                images.append({
+                    'src': _absolute(attrib['src'], base_url),
+                    'alt': attrib.get('alt', ''),
+                    'width': attrib.get('width', ''),
+                    'height': attrib.get('height', ''),
+                })
+        elif tag == 'a':
+            if 'href' in attrib:
+                navigation_links.append({
+                    'href': _absolute(attrib['href'], base_url),
+                    'text': _element_text(element),
+                })
+        elif tag in headings:
+            headings[tag].append(_element_text(element))
+        elif tag == 'title':
+            if title is None:
+                title = element.text
+        elif tag == 'link':
+            if favicon is None and 'icon' in attrib.get('rel', '').lower():
+                # Only the first icon link counts, even if it has no href
+                favicon = _absolute(attrib['href'], base_url) if attrib.get('href') else ''
+        elif tag == 'style':
+            style_parts.append(element.text or '')
+
+        if tag in by_tag:
+            match(by_tag[tag], element)
+        classes = attrib.get('class')
+        if classes:
+            for name in set(classes.split()):
+                classes_used.add(name)
+                if name in by_class:
+                    match(by_class[name], element)
+        element_id = attrib.get('id')
+        if element_id:
+            ids.add(element_id)
+        if element_id in by_id:
+            match(by_id[element_id], element)
+        for name, value, target in by_attribute:
+            if attrib.get(name) == value:
+                match((target,), element)
+
+    ui_components = {}
+    for component_type, selectors in COMPONENT_SELECTORS.items():
+        elements = []
+        for index in range(len(selectors)):
+            elements.extend(matches.get((component_type, index), ()))
+        ui_components[component_type] = [
+            {
+                'html': lxml.html.tostring(element, encoding='unicode', with_tail=False),
+                'text': _element_text(element),
+                'attributes': _attributes(element),
+            }
+            for element in elements[:MAX_COMPONENTS]
+        ]
+
+    return {
+        'meta_tags': meta_tags,
+        'images': images,
+        'navigation_links': navigation_links,
+        'structure': {'title': title if title is not None else '', 'headings': headings},
+        'favicon': favicon or None,
+        'ui_components': ui_components,
+        'inline_styles': ''.join(style_parts),
+        # The browser has already serialized the DOM, so the source is used as-is
+        'html_sample': html_content[:HTML_SAMPLE_CHARS],
+        'used_selectors': _used_selectors(tags, classes_used, ids),
+    }
+
+
+def _used_selectors(tags, classes, ids) -> Dict[str, List[str]]:
+    return {'tags': sorted(tags), 'classes': sorted(classes), 'ids': sorted(ids)}
+
+
+def extract_with_soup(html_content: str, base_url: str) -> Dict[str, Any]:
+    """The same extraction with BeautifulSoup's html.parser, one search per field"""
+    soup = BeautifulSoup(html_content, 'html.parser')
+
+    # Extract meta tags
+    meta_tags = []
+    for meta in soup.find_all('meta'):
+        if meta.get('name') or meta.get('property'):
+            meta_tags.append({
+                'name': meta.get('name', meta.get('property')),
+                'content': meta.get('content')
+            })
+
+    # Extract images
+    images = []
+    for img in soup.find_all('img', src=True):
+        images.append({
+            'src': _absolute(img['src'], base_url),
+            'alt': img.get('alt', ''),
+            'width': img.get('width', ''),
+            'height': img.get('height', '')
+        })
+
+    # Extract links for navigation structure
+    navigation_links = []
+    for a in soup.find_all('a', href=True):
+        navigation_links.append({
+            'href': _absolute(a['href'], base_url),
+            'text': a.get_text(strip=True)
+        })
+
+    # Extract page structure
+    structure = {
+        'title': soup.title.string if soup.title else '',
+        'headings': {
+            'h1': [h.get_text(strip=True) for h in soup.find_all('h1')],
+            'h2': [h.get_text(strip=True) for h in soup.find_all('h2')],
+            'h3': [h.get_text(strip=True) for h in soup.find_all('h3')],
+        }
+    }
+
+    # Extract favicon
+    favicon = None
+    favicon_tags = soup.find_all('link', rel=lambda r: r and ('icon' in r.lower() or 'shortcut icon' in r.lower()))
+    if favicon_tags:
+        favicon_href = favicon_tags[0].get('href')
+        if favicon_href:
+            favicon = _absolute(favicon_href, base_url)
+
+    # Extract and categorize UI components
+    ui_components = {}
+    for component_type, selectors in COMPONENT_SELECTORS.items():
+        components = []
+        for selector in selectors:
+            try:
+                for element in soup.select(selector):
+                    components.append({
+                        'html': str(element),
+                        'text': element.get_text(strip=True),
+                        'attributes': {attr: element.get(attr) for attr in element.attrs}
+                    })
+            except Exception as e:
+                logger.warning(f"Error extracting {component_type} with selector {selector}: {e}")
+
+        ui_components[component_type] = components[:MAX_COMPONENTS]
+
+    # Extract CSS styles from style tags
+    inline_styles = ""
+    for style_tag in soup.find_all('style'):
+        inline_styles += style_tag.string or ""
+
+    tags, classes, ids = set(), set(), set()
+    for element in soup.find_all(True):
+        tags.add(element.name.lower())
+        classes.update(element.get('class') or ())
+        if element.get('id'):
+            ids.add(element['id'])
+
+    return {
+        'meta_tags': meta_tags,
+        'images': images,
+        'navigation_links': navigation_links,
+        'structure': structure,
+        'favicon': favicon,
+        'ui_components': ui_components,
+        'inline_styles': inline_styles,
+        'html_sample': html_content[:HTML_SAMPLE_CHARS],
+        'used_selectors': _used_selectors(tags, classes, ids),
+    }
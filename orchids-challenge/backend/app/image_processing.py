@@ -0,0 +1,109 @@
+"""
+Screenshot post-processing, run in the process worker pool.
+
+Functions here are module-level and take and return plain bytes / dicts so
+they can be pickled to worker processes.
+"""
+import os
+from io import BytesIO
+from typing import Any, Dict, List
+
+from PIL import Image
+
+# Largest image each model takes without the API downscaling it (Claude
+# resizes anything over 1568px on the long edge, Gemini over 3072px)
+IMAGE_PROFILES = {
+    "claude": {"max_width": 1568, "max_height": 1568},
+    "gemini": {"max_width": 3072, "max_height": 3072},
+}
+
+MEDIA_TYPES = {"jpeg": "image/jpeg", "webp": "image/webp"}
+
+
+def screenshot_options() -> Dict[str, Any]:
+    """Screenshot processing settings from the environment"""
+    image_format = os.getenv("SCREENSHOT_FORMAT", "jpeg").lower()
+    if image_format not in MEDIA_TYPES:
+        raise ValueError(f"Unsupported SCREENSHOT_FORMAT: {image_format}")
+    return {
+        "image_format": image_format,
+        "quality": int(os.getenv("SCREENSHOT_QUALITY", "80")),
+        # Split pages taller than 1.5 viewports into viewport-sized tiles
+        "tile": os.getenv("SCREENSHOT_TILING", "false").lower() in ("1", "true", "yes"),
+        "max_tiles": int(os.getenv("SCREENSHOT_MAX_TILES", "4")),
+    }
+
+
+def process_screenshot(
+    data: bytes,
+    viewport_height: int,
+    image_format: str = "jpeg",
+    quality: int = 80,
+    tile: bool = False,
+    max_tiles: int = 4,
+    profiles: Dict[str, Dict[str, int]] = IMAGE_PROFILES,
+) -> Dict[str, Any]:
+    """
+    Downscale and encode a full-page screenshot for every model profile.
+
+    Returns {"media_type", "source_size", "images": {profile: [{"data",
+    "width", "height"}]}}. Without tiling each profile gets one image of the
+    whole page fitted within its max dimensions; with tiling, tall pages are
+    cut into up to max_tiles viewport-high slices from the top, each fitted
+    within the profile's limits.
+    """
+    with Image.open(BytesIO(data)) as source:
+        width, height = source.size
+        tiled = tile and height > viewport_height * 1.5
+        slices = _slice_boxes(width, height, viewport_height, max_tiles) if tiled else [(0, 0, width, height)]
+
+        # JPEG can decode straight at 1/2, 1/4 or 1/8 scale, which is much
+        # cheaper than decoding in full and resizing; ask for the largest size
+        # any profile needs
+        scale = max(_fit_scale(box[2] - box[0], box[3] - box[1], profile)
+                    for box in slices for profile in profiles.values())
+        source.draft("RGB", (max(1, int(width * scale)), max(1, int(height * scale))))
+        image = source.convert("RGB")
+
+    # draft() may have shrunk the image; map the slice boxes onto it
+    factor = image.size[0] / width
+    images = {}
+    for name, profile in profiles.items():
+        encoded: List[Dict[str, Any]] = []
+        for left, top, right, bottom in slices:
+            box = (int(left * factor), int(top * factor), int(right * factor), int(bottom * factor))
+            part = image.crop(box) if tiled else image
+            target = _fit_size(part.size[0], part.size[1], profile)
+            if target != part.size:
+                part = part.resize(target, Image.LANCZOS)
+            encoded.append({"data": _encode(part, image_format, quality), "width": part.size[0], "height": part.size[1]})
+        images[name] = encoded
+
+    return {"media_type": MEDIA_TYPES[image_format], "source_size": [width, height], "images": images}
+
+
+def _slice_boxes(width: int, height: int, tile_height: int, max_tiles: int):
+    boxes = []
+    for top in range(0, height, tile_height):
+        if len(boxes) >= max_tiles:
+            break
+        boxes.append((0, top, width, min(top + tile_height, height)))
+    return boxes
+
+
+def _fit_scale(width: int, height: int, profile: Dict[str, int]) -> float:
+    return min(1.0, profile["max_width"] / width, profile["max_height"] / height)
+
+
+def _fit_size(width: int, height: int, profile: Dict[str, int]):
+    scale = _fit_scale(width, height, profile)
+    return max(1, int(width * scale)), max(1, int(height * scale))
+
+
+def _encode(image: Image.Image, image_format: str, quality: int) -> bytes:
+    buffer = BytesIO()
+    if image_format == "webp":
+        image.save(buffer, format="WEBP", quality=quality, method=4)
+    else:
+        image.save(buffer, format="JPEG", quality=quality, optimize=True)
+    return buffer.getvalue()
@@ -0,0 +1,196 @@
+"""
+Incremental re-scrapes of pages already in the scrape cache.
+
+A cached design context is served as-is while it is fresh. Once stale, the
+page's main document is revalidated with a conditional GET using the ETag /
+Last-Modified it was served with; a 304 keeps the cached context. When the
+page has changed, or sent no validators, it is loaded again and compared
+with the cached context: top-level layout sections are matched by their
+structure and the HTML by its tag and text tokens, so the job can report
+which regions changed. A page whose markup turns out identical keeps the
+cached context, and with it the cached clone.
+
+A page that did change is only partly reprocessed. Fingerprints of what
+each post-capture step reads are stored with the context. A screenshot
+whose pixels are unchanged keeps its processed images. Markup that only
+differs in content stripped by html_tokens (scripts, nonces, CSRF tokens)
+keeps the extracted structure and completed CSS rules. Computed styles and
+the layout come from the same in-page walk the diff itself needs, so they
+are always captured again.
+
+diff_page and markup_fingerprint are module-level so they can run in the
+process worker pool.
+"""
+import difflib
+import hashlib
+import json
+import re
+from typing import Any, Dict, List, Optional
+
+# Content of these elements changes on every load (nonces, tokens, inlined state)
+_VOLATILE_BLOCKS = re.compile(r'<(script|style|noscript|template)\b[^>]*>.*?</\1\s*>', re.I | re.S)
+# Hidden form fields and meta tags that carry per-request tokens
+_VOLATILE_TAGS = re.compile(
+    r'<(?:input\b[^>]*\btype=["\']?hidden\b|meta\b[^>]*\bname=["\'][^"\']*(?:csrf|token|nonce))[^>]*>', re.I
+)
+_VOLATILE_ATTRIBUTES = re.compile(
+    r'\s(?:nonce|integrity|data-reactid|data-n-head|[\w-]*csrf[\w-]*|[\w-]*token)=(?:"[^"]*"|\'[^\']*\'|[^\s"\'>]+)', re.I
+)
+_TOKEN = re.compile(r'<[^>]+>|[^<]+')
+_WHITESPACE = re.compile(r'\s+')
+
+
+def document_validators(headers: Optional[Dict[str, str]]) -> Dict[str, Optional[str]]:
+    """ETag and Last-Modified of a document response, from lower-cased headers"""
+    headers = headers or {}
+    return {"etag": headers.get("etag"), "last_modified": headers.get("last-modified")}
+
+
+def conditional_headers(validators: Optional[Dict[str, Optional[str]]]) -> Dict[str, str]:
+    """Request headers that make a GET conditional on the document having changed"""
+    headers = {}
+    if validators and validators.get("etag"):
+        headers["If-None-Match"] = validators["etag"]
+    if validators and validators.get("last_modified"):
+        headers["If-Modified-Since"] = validators["last_modified"]
+    return headers
+
+
+def _shape(node: Any) -> Any:
+    """A layout node without positions, which shift whenever anything above it changes"""
+    if isinstance(node, dict):
+        return {key: _shape(value) for key, value in node.items() if key != "position"}
+    if isinstance(node, list):
+        return [_shape(item) for item in node]
+    return node
+
+
+def _fingerprint(node: Any) -> str:
+    return hashlib.sha256(json.dumps(_shape(node), sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+def layout_sections(layout: Optional[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    The page's top-level regions: the first layout level with more than one
+    node, below any single wrapper elements around the whole page.
+    """
+    nodes = (layout or {}).get("structure") or []
+    while len(nodes) == 1 and nodes[0].get("children"):
+        nodes = nodes[0]["children"]
+    return nodes
+
+
+def _section_label(node: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "tag": node.get("tag"),
+        "id": node.get("id"),
+        "className": node.get("className"),
+        "position": node.get("position"),
+    }
+
+
+def diff_layouts(old_layout: Optional[Dict[str, Any]], new_layout: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Match the new page's sections to the cached ones.
+
+    Sections with an identical subtree are unchanged; of the rest, sections
+    with the same tag, id and class in the same order are changed, and the
+    others were added or removed. Returns {"sections", "removed"}, sections
+    listing every new section in page order with its status.
+    """
+    old_sections, new_sections = layout_sections(old_layout), layout_sections(new_layout)
+    old_prints = [_fingerprint(node) for node in old_sections]
+    new_prints = [_fingerprint(node) for node in new_sections]
+
+    # Align by subtree first, then pair what is left by element identity
+    statuses: List[Optional[str]] = [None] * len(new_sections)
+    matched_old = set()
+    for opcode, i1, i2, j1, j2 in difflib.SequenceMatcher(None, old_prints, new_prints, autojunk=False).get_opcodes():
+        if opcode == "equal":
+            for offset in range(i2 - i1):
+                statuses[j1 + offset] = "unchanged"
+                matched_old.add(i1 + offset)
+    identity = lambda node: (node.get("tag"), node.get("id"), node.get("className"))
+    remaining_old = [i for i in range(len(old_sections)) if i not in matched_old]
+    for j, node in enumerate(new_sections):
+        if statuses[j] is not None:
+            continue
+        match = next((i for i in remaining_old if identity(old_sections[i]) == identity(node)), None)
+        if match is not None:
+            remaining_old.remove(match)
+            statuses[j] = "changed"
+        else:
+            statuses[j] = "added"
+
+    return {
+        "sections": [
+            {"index": j, "status": status, "fingerprint": new_prints[j], **_section_label(node)}
+            for j, (status, node) in enumerate(zip(statuses, new_sections))
+        ],
+        "removed": [{"index": i, **_section_label(old_sections[i])} for i in remaining_old],
+    }
+
+
+def html_tokens(html: str) -> List[str]:
+    """Tags and text runs of a page, without content that differs on every load"""
+    html = _VOLATILE_ATTRIBUTES.sub("", _VOLATILE_TAGS.sub("", _VOLATILE_BLOCKS.sub("", html or "")))
+    tokens = []
+    for token in _TOKEN.findall(html):
+        token = _WHITESPACE.sub(" ", token).strip()
+        if token:
+            tokens.append(token)
+    return tokens
+
+
+def markup_fingerprint(html: str, page_url: str, css_rules: List[Dict[str, Any]],
+                       unreadable_stylesheets: List[Dict[str, Any]]) -> str:
+    """
+    Hash of everything HTML extraction and CSS completion read from a
+    capture, without the markup that differs on every load.
+    """
+    digest = hashlib.sha256()
+    for token in html_tokens(html):
+        digest.update(token.encode("utf-8"))
+        digest.update(b"\0")
+    digest.update(json.dumps([page_url, [rule.get("cssText") for rule in css_rules],
+                              [[sheet.get("href"), sheet.get("index"), sheet.get("media")] for sheet in unreadable_stylesheets]],
+                             sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def diff_html(old_html: str, new_html: str) -> Dict[str, Any]:
+    """How much of the page's markup changed: {changed, similarity, changed_blocks}"""
+    old_tokens, new_tokens = html_tokens(old_html), html_tokens(new_html)
+    if old_tokens == new_tokens:
+        return {"changed": False, "similarity": 1.0, "changed_blocks": 0}
+    matcher = difflib.SequenceMatcher(None, old_tokens, new_tokens, autojunk=False)
+    changed_blocks = sum(1 for opcode in matcher.get_opcodes() if opcode[0] != "equal")
+    return {"changed": True, "similarity": round(matcher.ratio(), 4), "changed_blocks": changed_blocks}
+
+
+def diff_page(old_layout: Optional[Dict[str, Any]], old_html: Optional[str],
+              new_layout: Optional[Dict[str, Any]], new_html: Optional[str]) -> Dict[str, Any]:
+    """
+    Structural diff of a re-scraped page against its cached design context.
+
+    Returns {"changed", "sections", "removed", "html", "summary"}; changed
+    is False only if every section and the markup are unchanged.
+    """
+    layout = diff_layouts(old_layout, new_layout)
+    html = diff_html(old_html or "", new_html or "")
+    summary = {status: 0 for status in ("unchanged", "changed", "added")}
+    for section in layout["sections"]:
+        summary[section["status"]] += 1
+    summary["removed"] = len(layout["removed"])
+    changed = html["changed"] or any(summary[status] for status in ("changed", "added", "removed"))
+    return {"changed": changed, **layout, "html": html, "summary": summary}
+
+
+def describe(changes: Dict[str, Any]) -> str:
+    """One-line summary of a page diff for logs and job messages"""
+    if not changes["changed"]:
+        return "page unchanged since it was last scraped"
+    summary = changes["summary"]
+    return (f"{summary['changed']} of {sum(summary[s] for s in ('unchanged', 'changed', 'added'))} sections changed, "
+            f"{summary['added']} added, {summary['removed']} removed, "
+            f"markup {changes['html']['similarity']:.1%} similar")
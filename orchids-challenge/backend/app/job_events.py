@@ -0,0 +1,111 @@
+import asyncio
+import bisect
+import logging
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class JobEventHub:
+    """
+    In-process fan-out of job progress to stream subscribers.
+
+    Each job running in this process has a small live record (status,
+    message and the generation channel it reads from) plus a change event
+    that subscribers wait on. Generated text is appended to channels rather
+    than jobs, so jobs coalesced onto the same generation stream the same
+    tokens. Records are dropped a little while after the job finishes;
+    subscribers fall back to the job store for jobs that are not live here.
+    """
+
+    def __init__(self, retention_seconds: float = 60):
+        self.retention_seconds = retention_seconds
+        # job_id -> {"status", "message", "channel", "changed"}
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        # channel -> list of text chunks, and the offset at which each chunk starts
+        self._channels: Dict[str, List[str]] = {}
+        self._chunk_offsets: Dict[str, List[int]] = {}
+        self._channel_lengths: Dict[str, int] = {}
+
+    def update(self, job_id: str, **fields):
+        """Record new status / message fields for a job and wake its subscribers"""
+        record = self._jobs.get(job_id)
+        if record is None:
+            record = self._jobs[job_id] = {"status": None, "message": None, "channel": None, "changed": asyncio.Event()}
+        for name in ("status", "message"):
+            if name in fields:
+                record[name] = fields[name]
+        self._notify(job_id)
+
+    def attach(self, job_id: str, channel: str):
+        """Stream the text of a generation channel as part of a job"""
+        if job_id not in self._jobs:
+            return
+        self._channels.setdefault(channel, [])
+        self._chunk_offsets.setdefault(channel, [])
+        self._channel_lengths.setdefault(channel, 0)
+        self._jobs[job_id]["channel"] = channel
+        self._notify(job_id)
+
+    def append(self, channel: str, text: str):
+        """Append generated text to a channel and wake every job reading it"""
+        if not text or channel not in self._channels:
+            return
+        self._channels[channel].append(text)
+        self._chunk_offsets[channel].append(self._channel_lengths[channel])
+        self._channel_lengths[channel] += len(text)
+        for job_id, record in self._jobs.items():
+            if record["channel"] == channel:
+                self._notify(job_id)
+
+    def channel_text(self, channel: str, offset: int = 0) -> str:
+        """Text of a channel from offset onwards"""
+        chunks = self._channels.get(channel)
+        if not chunks or self._channel_lengths[channel] <= offset:
+            return ""
+        # Only join the chunks at or after the offset
+        index = max(bisect.bisect_right(self._chunk_offsets[channel], offset) - 1, 0)
+        start = self._chunk_offsets[channel][index]
+        return "".join(chunks[index:])[offset - start:]
+
+    def snapshot(self, job_id: str, offset: int = 0) -> Optional[Dict[str, Any]]:
+        """Current status, message and text from offset onwards, or None if the job is not live here"""
+        record = self._jobs.get(job_id)
+        if record is None:
+            return None
+        text = self.channel_text(record["channel"], offset) if record["channel"] is not None else ""
+        return {"status": record["status"], "message": record["message"], "text": text}
+
+    def changed(self, job_id: str) -> Optional[asyncio.Event]:
+        """Event set on the next change to a live job; take it before reading a snapshot"""
+        record = self._jobs.get(job_id)
+        return record["changed"] if record is not None else None
+
+    def finish(self, job_id: str):
+        """Forget a finished job after the retention period"""
+        if job_id in self._jobs:
+            asyncio.get_running_loop().call_later(self.retention_seconds, self._drop, job_id)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "live_jobs": len(self._jobs),
+            "channels": len(self._channels),
+            "buffered_chars": sum(self._channel_lengths.values()),
+        }
+
+    def _notify(self, job_id: str):
+        # Swap in a fresh event so each change wakes the current waiters once
+        record = self._jobs[job_id]
+        record["changed"].set()
+        record["changed"] = asyncio.Event()
+
+    def _drop(self, job_id: str):
+        record = self._jobs.pop(job_id, None)
+        if record is None:
+            return
+        record["changed"].set()
+        channel = record["channel"]
+        if channel is not None and not any(r["channel"] == channel for r in self._jobs.values()):
+            self._channels.pop(channel, None)
+            self._chunk_offsets.pop(channel, None)
+            self._channel_lengths.pop(channel, None)
@@ -0,0 +1,360 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Job statuses that will not change any more
+TERMINAL_STATUSES = ("completed", "failed")
+
+
+class JobStore(ABC):
+    """
+    Interface for job state storage.
+
+    A job is a dict of fields (status, message, url, model, ...) keyed by
+    job id; its generated result is stored separately since it can be large.
+    Implementations must make update() safe against concurrent writers.
+
+    Jobs that are not finished are leased by the process running them. A
+    process renews its leases periodically; jobs whose lease expired (their
+    process died or restarted) can be claimed by another process and rerun.
+
+    Jobs created with a batch_id field belong to that batch. A batch record
+    only holds what the batch was created with; its progress is derived
+    from its jobs.
+    """
+
+    @abstractmethod
+    async def create(self, job_id: str, fields: Dict[str, Any], owner: Optional[str] = None, lease_seconds: float = 60):
+        ...
+
+    @abstractmethod
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    async def update(self, job_id: str, **fields) -> Optional[Dict[str, Any]]:
+        """Merge fields into the job and return the updated job"""
+
+    @abstractmethod
+    async def delete(self, job_id: str):
+        ...
+
+    @abstractmethod
+    async def list(self, status: Optional[str] = None, limit: int = 50, offset: int = 0) -> List[Dict[str, Any]]:
+        """Jobs ordered newest first, optionally filtered by status"""
+
+    @abstractmethod
+    async def count(self, status: Optional[str] = None) -> int:
+        ...
+
+    @abstractmethod
+    async def save_result(self, job_id: str, result: Dict[str, Any]):
+        ...
+
+    @abstractmethod
+    async def get_result(self, job_id: str) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    async def renew_leases(self, owner: str, lease_seconds: float):
+        """Extend the lease of every unfinished job owned by owner"""
+
+    @abstractmethod
+    async def claim_expired(self, owner: str, lease_seconds: float, limit: int = 10) -> List[Dict[str, Any]]:
+        """Take over unfinished jobs whose lease expired and return them"""
+
+    @abstractmethod
+    async def release(self, job_id: str):
+        """Expire a job's lease so any process can claim and rerun it"""
+
+    @abstractmethod
+    async def create_batch(self, batch_id: str, fields: Dict[str, Any]):
+        ...
+
+    @abstractmethod
+    async def get_batch(self, batch_id: str) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    async def list_batch_jobs(self, batch_id: str) -> List[Dict[str, Any]]:
+        """Jobs of a batch in the order they were created"""
+
+    async def close(self):
+        pass
+
+
+class MemoryJobStore(JobStore):
+    """Process-local store, for single-worker development setups"""
+
+    def __init__(self):
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._meta: Dict[str, Dict[str, Any]] = {}
+        self._results: Dict[str, Dict[str, Any]] = {}
+        self._batches: Dict[str, Dict[str, Any]] = {}
+        self._created = 0
+
+    async def create(self, job_id, fields, owner=None, lease_seconds=60):
+        self._jobs[job_id] = dict(fields)
+        # Sequence number keeps jobs created within one clock tick in order
+        self._created += 1
+        self._meta[job_id] = {"created_at": time.time(), "seq": self._created, "owner": owner, "lease_expires_at": time.time() + lease_seconds}
+
+    async def get(self, job_id):
+        job = self._jobs.get(job_id)
+        return dict(job) if job is not None else None
+
+    async def update(self, job_id, **fields):
+        if job_id not in self._jobs:
+            return None
+        self._jobs[job_id].update(fields)
+        return dict(self._jobs[job_id])
+
+    async def delete(self, job_id):
+        self._jobs.pop(job_id, None)
+        self._meta.pop(job_id, None)
+        self._results.pop(job_id, None)
+
+    async def list(self, status=None, limit=50, offset=0):
+        job_ids = sorted(self._jobs, key=lambda j: self._meta[j]["created_at"], reverse=True)
+        if status:
+            job_ids = [j for j in job_ids if self._jobs[j].get("status") == status]
+        return [{"job_id": j, **self._jobs[j]} for j in job_ids[offset:offset + limit]]
+
+    async def count(self, status=None):
+        if status:
+            return sum(1 for job in self._jobs.values() if job.get("status") == status)
+        return len(self._jobs)
+
+    async def save_result(self, job_id, result):
+        self._results[job_id] = dict(result)
+
+    async def get_result(self, job_id):
+        return self._results.get(job_id)
+
+    async def renew_leases(self, owner, lease_seconds):
+        for job_id, meta in self._meta.items():
+            if meta["owner"] == owner:
+                meta["lease_expires_at"] = time.time() + lease_seconds
+
+    async def claim_expired(self, owner, lease_seconds, limit=10):
+        # A single process never has anyone to take over from
+        return []
+
+    async def release(self, job_id):
+        if job_id in self._meta:
+            self._meta[job_id]["lease_expires_at"] = 0
+
+    async def create_batch(self, batch_id, fields):
+        self._batches[batch_id] = dict(fields)
+
+    async def get_batch(self, batch_id):
+        batch = self._batches.get(batch_id)
+        return dict(batch) if batch is not None else None
+
+    async def list_batch_jobs(self, batch_id):
+        job_ids = [j for j, job in self._jobs.items() if job.get("batch_id") == batch_id]
+        job_ids.sort(key=lambda j: self._meta[j]["seq"])
+        return [{"job_id": j, **self._jobs[j]} for j in job_ids]
+
+
+class SQLiteJobStore(JobStore):
+    """
+    SQLite-backed store shared by every worker process on a host.
+
+    The database runs in WAL mode so status polls never block on writers,
+    and read-modify-write updates run in BEGIN IMMEDIATE transactions so
+    concurrent processes cannot lose each other's changes. Jobs are indexed
+    by (status, created_at) for paginated listing.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("PRAGMA busy_timeout=30000")
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    job_id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL,
+                    owner TEXT,
+                    lease_expires_at REAL,
+                    data TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_jobs_status_created ON jobs (status, created_at);
+                CREATE INDEX IF NOT EXISTS idx_jobs_created ON jobs (created_at);
+                CREATE INDEX IF NOT EXISTS idx_jobs_owner ON jobs (owner);
+                CREATE TABLE IF NOT EXISTS job_results (
+                    job_id TEXT PRIMARY KEY,
+                    data TEXT NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS batches (
+                    batch_id TEXT PRIMARY KEY,
+                    created_at REAL NOT NULL,
+                    data TEXT NOT NULL
+                );
+            """)
+            # Databases created before batches existed lack the column
+            columns = [row["name"] for row in self._conn.execute("PRAGMA table_info(jobs)")]
+            if "batch_id" not in columns:
+                self._conn.execute("ALTER TABLE jobs ADD COLUMN batch_id TEXT")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_batch ON jobs (batch_id)")
+
+    async def create(self, job_id, fields, owner=None, lease_seconds=60):
+        now = time.time()
+        await self._run(
+            "INSERT INTO jobs (job_id, status, created_at, updated_at, owner, lease_expires_at, batch_id, data) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (job_id, fields.get("status", "pending"), now, now, owner, now + lease_seconds,
+             fields.get("batch_id"), json.dumps(fields)),
+        )
+
+    async def get(self, job_id):
+        rows = await self._run("SELECT data FROM jobs WHERE job_id = ?", (job_id,), fetch=True)
+        return json.loads(rows[0]["data"]) if rows else None
+
+    async def update(self, job_id, **fields):
+        return await asyncio.to_thread(self._update, job_id, fields)
+
+    def _update(self, job_id, fields):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT data FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+                if row is None:
+                    self._conn.execute("ROLLBACK")
+                    return None
+                data = json.loads(row["data"])
+                data.update(fields)
+                self._conn.execute(
+                    "UPDATE jobs SET status = ?, updated_at = ?, data = ? WHERE job_id = ?",
+                    (data.get("status", "pending"), time.time(), json.dumps(data), job_id),
+                )
+                self._conn.execute("COMMIT")
+                return data
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    async def delete(self, job_id):
+        await self._run("DELETE FROM jobs WHERE job_id = ?", (job_id,))
+        await self._run("DELETE FROM job_results WHERE job_id = ?", (job_id,))
+
+    async def list(self, status=None, limit=50, offset=0):
+        if status:
+            rows = await self._run(
+                "SELECT job_id, data FROM jobs WHERE status = ? ORDER BY created_at DESC LIMIT ? OFFSET ?",
+                (status, limit, offset), fetch=True,
+            )
+        else:
+            rows = await self._run(
+                "SELECT job_id, data FROM jobs ORDER BY created_at DESC LIMIT ? OFFSET ?",
+                (limit, offset), fetch=True,
+            )
+        return [{"job_id": row["job_id"], **json.loads(row["data"])} for row in rows]
+
+    async def count(self, status=None):
+        if status:
+            rows = await self._run("SELECT COUNT(*) AS n FROM jobs WHERE status = ?", (status,), fetch=True)
+        else:
+            rows = await self._run("SELECT COUNT(*) AS n FROM jobs", (), fetch=True)
+        return rows[0]["n"]
+
+    async def save_result(self, job_id, result):
+        await self._run(
+            "INSERT OR REPLACE INTO job_results (job_id, data) VALUES (?, ?)",
+            (job_id, json.dumps(result)),
+        )
+
+    async def get_result(self, job_id):
+        rows = await self._run("SELECT data FROM job_results WHERE job_id = ?", (job_id,), fetch=True)
+        return json.loads(rows[0]["data"]) if rows else None
+
+    async def renew_leases(self, owner, lease_seconds):
+        placeholders = ", ".join("?" for _ in TERMINAL_STATUSES)
+        await self._run(
+            f"UPDATE jobs SET lease_expires_at = ? WHERE owner = ? AND status NOT IN ({placeholders})",
+            (time.time() + lease_seconds, owner, *TERMINAL_STATUSES),
+        )
+
+    async def claim_expired(self, owner, lease_seconds, limit=10):
+        return await asyncio.to_thread(self._claim_expired, owner, lease_seconds, limit)
+
+    def _claim_expired(self, owner, lease_seconds, limit):
+        now = time.time()
+        placeholders = ", ".join("?" for _ in TERMINAL_STATUSES)
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._conn.execute(
+                    f"SELECT job_id, data FROM jobs WHERE status NOT IN ({placeholders}) "
+                    "AND lease_expires_at < ? ORDER BY created_at LIMIT ?",
+                    (*TERMINAL_STATUSES, now, limit),
+                ).fetchall()
+                for row in rows:
+                    self._conn.execute(
+                        "UPDATE jobs SET owner = ?, lease_expires_at = ? WHERE job_id = ?",
+                        (owner, now + lease_seconds, row["job_id"]),
+                    )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return [{"job_id": row["job_id"], **json.loads(row["data"])} for row in rows]
+
+    async def release(self, job_id):
+        await self._run("UPDATE jobs SET lease_expires_at = 0 WHERE job_id = ?", (job_id,))
+
+    async def create_batch(self, batch_id, fields):
+        await self._run(
+            "INSERT INTO batches (batch_id, created_at, data) VALUES (?, ?, ?)",
+            (batch_id, time.time(), json.dumps(fields)),
+        )
+
+    async def get_batch(self, batch_id):
+        rows = await self._run("SELECT data FROM batches WHERE batch_id = ?", (batch_id,), fetch=True)
+        return json.loads(rows[0]["data"]) if rows else None
+
+    async def list_batch_jobs(self, batch_id):
+        rows = await self._run(
+            "SELECT job_id, data FROM jobs WHERE batch_id = ? ORDER BY created_at, rowid",
+            (batch_id,), fetch=True,
+        )
+        return [{"job_id": row["job_id"], **json.loads(row["data"])} for row in rows]
+
+    async def close(self):
+        with self._lock:
+            self._conn.close()
+
+    async def _run(self, sql, params=(), fetch=False):
+        def _execute():
+            with self._lock:
+                cursor = self._conn.execute(sql, params)
+                return cursor.fetchall() if fetch else None
+        return await asyncio.to_thread(_execute)
+
+
+def create_job_store(backend: Optional[str] = None) -> JobStore:
+    """Build the job store selected by JOB_STORE ("sqlite" or "memory")"""
+    backend = backend or os.getenv("JOB_STORE", "sqlite")
+    if backend == "memory":
+        return MemoryJobStore()
+    if backend == "sqlite":
+        return SQLiteJobStore(os.getenv("JOB_STORE_PATH", os.path.join("jobs", "jobs.db")))
+    raise ValueError(f"Unsupported job store: {backend}")
@@ -1,62 +1,288 @@
 import os
 import json
 import logging
-from typing import Dict, Any
+from typing import Dict, Any, Awaitable, Callable, Optional
+import hashlib
 import httpx
 import asyncio
+import time
+
+from .cache import TieredCache, cache_key
+from .context_compaction import SITE_CONTEXT_SHARE, compact_context, compact_site_context, model_budget
+from .metrics import record_tokens
+from . import tracing
+from .provider_client import ProviderClient
+from .provider_routing import ProviderRouter
+from .sectioned_generation import (
+    DOCUMENT_TAIL, document_head, extract_fragment, plan_regions, region_contexts, region_instructions,
+    region_screenshots, resolve_mode, sectioned_settings, style_preamble,
+)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Bump when the prompts change so cached clones from older prompts are not reused
+PROMPT_VERSION = "2"
+
+# Provider model behind each model name
+MODEL_IDS = {
+    "claude": "claude-3-sonnet-20240229",
+    "gemini": "gemini-2.0-flash",
+}
+
+# Model name reported with each clone
+MODEL_USED = {
+    "claude": "claude-3-sonnet",
+    "gemini": "gemini-2.0-flash",
+}
+
+# Instructions for generating one region of a page in sectioned mode
+REGION_SYSTEM_PROMPT = """You are an expert web designer and developer specializing in pixel-perfect website cloning. You are cloning ONE REGION of a website; other regions of the same page are cloned separately and assembled into a single document under a shared stylesheet.
+
+            Follow these precise guidelines:
+            1. Output only the markup for your region, as instructed at the end of the request, with no <!DOCTYPE>, <html>, <head> or <body>.
+            2. Implement a pixel-perfect layout of the region that EXACTLY matches the original - pay special attention to spacing, alignment, and component positioning.
+            3. Use the EXACT colors, fonts, borders, shadows, and visual effects as the original, through the shared stylesheet's custom properties where they fit.
+            4. Copy the exact text content where available.
+            5. Scope every CSS rule you write to your region so it cannot affect the others.
+            
+            Start directly with the HTML code without any introduction or explanation."""
+
+# Leads the context shared by every page of a crawled site, sent ahead of each page's own context
+SITE_CONTEXT_PROMPT = """This page is one of several pages of the same website that are cloned separately. The design context below is shared by all of them: its css_rules apply on every page, so include the ones this page uses in its <style>, and its components are layout subtrees (headers, footers, ...) that the page's own layout references as {"shared": id} at the given position.
+
+Shared site context:
+"""
+
 class WebsiteCloner:
-    def __init__(self):
+    def __init__(self, blob_store=None, http_client=None, cache_dir=".cache", router=None):
         # Check for environment variables for API keys
         self.anthropic_api_key = os.getenv("ANTHROPIC_API_KEY")
         self.google_api_key = os.getenv("GOOGLE_API_KEY")
         self.default_model = "claude" # can be "claude" or "gemini"
+        # Overridable to point at a proxy or a local stand-in (see benchmarks/mock_llm.py)
+        self.anthropic_base_url = os.getenv("ANTHROPIC_BASE_URL", "https://api.anthropic.com").rstrip("/")
+        self.gemini_base_url = os.getenv("GEMINI_BASE_URL", "https://generativelanguage.googleapis.com").rstrip("/")
+        # Blob store holding screenshots referenced by design contexts
+        self.blob_store = blob_store
+        # Pooled client shared by every provider call
+        self.http_client = http_client or ProviderClient()
+        # Picks the provider for each generation and falls back between them
+        self.router = router or ProviderRouter()
+        # Generated clones, keyed on the prompt inputs they were generated from
+        self.result_cache = TieredCache(
+            os.path.join(cache_dir, "clones"),
+            default_ttl=float(os.getenv("CLONE_CACHE_TTL_SECONDS", "86400")),
+            max_bytes=int(os.getenv("CLONE_CACHE_MAX_BYTES", str(256 * 1024 * 1024))),
+            memory_max_bytes=int(os.getenv("CLONE_CACHE_MEMORY_MAX_BYTES", str(16 * 1024 * 1024))),
+        )
         
-    async def generate_clone(self, design_context: Dict[Any, Any], model: str = None):
+    async def generate_clone(
+        self,
+        design_context: Dict[Any, Any],
+        model: str = None,
+        on_text: Optional[Callable[[str], Awaitable[None]]] = None,
+        force_refresh: bool = False,
+        mode: Optional[str] = None,
+        site: Optional[Dict[str, Any]] = None
+    ):
         """
-        Generate an HTML clone based on the provided design context
+        Generate an HTML clone based on the provided design context.
+        
+        The completion is streamed from the provider; on_text is awaited with
+        each piece of generated text as it arrives. Clones generated from
+        identical prompt inputs are served from the result cache unless
+        force_refresh is set. The result's "cache_hit" says which happened.
+        
+        mode is "single" (GENERATION_MODE by default), "sectioned" or
+        "auto"; sectioned clones are generated region by region, see
+        sectioned_generation. The result's "generation" says which was used.
+        
+        site is set for a page of a crawled site: {"shared", "page"}, the
+        context shared by all its pages and this page's own css_rules and
+        layout (see crawler.deduplicate_site). Single-call clones then send
+        the shared part as a cacheable prompt prefix, identical for every
+        page, followed by only the page's own part. Sectioned clones use the
+        page's full context.
+        
+        Without a model, the provider is chosen by the router from those
+        with an API key; either way a failing provider falls back to the
+        others, see provider_routing. The result's "routing" lists the
+        attempts.
         """
-        model = model or self.default_model
+        if model is not None:
+            self._check_provider(model)
+            preferred, providers = model, [model] + [p for p in self.configured_providers() if p != model]
+        else:
+            providers = self.configured_providers()
+            if not providers:
+                self._check_provider(self.default_model)
+            preferred = None
+        providers = self.router.rank(providers, preferred)
+        
+        mode = resolve_mode(mode, design_context)
+        shared = None
+        if site is not None and mode == "single":
+            design_context = {**design_context, **site["page"]}
+            shared = site["shared"]
+        prepared = {}
+        
+        async def prepare(provider):
+            if provider not in prepared:
+                # Compacting the context is CPU-bound, so keep it off the event loop
+                prepared[provider] = await asyncio.to_thread(self._prepare_prompt_inputs, design_context, provider, mode, shared)
+            return prepared[provider]
+        
+        if not force_refresh:
+            # Any provider's clone will do unless one was asked for
+            for provider in providers if model is None else providers[:1]:
+                context_json, site_json, compaction, result_key = await prepare(provider)
+                cached = await self.result_cache.get(result_key)
+                if cached is not None:
+                    logger.info(f"Serving {provider} clone of {design_context.get('url')} from the result cache")
+                    if on_text is not None:
+                        await on_text(cached["generated_html"])
+                    return {"compaction": compaction, "generation": {"mode": mode}, **cached,
+                            "cache_hit": True, "usage": {"input_tokens": 0, "output_tokens": 0}}
+        
+        generators = {"claude": self._generate_with_claude, "gemini": self._generate_with_gemini}
         
+        async def attempt(provider, forward):
+            context_json, site_json, compaction, result_key = await prepare(provider)
+            # Generation pops the screenshots off the context, so each attempt gets its own copy
+            context = dict(design_context)
+            with tracing.span(f"generate.{mode}", model=provider, url=design_context.get('url'), **{
+                "context.chars": len(context_json),
+                "context.estimated_tokens": compaction["estimated_tokens"],
+            }) as generate_span:
+                if mode == "sectioned":
+                    result = await self._generate_sectioned(context, provider, forward)
+                else:
+                    result = {**await generators[provider](context, context_json, forward, site_json), "generation": {"mode": mode}}
+                tracing.set_attributes(generate_span, **{
+                    "html.chars": len(result["generated_html"]),
+                    "tokens.input": result["usage"]["input_tokens"],
+                    "tokens.output": result["usage"]["output_tokens"],
+                })
+            return result, compaction, result_key
+        
+        # Sectioned clones emit their head before any provider call, so there is no first token to hedge on
+        (result, compaction, result_key), routing = await self.router.run(
+            providers, attempt, on_text, hedge=None if mode == "single" else False
+        )
+        self.result_cache.set_nowait(result_key, result)
+        return {"compaction": compaction, **result, "cache_hit": False, "routing": routing}
+    
+    def configured_providers(self):
+        """Providers with an API key, the default first"""
+        keys = {"claude": self.anthropic_api_key, "gemini": self.google_api_key}
+        return [p for p in sorted(keys, key=lambda p: p != self.default_model) if keys[p]]
+    
+    def _check_provider(self, model):
+        """Raise ValueError if a model is unknown or has no API key"""
         if model == "claude":
             if not self.anthropic_api_key:
                 raise ValueError("Missing Anthropic API key. Set ANTHROPIC_API_KEY environment variable.")
-            return await self._generate_with_claude(design_context)
         elif model == "gemini":
             if not self.google_api_key:
                 raise ValueError("Missing Google API key. Set GOOGLE_API_KEY environment variable.")
-            return await self._generate_with_gemini(design_context)
         else:
             raise ValueError(f"Unsupported model: {model}")
     
-    async def _generate_with_claude(self, design_context):
+    async def _generate_sectioned(self, design_context, model, on_text=None):
+        """
+        Generate the page's regions concurrently and stitch them into one document.
+        
+        The document head and shared style preamble are emitted at once;
+        each region's fragment is emitted as soon as it and every region
+        above it are done, so the streamed text is always a prefix of the
+        final document.
+        """
+        try:
+            settings = sectioned_settings()
+            regions = plan_regions(design_context, settings["max_regions"])
+            preamble = style_preamble(design_context, settings["preamble_max_chars"])
+            simplified = self._simplify_context(design_context)
+            contexts = await asyncio.to_thread(region_contexts, simplified, regions)
+            screenshots = await self._load_screenshots(design_context, model)
+            design_context.pop('html_sample', None)
+            layout = design_context.get('layout') or {}
+            viewport_height = layout.get('height') or 1080
+            logger.info(f"Generating {design_context.get('url')} in {len(regions)} regions: {[r['name'] for r in regions]}")
+            
+            async def generate_region(region, context):
+                with tracing.span("generate.region", region=region["name"], role=region["role"], model=model) as region_span:
+                    started = time.perf_counter()
+                    shots = region_screenshots(screenshots, region, viewport_height)
+                    context_json, compaction = await asyncio.to_thread(compact_context, context, model, max(len(shots), 1))
+                    prompt = ("Please clone one region of the following website. Here's the design context extracted "
+                              f"from the website for that region:\n\n{context_json}{self._breakpoint_note(design_context)}")
+                    if shots:
+                        prompt += ("\n\nI've also included a screenshot of the website. This is the most important reference; "
+                                   "replicate the part of it that belongs to this region precisely.")
+                        prompt += self._tiling_note(shots)
+                    prompt += region_instructions(region, regions, preamble, layout.get('width') or 1920)
+                    if model == "claude":
+                        text, usage = await self._stream_claude(REGION_SYSTEM_PROMPT, prompt, shots)
+                    else:
+                        text, usage = await self._stream_gemini(f"{REGION_SYSTEM_PROMPT}\n\n{prompt}", shots)
+                    fragment = extract_fragment(text)
+                    report = {
+                        "name": region["name"],
+                        "role": region["role"],
+                        "top": region["top"],
+                        "bottom": region["bottom"],
+                        "chars": len(fragment),
+                        "output_tokens": usage["output_tokens"],
+                        "duration_ms": round((time.perf_counter() - started) * 1000, 2),
+                    }
+                    tracing.set_attributes(region_span, **{"screenshots": len(shots), "context.chars": len(context_json),
+                                                           "fragment.chars": len(fragment), "tokens.output": usage["output_tokens"]})
+                    return fragment, usage, compaction, report
+            
+            tasks = [asyncio.create_task(generate_region(region, context)) for region, context in zip(regions, contexts)]
+            parts, outcomes = [], []
+            try:
+                await self._emit_text(document_head(simplified, preamble), parts, on_text)
+                for task in tasks:
+                    outcomes.append(await task)
+                    await self._emit_text(outcomes[-1][0] + "\n", parts, on_text)
+                await self._emit_text(DOCUMENT_TAIL, parts, on_text)
+            except BaseException:
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                raise
+            
+            compactions = {report["name"]: compaction for _, _, compaction, report in outcomes}
+            return {
+                "generated_html": "".join(parts),
+                "model_used": MODEL_USED[model],
+                "usage": {
+                    key: sum(usage[key] or 0 for _, usage, _, _ in outcomes)
+                    for key in ("input_tokens", "output_tokens")
+                },
+                "compaction": {
+                    "budget_tokens": sum(c["budget_tokens"] for c in compactions.values()),
+                    "estimated_tokens": sum(c["estimated_tokens"] for c in compactions.values()),
+                    "truncated": {name: c["truncated"] for name, c in compactions.items() if c["truncated"]},
+                    "dropped": sorted({field for c in compactions.values() for field in c["dropped"]}),
+                    "regions": compactions,
+                },
+                "generation": {"mode": "sectioned", "regions": [report for _, _, _, report in outcomes]},
+            }
+        except Exception as e:
+            logger.error(f"Error generating sectioned clone with {model}: {str(e)}")
+            raise Exception(f"Failed to generate sectioned HTML clone with {model}: {str(e)}")
+    
+    async def _generate_with_claude(self, design_context, context_json, on_text=None, site_json=None):
         """Use Claude API to generate HTML clone"""
         try:
             # Prepare design context for the prompt
-            screenshot_base64 = design_context.pop('screenshot', None)
+            screenshots = await self._load_screenshots(design_context, "claude")
             html_sample = design_context.pop('html_sample', None)
             
-            # Enhanced structure with more detailed information
-            simplified_context = {
-                'url': design_context['url'],
-                'base_domain': design_context['base_domain'],
-                'title': design_context['structure']['title'],
-                'headings': design_context['structure']['headings'],
-                'colors': design_context['colors'][:30] if len(design_context['colors']) > 30 else design_context['colors'],
-                'fonts': design_context['fonts'],
-                'layout': design_context['layout'],
-                'meta_tags': design_context['meta_tags'],
-                'navigation_links': design_context['navigation_links'],
-                'ui_components': design_context.get('ui_components', {}),
-                'css_rules': design_context.get('css_rules', [])[:50] if design_context.get('css_rules') and len(design_context['css_rules']) > 50 else design_context.get('css_rules', []),
-                'inline_styles': design_context.get('inline_styles', ''),
-                'favicon': design_context.get('favicon')
-            }
-            
             system_prompt = """You are an expert web designer and developer specializing in pixel-perfect website cloning. Your task is to create an EXACT clone of a website based on the detailed design context provided. Your clone should be visually indistinguishable from the original website.
 
             Follow these precise guidelines:
@@ -73,96 +299,34 @@ class WebsiteCloner:
             
             Your output must be production-ready, valid HTML that can be viewed directly in a browser and looks EXACTLY like the original website. Start directly with the HTML code without any introduction or explanation."""
             
-            # Prepare the API request
-            url = "https://api.anthropic.com/v1/messages"
-            headers = {
-                "x-api-key": self.anthropic_api_key,
-                "anthropic-version": "2023-06-01",
-                "content-type": "application/json"
-            }
+            user_text = f"Please clone the following website and create HTML code that closely resembles its design. Here's the design context extracted from the website:\n\n{context_json}{self._breakpoint_note(design_context)}"
+            if screenshots:
+                # Add instructions for the image
+                user_text += "\n\nI've also included a screenshot of the website. This is the most important reference. You MUST use this screenshot as your primary guide to ensure your clone looks exactly like the original website. Analyze every visual detail in this image and replicate it precisely, including all layout elements, spacing, colors, fonts, and component design."
+                user_text += self._tiling_note(screenshots)
             
-            payload = {
-                "model": "claude-3-sonnet-20240229",
-                "max_tokens": 4000,
-                "messages": [
-                    {
-                        "role": "system",
-                        "content": system_prompt
-                    },
-                    {
-                        "role": "user",
-                        "content": [
-                            {
-                                "type": "text",
-                                "text": f"Please clone the following website and create HTML code that closely resembles its design. Here's the design context extracted from the website:\n\n{json.dumps(simplified_context, indent=2)}"
-                            }
-                        ]
-                    }
-                ]
-            }
+            prefix = SITE_CONTEXT_PROMPT + site_json if site_json else None
+            generated_html, usage = await self._stream_claude(system_prompt, user_text, screenshots, on_text, prefix=prefix)
             
-            # Add screenshot if available
-            if screenshot_base64:
-                payload["messages"][1]["content"].append({
-                    "type": "image",
-                    "source": {
-                        "type": "base64",
-                        "media_type": "image/jpeg",
-                        "data": screenshot_base64
-                    }
-                })
-                
-                # Add instructions for the image
-                payload["messages"][1]["content"][0]["text"] += "\n\nI've also included a screenshot of the website. This is the most important reference. You MUST use this screenshot as your primary guide to ensure your clone looks exactly like the original website. Analyze every visual detail in this image and replicate it precisely, including all layout elements, spacing, colors, fonts, and component design."
+            # Extract just the HTML code from the response
+            html_code = self._extract_html_code(generated_html)
             
-            async with httpx.AsyncClient(timeout=120.0) as client:
-                response = await client.post(url, json=payload, headers=headers)
-                response_data = response.json()
-                
-                if response.status_code != 200:
-                    logger.error(f"Error from Claude API: {response_data}")
-                    raise Exception(f"Failed to generate HTML clone: {response_data.get('error', {}).get('message', 'Unknown error')}")
-                
-                generated_html = response_data["content"][0]["text"]
-                
-                # Extract just the HTML code from the response
-                html_code = self._extract_html_code(generated_html)
-                
-                return {
-                    "generated_html": html_code,
-                    "model_used": "claude-3-sonnet",
-                }
+            return {
+                "generated_html": html_code,
+                "model_used": MODEL_USED["claude"],
+                "usage": usage,
+            }
         except Exception as e:
             logger.error(f"Error generating with Claude: {str(e)}")
             raise Exception(f"Failed to generate HTML clone with Claude: {str(e)}")
     
-    async def _generate_with_gemini(self, design_context):
+    async def _generate_with_gemini(self, design_context, context_json, on_text=None, site_json=None):
         """Use Gemini API to generate HTML clone"""
         try:
             # Prepare design context for the prompt
-            screenshot_base64 = design_context.pop('screenshot', None)
+            screenshots = await self._load_screenshots(design_context, "gemini")
             html_sample = design_context.pop('html_sample', None)
             
-            # Enhanced structure with more detailed information
-            simplified_context = {
-                'url': design_context['url'],
-                'base_domain': design_context['base_domain'],
-                'title': design_context['structure']['title'],
-                'headings': design_context['structure']['headings'],
-                'colors': design_context['colors'][:30] if len(design_context['colors']) > 30 else design_context['colors'],
-                'fonts': design_context['fonts'],
-                'layout': design_context['layout'],
-                'meta_tags': design_context['meta_tags'],
-                'navigation_links': design_context['navigation_links'],
-                'ui_components': design_context.get('ui_components', {}),
-                'css_rules': design_context.get('css_rules', [])[:50] if design_context.get('css_rules') and len(design_context['css_rules']) > 50 else design_context.get('css_rules', []),
-                'inline_styles': design_context.get('inline_styles', ''),
-                'favicon': design_context.get('favicon')
-            }
-            
-            # Prepare the API request
-            url = "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent"
-            
             prompt = """You are an expert web designer and developer specializing in pixel-perfect website cloning. Your task is to create an EXACT clone of a website based on the detailed design context provided. Your clone should be visually indistinguishable from the original website.
 
             Follow these precise guidelines:
@@ -183,64 +347,311 @@ class WebsiteCloner:
             
             """
             
-            prompt += json.dumps(simplified_context, indent=2)
+            if site_json:
+                # Ahead of the page's own context, so every page of the site shares the prompt prefix
+                prompt += f"{SITE_CONTEXT_PROMPT}{site_json}\n\nThe page's own design context:\n\n"
+            prompt += context_json
+            prompt += self._breakpoint_note(design_context)
             
             # Add screenshot reference if available
-            if screenshot_base64:
+            if screenshots:
                 prompt += "\n\nI've also included a screenshot of the website as an image. This is the most important reference. You MUST use this screenshot as your primary guide to ensure your clone looks exactly like the original website. Analyze every visual detail in this image and replicate it precisely, including all layout elements, spacing, colors, fonts, and component design."
+                prompt += self._tiling_note(screenshots)
             
-            payload = {
-                "contents": [
-                    {
-                        "role": "user",
-                        "parts": [
-                            {"text": prompt}
-                        ]
-                    }
-                ],
-                "generationConfig": {
-                    "temperature": 0.2,
-                    "maxOutputTokens": 8192,
-                    "topP": 0.95,
-                    "topK": 64
-                }
-            }
+            generated_text, usage = await self._stream_gemini(prompt, screenshots, on_text)
             
-            # Add screenshot if available
-            if screenshot_base64:
-                payload["contents"][0]["parts"].append({
-                    "inline_data": {
-                        "mime_type": "image/jpeg",
-                        "data": screenshot_base64
-                    }
-                })
+            # Extract just the HTML code from the response
+            html_code = self._extract_html_code(generated_text)
             
-            headers = {
-                "Content-Type": "application/json",
-                "x-goog-api-key": self.google_api_key
+            return {
+                "generated_html": html_code,
+                "model_used": MODEL_USED["gemini"],
+                "usage": usage,
             }
-            
-            async with httpx.AsyncClient(timeout=120.0) as client:
-                response = await client.post(f"{url}?key={self.google_api_key}", json=payload, headers=headers)
-                response_data = response.json()
-                
-                if "error" in response_data:
-                    logger.error(f"Error from Gemini API: {response_data}")
-                    raise Exception(f"Failed to generate HTML clone: {response_data.get('error', {}).get('message', 'Unknown error')}")
-                
-                generated_text = response_data["candidates"][0]["content"]["parts"][0]["text"]
-                
-                # Extract just the HTML code from the response
-                html_code = self._extract_html_code(generated_text)
-                
-                return {
-                    "generated_html": html_code,
-                    "model_used": "gemini-2.0-flash",
-                }
         except Exception as e:
             logger.error(f"Error generating with Gemini: {str(e)}")
             raise Exception(f"Failed to generate HTML clone with Gemini: {str(e)}")
     
+    async def _stream_claude(self, system_prompt, user_text, screenshots, on_text=None, prefix=None):
+        """
+        Stream a Claude completion for a prompt and screenshots; returns (text, usage).
+        
+        prefix, when given, is sent before user_text as its own block marked
+        for prompt caching, so requests sharing it read it from the cache.
+        """
+        url = f"{self.anthropic_base_url}/v1/messages"
+        headers = {
+            "x-api-key": self.anthropic_api_key,
+            "anthropic-version": "2023-06-01",
+            "content-type": "application/json"
+        }
+        
+        payload = {
+            "model": MODEL_IDS["claude"],
+            "max_tokens": model_budget("claude")["max_output_tokens"],
+            "stream": True,
+            "messages": [
+                {
+                    "role": "system",
+                    "content": system_prompt
+                },
+                {
+                    "role": "user",
+                    "content": [
+                        {
+                            "type": "text",
+                            "text": user_text
+                        }
+                    ]
+                }
+            ]
+        }
+        
+        if prefix:
+            payload["messages"][1]["content"].insert(0, {
+                "type": "text",
+                "text": prefix,
+                "cache_control": {"type": "ephemeral"}
+            })
+        
+        # Add screenshots if available
+        for screenshot_base64, screenshot_media_type in screenshots:
+            payload["messages"][1]["content"].append({
+                "type": "image",
+                "source": {
+                    "type": "base64",
+                    "media_type": screenshot_media_type,
+                    "data": screenshot_base64
+                }
+            })
+        
+        generated_parts = []
+        usage = {"input_tokens": None, "output_tokens": None, "cache_read_input_tokens": None}
+        with tracing.span("llm.stream", model="claude", **{
+            "prompt.chars": len(system_prompt) + len(prefix or "") + len(user_text),
+            "images": len(screenshots),
+            "images.base64_chars": sum(len(data) for data, _ in screenshots),
+        }) as stream_span:
+            async with self.http_client.stream("claude", "POST", url, json=payload, headers=headers) as response:
+                if response.status_code != 200:
+                    response_data = json.loads(await response.aread())
+                    logger.error(f"Error from Claude API: {response_data}")
+                    raise Exception(f"Failed to generate HTML clone: {response_data.get('error', {}).get('message', 'Unknown error')}")
+            
+                async for event in self._iter_sse_events(response):
+                    if event.get("type") == "error":
+                        logger.error(f"Error from Claude API: {event}")
+                        raise Exception(f"Failed to generate HTML clone: {event.get('error', {}).get('message', 'Unknown error')}")
+                    if event.get("type") == "content_block_delta" and event["delta"].get("type") == "text_delta":
+                        if not generated_parts:
+                            stream_span.add_event("first_token")
+                        await self._emit_text(event["delta"]["text"], generated_parts, on_text)
+                    elif event.get("type") == "message_start":
+                        usage["input_tokens"] = event["message"].get("usage", {}).get("input_tokens")
+                        usage["cache_read_input_tokens"] = event["message"].get("usage", {}).get("cache_read_input_tokens")
+                    elif event.get("type") == "message_delta":
+                        usage["output_tokens"] = event.get("usage", {}).get("output_tokens")
+            tracing.set_attributes(stream_span, **{"output.chars": sum(len(part) for part in generated_parts),
+                                                   "tokens.input": usage["input_tokens"],
+                                                   "tokens.output": usage["output_tokens"]})
+        
+        record_tokens("claude", usage)
+        return "".join(generated_parts), usage
+    
+    async def _stream_gemini(self, prompt, screenshots, on_text=None):
+        """Stream a Gemini completion for a prompt and screenshots; returns (text, usage)"""
+        url = f"{self.gemini_base_url}/v1beta/models/{MODEL_IDS['gemini']}:streamGenerateContent"
+        payload = {
+            "contents": [
+                {
+                    "role": "user",
+                    "parts": [
+                        {"text": prompt}
+                    ]
+                }
+            ],
+            "generationConfig": {
+                "temperature": 0.2,
+                "maxOutputTokens": model_budget("gemini")["max_output_tokens"],
+                "topP": 0.95,
+                "topK": 64
+            }
+        }
+        
+        # Add screenshots if available
+        for screenshot_base64, screenshot_media_type in screenshots:
+            payload["contents"][0]["parts"].append({
+                "inline_data": {
+                    "mime_type": screenshot_media_type,
+                    "data": screenshot_base64
+                }
+            })
+        
+        headers = {
+            "Content-Type": "application/json",
+            "x-goog-api-key": self.google_api_key
+        }
+        
+        generated_parts = []
+        usage = {"input_tokens": None, "output_tokens": None, "cache_read_input_tokens": None}
+        with tracing.span("llm.stream", model="gemini", **{
+            "prompt.chars": len(prompt),
+            "images": len(screenshots),
+            "images.base64_chars": sum(len(data) for data, _ in screenshots),
+        }) as stream_span:
+            async with self.http_client.stream("gemini", "POST", f"{url}?alt=sse&key={self.google_api_key}", json=payload, headers=headers) as response:
+                if response.status_code != 200:
+                    response_data = json.loads(await response.aread())
+                    if isinstance(response_data, list) and response_data:
+                        response_data = response_data[0]
+                    logger.error(f"Error from Gemini API: {response_data}")
+                    raise Exception(f"Failed to generate HTML clone: {response_data.get('error', {}).get('message', 'Unknown error')}")
+            
+                async for event in self._iter_sse_events(response):
+                    if "error" in event:
+                        logger.error(f"Error from Gemini API: {event}")
+                        raise Exception(f"Failed to generate HTML clone: {event['error'].get('message', 'Unknown error')}")
+                    # Every chunk carries the running token counts
+                    if "usageMetadata" in event:
+                        usage["input_tokens"] = event["usageMetadata"].get("promptTokenCount")
+                        usage["output_tokens"] = event["usageMetadata"].get("candidatesTokenCount")
+                        usage["cache_read_input_tokens"] = event["usageMetadata"].get("cachedContentTokenCount")
+                    for candidate in event.get("candidates", [])[:1]:
+                        for part in candidate.get("content", {}).get("parts", []):
+                            if part.get("text") and not generated_parts:
+                                stream_span.add_event("first_token")
+                            await self._emit_text(part.get("text", ""), generated_parts, on_text)
+            tracing.set_attributes(stream_span, **{"output.chars": sum(len(part) for part in generated_parts),
+                                                   "tokens.input": usage["input_tokens"],
+                                                   "tokens.output": usage["output_tokens"]})
+        
+        record_tokens("gemini", usage)
+        return "".join(generated_parts), usage
+    
+    def _simplify_context(self, design_context):
+        """The subset of the design context that is sent to the model"""
+        return {
+            'url': design_context['url'],
+            'base_domain': design_context['base_domain'],
+            'title': design_context['structure']['title'],
+            'headings': design_context['structure']['headings'],
+            'colors': design_context['colors'],
+            'fonts': design_context['fonts'],
+            'layout': design_context['layout'],
+            'meta_tags': design_context['meta_tags'],
+            'navigation_links': design_context['navigation_links'],
+            'ui_components': design_context.get('ui_components', {}),
+            'css_rules': design_context.get('css_rules', []),
+            'inline_styles': design_context.get('inline_styles', ''),
+            'favicon': design_context.get('favicon'),
+            'breakpoints': {
+                name: {key: breakpoint.get(key) for key in ('viewport', 'layout', 'colors', 'fonts')}
+                for name, breakpoint in (design_context.get('breakpoints') or {}).items()
+            }
+        }
+    
+    def _prepare_prompt_inputs(self, design_context, model, mode="single", shared=None):
+        """
+        Compact the design context for the model and derive the result cache key.
+        
+        Returns (context_json, site_json, compaction_report, result_key); the
+        key covers everything that determines the clone: the context as sent,
+        the screenshot, the model, the prompt version and the generation mode.
+        With the context shared by a site's pages, site_json is that context,
+        given up to SITE_CONTEXT_SHARE of the budget; otherwise it is None.
+        """
+        screenshot_refs = self._screenshot_refs(design_context, model)
+        image_count = max(len(screenshot_refs), 1)
+        site_json, budget = None, None
+        if shared is not None:
+            budget = model_budget(model, image_count)["context_budget"]
+            site_json, site_compaction = compact_site_context(shared, int(budget * SITE_CONTEXT_SHARE))
+            budget -= site_compaction["estimated_tokens"]
+        context_json, compaction = compact_context(self._simplify_context(design_context), model, image_count=image_count,
+                                                   budget_tokens=budget)
+        if screenshot_refs:
+            screenshot_digest = [ref['sha256'] for ref in screenshot_refs]
+        elif design_context.get('screenshot'):
+            screenshot_digest = hashlib.sha256(design_context['screenshot'].encode('utf-8')).hexdigest()
+        else:
+            screenshot_digest = None
+        # Breakpoints change the prompt even when compaction drops them from the context
+        breakpoints = sorted(design_context.get('breakpoints') or {})
+        key_parts = ["clone", PROMPT_VERSION, model, MODEL_IDS[model], context_json, screenshot_digest, breakpoints]
+        if mode != "single":
+            # Keys of single-call clones are unchanged from before sectioned generation
+            key_parts.append(mode)
+        if site_json is not None:
+            key_parts.append(site_json)
+            compaction["site"] = site_compaction
+        result_key = cache_key(*key_parts)
+        return context_json, site_json, compaction, result_key
+    
+    async def _iter_sse_events(self, response):
+        """Yield the JSON payload of each Server-Sent Event in a streamed response"""
+        data_lines = []
+        async for line in response.aiter_lines():
+            if line.startswith("data:"):
+                data_lines.append(line[5:].strip())
+            elif not line and data_lines:
+                # A blank line ends the event
+                data = "\n".join(data_lines)
+                data_lines = []
+                if data and data != "[DONE]":
+                    yield json.loads(data)
+        if data_lines:
+            data = "\n".join(data_lines)
+            if data and data != "[DONE]":
+                yield json.loads(data)
+    
+    async def _emit_text(self, text, generated_parts, on_text):
+        """Collect a piece of streamed text and pass it on"""
+        if not text:
+            return
+        generated_parts.append(text)
+        if on_text is not None:
+            await on_text(text)
+    
+    def _screenshot_refs(self, design_context, model):
+        """Blob references of the screenshot images prepared for a model"""
+        variants = design_context.get('screenshot_variants') or {}
+        if variants.get(model):
+            return variants[model]
+        # Entries scraped before per-model variants have a single reference
+        screenshot_ref = design_context.get('screenshot_ref')
+        return [screenshot_ref] if screenshot_ref else []
+    
+    async def _load_screenshots(self, design_context, model):
+        """Return [(base64, media_type)] for the model's screenshot images, loading them from the blob store lazily"""
+        refs = self._screenshot_refs(design_context, model)
+        # Older cache entries embed the screenshot as a base64 string
+        screenshot_base64 = design_context.pop('screenshot', None)
+        design_context.pop('screenshot_ref', None)
+        design_context.pop('screenshot_variants', None)
+        if screenshot_base64:
+            return [(screenshot_base64, "image/jpeg")]
+        if not refs or self.blob_store is None:
+            return []
+        loaded = await asyncio.gather(*(self.blob_store.read_base64(ref) for ref in refs))
+        # Skip images that were evicted from the blob store
+        return [(data, ref.get("media_type", "image/jpeg")) for data, ref in zip(loaded, refs) if data]
+    
+    def _tiling_note(self, screenshots):
+        """Prompt text explaining a screenshot split into several images"""
+        if len(screenshots) < 2:
+            return ""
+        return f" The screenshot is split into {len(screenshots)} images, each one viewport tall, in order from the top of the page."
+    
+    def _breakpoint_note(self, design_context):
+        """Prompt text asking for a responsive clone when the page was captured at several widths"""
+        breakpoints = design_context.get('breakpoints')
+        if not breakpoints:
+            return ""
+        sizes = ", ".join(f"{name} ({bp['viewport']['width']}px)" for name, bp in breakpoints.items())
+        return (f"\n\nThe page was also captured at narrower widths: {sizes}. The breakpoints section of the "
+                "design context holds the layout, colors and fonts at each width; use media queries so the "
+                "clone matches the original at every one of them.")
+    
     def _extract_html_code(self, text):
         """Extract HTML code from the text response"""
         # Check if the code is within a code block
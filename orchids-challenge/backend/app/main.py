@@ -1,30 +1,151 @@
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, HttpUrl
-from typing import Optional, Dict, Any
+from pydantic import BaseModel, Field, HttpUrl
+from typing import Optional, Dict, Any, List, Literal, Set
+from contextlib import asynccontextmanager
 import asyncio
 import uuid
 import os
+import socket
+import time
+from urllib.parse import urlparse
 from datetime import datetime
 import json
+import hashlib
+import re
 import logging
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
 load_dotenv()
 
-from .scraper import WebsiteScraper
+from .scraper import WebsiteScraper, design_context_sizes, normalize_url
 from .llm_clone import WebsiteCloner
+from .browser_pool import BrowserPool
+from .blob_store import BlobStore
+from .cache import cache_key
+from .single_flight import SingleFlight
+from .scheduler import JobScheduler, QueueFullError, SchedulerClosedError
+from .job_store import create_job_store, TERMINAL_STATUSES
+from .job_events import JobEventHub
+from .provider_client import ProviderClient
+from .worker_pool import ProcessWorkerPool
+from .page_loading import describe as describe_navigation, ordered_viewports, page_load_options
+from .archive import stream_zip
+from .crawler import SiteCrawler, deduplicate_site
+from .incremental import describe as describe_changes
+from .stylesheets import StylesheetFetcher
+from . import metrics, tracing
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Shared Chromium pool, started and stopped with the application
+browser_pool = BrowserPool()
+
+# Worker processes for CPU-bound page post-processing
+worker_pool = ProcessWorkerPool()
+
+# Stylesheet downloads and parsed-CSS cache shared by every scrape
+stylesheet_fetcher = StylesheetFetcher(worker_pool=worker_pool)
+
+# Pooled HTTP client for LLM provider calls, also tied to the application lifetime
+llm_client = ProviderClient()
+
+# Persistent job state shared by every worker process
+job_store = create_job_store()
+
+# Identifies this process as the lease holder of the jobs it runs
+INSTANCE_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "60"))
+
+# Live progress of jobs running in this process, pushed to /jobs/{job_id}/stream
+event_hub = JobEventHub()
+# How often streamed output is written to the store for subscribers on other processes
+STREAM_PERSIST_INTERVAL_SECONDS = float(os.getenv("STREAM_PERSIST_INTERVAL_SECONDS", "1"))
+# Polling interval for jobs running elsewhere, and keepalive interval for live ones
+STREAM_POLL_SECONDS = float(os.getenv("STREAM_POLL_SECONDS", "1"))
+STREAM_KEEPALIVE_SECONDS = 15
+
+async def update_job(job_id: str, **fields):
+    """Update a job in the store and notify its stream subscribers"""
+    job = await job_store.update(job_id, **fields)
+    event_hub.update(job_id, **fields)
+    if fields.get("status") in TERMINAL_STATUSES:
+        metrics.JOBS.labels(outcome=fields["status"]).inc()
+    return job
+
+async def abandon_job(job_id: str):
+    """Hand a job that was dropped during shutdown back for another process to rerun"""
+    job = await job_store.get(job_id)
+    if job is not None and job["status"] not in TERMINAL_STATUSES:
+        await job_store.update(job_id, status="pending", message="Server restarted, job will be resumed")
+        await job_store.release(job_id)
+
+# Bounded job queue with separate scrape / generate concurrency limits
+scheduler = JobScheduler(on_abandon=abandon_job)
+
+async def recover_jobs():
+    """Claim unfinished jobs whose process died and queue them here"""
+    claimed = await job_store.claim_expired(INSTANCE_ID, JOB_LEASE_SECONDS, limit=max(0, scheduler.max_queue_depth - scheduler.queue_depth))
+    for job in claimed:
+        job_id = job["job_id"]
+        # Written before the job is queued so it cannot overwrite the worker's first update
+        await update_job(job_id, status="pending", message="Job resumed after a restart, waiting in queue")
+        try:
+            submit_clone_job(job)
+        except (QueueFullError, SchedulerClosedError):
+            # Leave it for the next sweep (or another process)
+            await job_store.release(job_id)
+            continue
+        logger.info(f"Recovered job {job_id}")
+
+async def maintain_leases():
+    """Keep this process's job leases alive and pick up orphaned jobs"""
+    while True:
+        try:
+            await job_store.renew_leases(INSTANCE_ID, JOB_LEASE_SECONDS)
+            await recover_jobs()
+        except Exception as e:
+            logger.error(f"Error maintaining job leases: {str(e)}")
+        await asyncio.sleep(JOB_LEASE_SECONDS / 3)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    tracing.setup_tracing()
+    try:
+        await browser_pool.start()
+    except Exception as e:
+        # Scraper falls back to launching a browser per job
+        logger.error(f"Failed to start browser pool: {str(e)}")
+    await llm_client.start()
+    await stylesheet_fetcher.start()
+    worker_pool.start()
+    scheduler.start()
+    lease_task = asyncio.create_task(maintain_leases())
+    yield
+    # Let queued and running jobs finish before tearing down shared resources
+    await scheduler.stop()
+    lease_task.cancel()
+    await asyncio.gather(lease_task, return_exceptions=True)
+    await job_store.close()
+    await llm_client.stop()
+    await stylesheet_fetcher.stop()
+    await scraper.close()
+    await browser_pool.stop()
+    await worker_pool.stop()
+    await scraper.cache.flush()
+    await cloner.result_cache.flush()
+    tracing.shutdown_tracing()
+
 # Create FastAPI instance
 app = FastAPI(
     title="Website Cloning API",
     description="API for cloning websites using AI",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Add CORS middleware
@@ -40,17 +161,56 @@ app.add_middleware(
 os.makedirs("jobs", exist_ok=True)
 os.makedirs("cache", exist_ok=True)
 
-# In-memory job storage
-jobs = {}
+# Initialize scraper and cloner, sharing the screenshot blob store
+blob_store = BlobStore(os.path.join(".cache", "blobs"))
+scraper = WebsiteScraper(browser_pool=browser_pool, blob_store=blob_store, worker_pool=worker_pool,
+                         stylesheet_fetcher=stylesheet_fetcher)
+cloner = WebsiteCloner(blob_store=blob_store, http_client=llm_client)
 
-# Initialize scraper and cloner
-scraper = WebsiteScraper()
-cloner = WebsiteCloner()
+# In-flight deduplication of scrapes and generations across concurrent jobs
+scrape_flight = SingleFlight("scrape")
+generate_flight = SingleFlight("generate")
 
 # Pydantic models
+class ScrapeOptions(BaseModel):
+    """Per-request overrides of the page load settings; unset fields use the server defaults"""
+    viewports: Optional[List[Literal["desktop", "tablet", "mobile"]]] = Field(None, min_length=1)  # captured in one page load
+    block_resources: Optional[List[Literal["analytics", "ads", "media", "fonts"]]] = None
+    wait_until: Optional[Literal["quiescence", "networkidle", "load", "domcontentloaded"]] = None
+    quiet_ms: Optional[int] = Field(None, ge=0, le=10000)  # DOM must be unchanged this long
+    max_wait_ms: Optional[int] = Field(None, ge=0, le=60000)  # hard cap on waiting for quiescence
+
+# Most pages a single crawl job may clone
+CRAWL_MAX_PAGES = int(os.getenv("CRAWL_MAX_PAGES", "20"))
+
+class CrawlOptions(BaseModel):
+    """Clone the pages reachable from the URL over same-origin links, not just the URL itself"""
+    max_depth: int = Field(1, ge=0, le=5)  # link hops from the start page
+    max_pages: int = Field(5, ge=1, le=CRAWL_MAX_PAGES)
+
 class CloneRequest(BaseModel):
     url: HttpUrl
     model: Optional[str] = None  # Can be "claude" or "gemini"
+    force_refresh: bool = False  # Regenerate even if an identical clone is cached
+    scrape_options: Optional[ScrapeOptions] = None  # Only applies if the page is actually scraped
+    crawl: Optional[CrawlOptions] = None
+    generation_mode: Optional[Literal["single", "sectioned", "auto"]] = None  # GENERATION_MODE if unset
+
+# Most jobs (URLs x models) a single batch may create
+BATCH_MAX_JOBS = int(os.getenv("BATCH_MAX_JOBS", "50"))
+
+class BatchCloneRequest(BaseModel):
+    urls: List[HttpUrl] = Field(..., min_length=1)
+    models: Optional[List[str]] = None  # every URL is cloned with each model; default model if omitted
+    force_refresh: bool = False
+    scrape_options: Optional[ScrapeOptions] = None
+    generation_mode: Optional[Literal["single", "sectioned", "auto"]] = None
+
+class BatchCloneResponse(BaseModel):
+    batch_id: str
+    job_ids: List[str]
+    status: str
+    message: str
 
 class CloneResponse(BaseModel):
     job_id: str
@@ -64,6 +224,20 @@ class JobStatus(BaseModel):
     result: Optional[Dict[str, Any]] = None
     started_at: Optional[str] = None
     completed_at: Optional[str] = None
+    streamed_chars: Optional[int] = None  # generated output received so far
+    cache_hits: Optional[Dict[str, bool]] = None  # stage -> whether it was served from cache
+    tokens: Optional[Dict[str, Optional[int]]] = None  # estimated and reported prompt / completion tokens
+    context_compaction: Optional[Dict[str, Any]] = None  # what was cut to fit the token budget
+    navigation: Optional[Dict[str, Any]] = None  # page load strategy, blocked requests and time saved
+    changes: Optional[Dict[str, Any]] = None  # sections changed since the page's previous scrape
+    generation: Optional[Dict[str, Any]] = None  # single or sectioned generation, with per-region timings
+    routing: Optional[Dict[str, Any]] = None  # providers tried for the generation, fallbacks and hedging
+    stage_timings: Optional[Dict[str, Any]] = None  # ms queued, scraping, generating and in total, with scrape phases
+    trace_id: Optional[str] = None  # OpenTelemetry trace of the job, when tracing is enabled
+    coalesced: Optional[Dict[str, str]] = None  # stage -> job whose work was shared
+    batch_id: Optional[str] = None
+    crawl: Optional[Dict[str, Any]] = None  # pages crawled, cache hits and deduplication for crawl jobs
+    queue_position: Optional[int] = None
 
 @app.get("/")
 async def root():
@@ -73,110 +247,700 @@ async def root():
 async def health_check():
     return {"status": "healthy", "service": "website-cloning-api"}
 
-@app.post("/clone", response_model=CloneResponse)
-async def clone_website(request: CloneRequest, background_tasks: BackgroundTasks):
+@app.get("/stats")
+async def get_stats():
+    return {
+        "scheduler": scheduler.stats(),
+        "browser_pool": browser_pool.stats(),
+        "llm_client": llm_client.stats(),
+        "worker_pool": worker_pool.stats(),
+        "scrape_cache": scraper.cache.stats(),
+        "stylesheets": stylesheet_fetcher.stats(),
+        "clone_cache": cloner.result_cache.stats(),
+        "routing": cloner.router.stats(),
+        "blob_store": blob_store.stats(),
+        "streams": event_hub.stats(),
+        "single_flight": {
+            "scrape": scrape_flight.stats(),
+            "generate": generate_flight.stats()
+        }
+    }
+
+@app.get("/metrics")
+async def get_metrics():
+    """Pipeline metrics in the Prometheus text format"""
+    if not metrics.PROMETHEUS_AVAILABLE:
+        raise HTTPException(status_code=503, detail="Metrics need the prometheus_client package")
+    metrics.update_gauges(scheduler.stats(), browser_pool.stats())
+    body, content_type = metrics.render()
+    return Response(content=body, media_type=content_type)
+
+async def create_clone_job(url: str, model: Optional[str], force_refresh: bool,
+                           scrape_options: Optional[Dict[str, Any]], batch_id: Optional[str] = None,
+                           crawl_options: Optional[Dict[str, Any]] = None,
+                           generation_mode: Optional[str] = None) -> Dict[str, Any]:
+    """Store a new pending job and return its fields (with job_id)"""
     job_id = str(uuid.uuid4())
-    
-    # Store job info
-    jobs[job_id] = {
+    fields = {
         "status": "pending",
-        "url": str(request.url),
-        "model": request.model,
+        "url": url,
+        "model": model,
+        "force_refresh": force_refresh,
+        "scrape_options": scrape_options,
         "started_at": datetime.now().isoformat(),
-        "message": "Job created, starting processing"
+        "message": "Job created, waiting in queue"
     }
+    if batch_id:
+        fields["batch_id"] = batch_id
+    if crawl_options:
+        fields["crawl_options"] = crawl_options
+    if generation_mode:
+        fields["generation_mode"] = generation_mode
+    await job_store.create(job_id, fields, owner=INSTANCE_ID, lease_seconds=JOB_LEASE_SECONDS)
+    event_hub.update(job_id, status="pending", message="Job created, waiting in queue")
+    return {"job_id": job_id, **fields}
+
+def submit_clone_job(job: Dict[str, Any]):
+    """Queue a stored job for processing; raises QueueFullError / SchedulerClosedError"""
+    args = (job["job_id"], job["url"], job.get("model"), job.get("force_refresh", False), job.get("scrape_options"))
+    generation_mode = job.get("generation_mode")
+    queued_at = time.perf_counter()
+    if job.get("crawl_options"):
+        scheduler.submit(job["job_id"], lambda: process_crawl_job(*args, job["crawl_options"], generation_mode=generation_mode,
+                                                                  queued_at=queued_at))
+    else:
+        scheduler.submit(job["job_id"], lambda: process_clone_job(*args, generation_mode=generation_mode, queued_at=queued_at))
+
+async def discard_jobs(jobs: List[Dict[str, Any]]):
+    """Remove jobs that could not be queued"""
+    for job in jobs:
+        await job_store.delete(job["job_id"])
+        event_hub.finish(job["job_id"])
+
+def scheduler_http_error(error: Exception) -> HTTPException:
+    if isinstance(error, QueueFullError):
+        return HTTPException(status_code=429, detail=str(error), headers={"Retry-After": "10"})
+    return HTTPException(status_code=503, detail=str(error))
+
+@app.post("/clone", response_model=CloneResponse)
+async def clone_website(request: CloneRequest):
+    scrape_options = request.scrape_options.model_dump(exclude_none=True) if request.scrape_options else None
+    crawl_options = request.crawl.model_dump() if request.crawl else None
+    job = await create_clone_job(str(request.url), request.model, request.force_refresh, scrape_options,
+                                 crawl_options=crawl_options, generation_mode=request.generation_mode)
     
-    # Start processing in background
-    background_tasks.add_task(process_clone_job, job_id, str(request.url), request.model)
+    # Queue for processing by the worker pool
+    try:
+        submit_clone_job(job)
+    except (QueueFullError, SchedulerClosedError) as e:
+        await discard_jobs([job])
+        raise scheduler_http_error(e)
     
     return {
-        "job_id": job_id,
+        "job_id": job["job_id"],
         "status": "pending",
         "message": "Website cloning job started"
     }
 
+@app.post("/clone/batch", response_model=BatchCloneResponse)
+async def clone_batch(request: BatchCloneRequest):
+    """
+    Clone every URL with every requested model as one batch of ordinary jobs.
+
+    The jobs share the scheduler's stage limits, the browser pool and the
+    provider client like any others, and jobs for the same URL share one
+    scrape. The batch is queued all-or-nothing.
+    """
+    models = list(dict.fromkeys(request.models or [None]))
+    unknown = [m for m in models if m is not None and m not in ("claude", "gemini")]
+    if unknown:
+        raise HTTPException(status_code=422, detail=f"Unsupported models: {unknown}")
+    # Duplicate URLs (after normalization) are cloned once
+    urls, seen = [], set()
+    for url in map(str, request.urls):
+        if normalize_url(url) not in seen:
+            seen.add(normalize_url(url))
+            urls.append(url)
+    if len(urls) * len(models) > BATCH_MAX_JOBS:
+        raise HTTPException(status_code=413, detail=f"Batch would create {len(urls) * len(models)} jobs, the limit is {BATCH_MAX_JOBS}")
+    
+    batch_id = str(uuid.uuid4())
+    scrape_options = request.scrape_options.model_dump(exclude_none=True) if request.scrape_options else None
+    # Jobs are ordered by URL, then model, so a URL's jobs run next to each other and share its scrape
+    jobs = [
+        await create_clone_job(url, model, request.force_refresh, scrape_options, batch_id=batch_id,
+                               generation_mode=request.generation_mode)
+        for url in urls for model in models
+    ]
+    
+    # No awaits from the capacity check to the last submit, so nothing else can take the room
+    free = scheduler.max_queue_depth - scheduler.queue_depth
+    try:
+        if len(jobs) > free:
+            raise QueueFullError(f"Job queue has room for {free} jobs, batch needs {len(jobs)}")
+        for job in jobs:
+            submit_clone_job(job)
+    except (QueueFullError, SchedulerClosedError) as e:
+        await discard_jobs(jobs)
+        raise scheduler_http_error(e)
+    
+    # Recorded once the batch is accepted, so a rejected batch leaves nothing behind
+    await job_store.create_batch(batch_id, {
+        "urls": urls,
+        "models": models,
+        "force_refresh": request.force_refresh,
+        "scrape_options": scrape_options,
+        "generation_mode": request.generation_mode,
+        "created_at": datetime.now().isoformat()
+    })
+    
+    return {
+        "batch_id": batch_id,
+        "job_ids": [job["job_id"] for job in jobs],
+        "status": "pending",
+        "message": f"Batch of {len(jobs)} cloning jobs started"
+    }
+
+@app.get("/batches/{batch_id}")
+async def get_batch_status(batch_id: str):
+    batch = await job_store.get_batch(batch_id)
+    if batch is None:
+        raise HTTPException(status_code=404, detail=f"Batch {batch_id} not found")
+    jobs = await job_store.list_batch_jobs(batch_id)
+    
+    counts: Dict[str, int] = {}
+    for job in jobs:
+        counts[job["status"]] = counts.get(job["status"], 0) + 1
+    finished = sum(counts.get(status, 0) for status in TERMINAL_STATUSES)
+    if finished == len(jobs):
+        status = "completed"
+    elif finished or any(job["status"] != "pending" for job in jobs):
+        status = "running"
+    else:
+        status = "pending"
+    
+    return {
+        "batch_id": batch_id,
+        "status": status,
+        "created_at": batch["created_at"],
+        "total": len(jobs),
+        "counts": counts,
+        "progress": finished / len(jobs) if jobs else 1.0,
+        "jobs": [
+            {
+                "job_id": job["job_id"],
+                "url": job["url"],
+                "model": job["model"],
+                "status": job["status"],
+                "message": job["message"],
+                "completed_at": job.get("completed_at")
+            }
+            for job in jobs
+        ]
+    }
+
+def page_file_name(url: str, used: Optional[Set[str]] = None) -> str:
+    """
+    Path of a crawled page's clone in an archive, e.g. /docs/intro -> docs/intro.html.
+    
+    An existing .html/.htm extension is kept as the only one and /index maps
+    to the same file as /. Names already in used get a -2, -3, ... suffix;
+    the returned name is added to used.
+    """
+    parsed = urlparse(url)
+    path = re.sub(r'[^A-Za-z0-9._/-]+', '_', parsed.path.strip("/"))
+    path = re.sub(r'\.html?$', '', path, flags=re.IGNORECASE) or "index"
+    if parsed.query:
+        path += "-" + hashlib.sha256(parsed.query.encode("utf-8")).hexdigest()[:8]
+    name = f"{path}.html"
+    if used is not None:
+        suffix = 2
+        while name in used:
+            name = f"{path}-{suffix}.html"
+            suffix += 1
+        used.add(name)
+    return name
+
+async def crawl_archive_entries(result: Dict[str, Any]):
+    """Each crawled page's clone, then a manifest of every page"""
+    manifest = []
+    used = {"manifest.json"}
+    for page in result["pages"]:
+        entry = {key: page.get(key) for key in ("url", "depth", "title", "error")}
+        if page.get("html") is not None:
+            entry["file"] = page_file_name(page["url"], used)
+            yield entry["file"], page["html"].encode("utf-8")
+        manifest.append(entry)
+    yield "manifest.json", json.dumps(manifest, indent=2).encode("utf-8")
+
+@app.get("/clone/{job_id}/archive")
+async def download_crawl_archive(job_id: str):
+    """Zip of every page cloned by a crawl job, streamed as it is built"""
+    job = await job_store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    if job["status"] != "completed":
+        raise HTTPException(status_code=400, detail=f"Job {job_id} is not completed yet")
+    result = await job_store.get_result(job_id)
+    if result is None or "pages" not in result:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} has no crawled pages")
+    
+    return StreamingResponse(
+        stream_zip(crawl_archive_entries(result)),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="site-{job_id}.zip"'}
+    )
+
+def archive_name(index: int, job: Dict[str, Any], model_used: str) -> str:
+    """File name of a job's HTML in a batch archive, e.g. 001-news.ycombinator.com-claude.html"""
+    host = re.sub(r'[^A-Za-z0-9.-]+', '_', urlparse(job["url"]).netloc) or "page"
+    return f"{index:03d}-{host}-{model_used}.html"
+
+async def batch_archive_entries(jobs: List[Dict[str, Any]]):
+    """Completed jobs' HTML, then a manifest describing every job in the batch"""
+    manifest = []
+    for index, job in enumerate(jobs, start=1):
+        entry = {"job_id": job["job_id"], "url": job["url"], "model": job["model"], "status": job["status"], "file": None}
+        result = await job_store.get_result(job["job_id"]) if job["status"] == "completed" else None
+        if result is not None:
+            entry["file"] = archive_name(index, job, result["model_used"])
+            yield entry["file"], result["html"].encode("utf-8")
+        else:
+            entry["message"] = job["message"]
+        manifest.append(entry)
+    yield "manifest.json", json.dumps(manifest, indent=2).encode("utf-8")
+
+@app.get("/batches/{batch_id}/archive")
+async def download_batch_archive(batch_id: str):
+    """Zip of every completed clone in the batch, streamed as it is built"""
+    if await job_store.get_batch(batch_id) is None:
+        raise HTTPException(status_code=404, detail=f"Batch {batch_id} not found")
+    jobs = await job_store.list_batch_jobs(batch_id)
+    
+    return StreamingResponse(
+        stream_zip(batch_archive_entries(jobs)),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="batch-{batch_id}.zip"'}
+    )
+
 @app.get("/jobs/{job_id}", response_model=JobStatus)
 async def get_job_status(job_id: str):
-    if job_id not in jobs:
+    job = await job_store.get(job_id)
+    if job is None:
         raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
     
     return {
         "job_id": job_id,
-        **jobs[job_id]
+        **job,
+        "queue_position": scheduler.position(job_id)
     }
 
-@app.get("/jobs")
-async def get_all_jobs():
-    return {"jobs": [
-        {"job_id": job_id, **job_info}
-        for job_id, job_info in jobs.items()
-    ]}
+@app.get("/jobs/{job_id}/stream")
+async def stream_job(job_id: str, request: Request):
+    if await job_store.get(job_id) is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    
+    return StreamingResponse(
+        job_event_stream(job_id, request),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
-async def process_clone_job(job_id: str, url: str, model: Optional[str] = None):
-    try:
-        # Update job status
-        jobs[job_id]["status"] = "scraping"
-        jobs[job_id]["message"] = "Scraping website content"
-        
-        # Check cache first
-        cached_data = await scraper.get_cached_website_data(url)
-        
-        if cached_data:
-            design_context = cached_data
-            jobs[job_id]["message"] = "Using cached website data"
+def sse_event(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def job_event_stream(job_id: str, request: Request):
+    """
+    Server-Sent Events for a job: "status" on every status or message change,
+    "chunk" for generated text as it arrives, then "completed" with the final
+    HTML or a last "status" with the failure.
+    """
+    sent = 0
+    last_state = None
+    while not await request.is_disconnected():
+        # Take the change event before reading so no update is missed in between
+        changed = event_hub.changed(job_id)
+        live = event_hub.snapshot(job_id, sent)
+        if live is not None:
+            status, message, text = live["status"], live["message"], live["text"]
         else:
-            # Scrape website
-            design_context = await scraper.scrape_website(url)
-            # Save to cache for future use
-            scraper.save_to_cache(url, design_context)
+            # Not running in this process: follow the job through the store
+            job = await job_store.get(job_id)
+            if job is None:
+                return
+            status, message, text = job["status"], job["message"], ""
+            if status == "generating":
+                partial = await job_store.get_result(job_id)
+                if partial and partial.get("partial"):
+                    text = partial["html"][sent:]
         
-        # Update job status
-        jobs[job_id]["status"] = "generating"
-        jobs[job_id]["message"] = "Generating website clone using AI"
+        if (status, message) != last_state:
+            last_state = (status, message)
+            yield sse_event("status", {"status": status, "message": message})
+        if text:
+            yield sse_event("chunk", {"offset": sent, "text": text})
+            sent += len(text)
         
-        # Generate clone using LLM
-        result = await cloner.generate_clone(design_context, model)
+        if status in TERMINAL_STATUSES:
+            if status == "completed":
+                result = await job_store.get_result(job_id)
+                if result is not None:
+                    yield sse_event("completed", {"html": result["html"], "model_used": result["model_used"]})
+            return
         
-        # Save result
-        job_result_path = os.path.join("jobs", f"{job_id}.json")
-        with open(job_result_path, "w") as f:
-            json.dump({
+        if changed is None:
+            await asyncio.sleep(STREAM_POLL_SECONDS)
+            continue
+        try:
+            await asyncio.wait_for(changed.wait(), timeout=STREAM_KEEPALIVE_SECONDS)
+        except asyncio.TimeoutError:
+            yield ": keepalive\n\n"
+
+@app.get("/jobs")
+async def get_all_jobs(status: Optional[str] = None, limit: int = Query(50, ge=1, le=500), offset: int = Query(0, ge=0)):
+    jobs, total = await asyncio.gather(
+        job_store.list(status=status, limit=limit, offset=offset),
+        job_store.count(status=status)
+    )
+    return {"jobs": jobs, "total": total, "limit": limit, "offset": offset}
+
+async def run_in_stage(stage: str, work):
+    """Await work while holding a slot of the given pipeline stage"""
+    async with scheduler.stage(stage):
+        return await work
+
+async def load_design_context(url: str, scrape_options: Optional[Dict[str, Any]] = None):
+    """Return (design_context, from_cache) for a URL, scraping on a cache miss or a changed page"""
+    viewports = page_load_options(scrape_options)["viewports"]
+    cached_data = await scraper.get_cached_website_data(url, viewports)
+    if cached_data:
+        if scraper.is_fresh(cached_data):
+            return cached_data, True
+        revalidated = await scraper.revalidate(url, cached_data)
+        if revalidated is not None:
+            scraper.save_to_cache(url, revalidated)
+            return revalidated, True
+    
+    # Scrape website, diffing against the stale cached copy if there is one
+    design_context = await scraper.scrape_website(url, scrape_options, previous=cached_data)
+    # Save to cache for future use
+    scraper.save_to_cache(url, design_context)
+    return design_context, False
+
+async def scrape_shared(job_id: str, url: str, scrape_options: Optional[Dict[str, Any]]):
+    """((design_context, from_cache), leader_job_id) for a URL, coalesced with concurrent scrapes of it"""
+    # Concurrent jobs for the same URL and viewports share a single cache lookup / scrape
+    scrape_key = cache_key("scrape", normalize_url(url), ordered_viewports(page_load_options(scrape_options)["viewports"]))
+    return await scrape_flight.do(
+        scrape_key, lambda: run_in_stage("scrape", load_design_context(url, scrape_options)), owner=job_id
+    )
+
+async def generate_shared(job_id: str, url: str, design_context: Dict[str, Any], model: Optional[str],
+                          force_refresh: bool, stream: bool = True, generation_mode: Optional[str] = None,
+                          site: Optional[Dict[str, Any]] = None):
+    """(result, leader_job_id, channel) for a design context, coalesced with identical generations"""
+    # Identical generations (same URL, model, design context and shared site context) are coalesced too
+    model_name = model or cloner.default_model
+    key_parts = ("generate", normalize_url(url), model_name, force_refresh, generation_mode, design_context)
+    generate_key = await asyncio.to_thread(cache_key, *key_parts, *((site,) if site is not None else ()))
+    # Generated text is streamed on a channel shared by every job coalesced onto this generation.
+    # It is named after the leading job, so a later generation with the same key (e.g. a clone
+    # cache replay) starts a fresh channel instead of appending to one still retained.
+    # No await between here and do(), so the leader cannot change in between.
+    channel = f"{generate_key}:{generate_flight.leader(generate_key) or job_id}"
+    on_text = None
+    if stream:
+        event_hub.attach(job_id, channel)
+        on_text = stream_writer(job_id, channel)
+    result, leader = await generate_flight.do(
+        generate_key,
+        lambda: run_in_stage("generate", cloner.generate_clone(design_context, model, on_text=on_text, force_refresh=force_refresh,
+                                                               mode=generation_mode, site=site)),
+        owner=job_id
+    )
+    return result, leader, channel
+
+def record_stage(stage_timings: Dict[str, Any], stage: str, started: float):
+    """Store how long a job spent in a stage since started (a perf_counter reading) and add it to the metrics"""
+    stage_timings[f"{stage}_ms"] = round((time.perf_counter() - started) * 1000, 2)
+    metrics.observe_ms(metrics.JOB_STAGE_SECONDS, stage_timings[f"{stage}_ms"], stage=stage)
+
+async def process_clone_job(job_id: str, url: str, model: Optional[str] = None, force_refresh: bool = False,
+                            scrape_options: Optional[Dict[str, Any]] = None, generation_mode: Optional[str] = None,
+                            queued_at: Optional[float] = None):
+    started = time.perf_counter()
+    stage_timings = {}
+    if queued_at is not None:
+        record_stage(stage_timings, "queued", queued_at)
+    with tracing.span("clone_job", **{"job.id": job_id, "url": url, "model": model,
+                                      "force_refresh": force_refresh, "generation.mode": generation_mode}) as job_span:
+        try:
+            # Update job status
+            await update_job(job_id, status="scraping", message="Scraping website content",
+                             trace_id=tracing.current_trace_id())
+            
+            stage_started = time.perf_counter()
+            with tracing.span("scrape") as scrape_span:
+                (shared_context, from_cache), scrape_leader = await scrape_shared(job_id, url, scrape_options)
+                tracing.set_attributes(scrape_span, **{"cache_hit": from_cache, "coalesced.leader": scrape_leader,
+                                                       **design_context_sizes(shared_context)})
+            record_stage(stage_timings, "scrape", stage_started)
+            # Each job gets its own copy since generation pops keys from it
+            design_context = dict(shared_context)
+            
+            coalesced = {}
+            if scrape_leader:
+                coalesced["scrape"] = scrape_leader
+                await update_job(job_id, coalesced=coalesced, message=f"Reused website data scraped by job {scrape_leader}")
+            elif from_cache:
+                await update_job(job_id, message="Using cached website data")
+            navigation = design_context.get("timings", {}).get("navigation")
+            if navigation and not (from_cache or scrape_leader):
+                await update_job(job_id, navigation=navigation, message=f"Scraped website: {describe_navigation(navigation)}")
+            changes = design_context.get("changes")
+            if changes and not scrape_leader:
+                await update_job(job_id, changes=changes, message=f"Checked against previous scrape: {describe_changes(changes)}")
+            if not (from_cache or scrape_leader):
+                # Phases of the scrape this job ran itself
+                stage_timings["scrape"] = {
+                    phase: ms for phase, ms in (design_context.get("timings") or {}).items() if phase.endswith("_ms")
+                }
+            
+            # Update job status
+            await update_job(job_id, status="generating", message="Generating website clone using AI", stage_timings=stage_timings)
+            stage_started = time.perf_counter()
+            with tracing.span("generate") as generate_span:
+                result, generate_leader, channel = await generate_shared(job_id, url, design_context, model, force_refresh,
+                                                                         generation_mode=generation_mode)
+                tracing.set_attributes(generate_span, **{
+                    "cache_hit": result["cache_hit"],
+                    "coalesced.leader": generate_leader,
+                    "model_used": result["model_used"],
+                    "generation.mode": (result.get("generation") or {}).get("mode"),
+                    "prompt.estimated_tokens": result["compaction"]["estimated_tokens"],
+                    "tokens.input": result["usage"]["input_tokens"],
+                    "tokens.output": result["usage"]["output_tokens"],
+                    "html.chars": len(result["generated_html"]),
+                })
+            record_stage(stage_timings, "generate", stage_started)
+            if generate_leader:
+                coalesced["generate"] = generate_leader
+            
+            # Save result
+            await job_store.save_result(job_id, {
                 "html": result["generated_html"],
                 "model_used": result["model_used"],
                 "url": url,
                 "completed_at": datetime.now().isoformat()
-            }, f)
+            })
+            
+            # Update job status
+            record_stage(stage_timings, "total", started)
+            await update_job(
+                job_id,
+                status="completed",
+                message="Website clone generated successfully",
+                completed_at=datetime.now().isoformat(),
+                coalesced=coalesced or None,
+                cache_hits={"scrape": from_cache, "generate": result["cache_hit"]},
+                tokens={
+                    "estimated_input": result["compaction"]["estimated_tokens"],
+                    "input": result["usage"]["input_tokens"],
+                    "output": result["usage"]["output_tokens"]
+                },
+                context_compaction=result["compaction"],
+                generation=result.get("generation"),
+                routing=result.get("routing"),
+                stage_timings=stage_timings,
+                navigation=navigation,
+                changes=changes,
+                streamed_chars=len(event_hub.channel_text(channel)),
+                result={
+                    "html": result["generated_html"][:500] + "...",  # Preview only
+                    "model_used": result["model_used"]
+                }
+            )
+            
+        except Exception as e:
+            logger.error(f"Error processing job {job_id}: {str(e)}")
+            tracing.record_error(job_span, e)
+            record_stage(stage_timings, "total", started)
+            await update_job(
+                job_id,
+                status="failed",
+                message=f"Failed to clone website: {str(e)}",
+                completed_at=datetime.now().isoformat(),
+                stage_timings=stage_timings
+            )
+        finally:
+            event_hub.finish(job_id)
+
+async def process_crawl_job(job_id: str, url: str, model: Optional[str] = None, force_refresh: bool = False,
+                            scrape_options: Optional[Dict[str, Any]] = None, crawl_options: Optional[Dict[str, Any]] = None,
+                            generation_mode: Optional[str] = None, queued_at: Optional[float] = None):
+    """
+    Crawl a site from url and clone every page found.
+    
+    Pages are scraped and generated through the same single-flight, cached,
+    stage-limited paths as single jobs. Each page is generated from its own
+    CSS rules and layout, after the context its pages share, which is the
+    same prompt prefix for every page so providers can cache it. The start
+    page's generation is streamed; the result holds every page's HTML and
+    the deduplicated site context. Stage timings cover the whole crawl and
+    all pages' generation.
+    """
+    crawl_options = crawl_options or {}
+    started = time.perf_counter()
+    stage_timings = {}
+    if queued_at is not None:
+        record_stage(stage_timings, "queued", queued_at)
+    with tracing.span("clone_job", **{"job.id": job_id, "url": url, "model": model, "force_refresh": force_refresh,
+                                      "generation.mode": generation_mode, "crawl.max_depth": crawl_options.get("max_depth", 1),
+                                      "crawl.max_pages": crawl_options.get("max_pages", 5)}) as job_span:
+        try:
+            await update_job(job_id, status="scraping", message="Crawling website", trace_id=tracing.current_trace_id())
         
-        # Update job status
-        jobs[job_id]["status"] = "completed"
-        jobs[job_id]["message"] = "Website clone generated successfully"
-        jobs[job_id]["completed_at"] = datetime.now().isoformat()
-        jobs[job_id]["result"] = {
-            "html": result["generated_html"][:500] + "...",  # Preview only
-            "model_used": result["model_used"]
-        }
+            stage_started = time.perf_counter()
         
-    except Exception as e:
-        logger.error(f"Error processing job {job_id}: {str(e)}")
-        jobs[job_id]["status"] = "failed"
-        jobs[job_id]["message"] = f"Failed to clone website: {str(e)}"
-        jobs[job_id]["completed_at"] = datetime.now().isoformat()
+            async def load_page(page_url):
+                (design_context, from_cache), _ = await scrape_shared(job_id, page_url, scrape_options)
+                return design_context, from_cache
+        
+            async def on_page(page):
+                await update_job(job_id, message=f"Crawled {page['url']} (depth {page['depth']})")
+        
+            with tracing.span("scrape") as scrape_span:
+                crawl = await SiteCrawler(load_page).crawl(
+                    url, crawl_options.get("max_depth", 1), crawl_options.get("max_pages", 5), on_page=on_page
+                )
+                tracing.set_attributes(scrape_span, **{f"crawl.{key}": value for key, value in crawl["stats"].items()})
+            record_stage(stage_timings, "scrape", stage_started)
+            pages = [page for page in crawl["pages"] if "design_context" in page]
+            if not pages:
+                raise Exception(crawl["pages"][0].get("error", "No page could be scraped") if crawl["pages"] else "No page could be scraped")
+            site = await asyncio.to_thread(deduplicate_site, pages)
+        
+            await update_job(job_id, status="generating", message=f"Generating clones of {len(pages)} pages",
+                             stage_timings=stage_timings)
+            stage_started = time.perf_counter()
+            generated = 0
+        
+            # What the pages share is sent once per request as a cacheable prompt prefix, ahead of each page's own part
+            shared = site["shared"] if site["shared"]["css_rules"] or site["shared"]["layout"] else None
+            
+            async def generate_page(index, page):
+                nonlocal generated
+                own = site["pages"][index]
+                page_site = {"shared": shared, "page": {"css_rules": own["css_rules"], "layout": own["layout"]}} if shared else None
+                # Each page gets its own copy since generation pops keys from it
+                result, _, channel = await generate_shared(job_id, page["url"], dict(page["design_context"]), model,
+                                                           force_refresh, stream=index == 0, generation_mode=generation_mode,
+                                                           site=page_site)
+                generated += 1
+                await update_job(job_id, message=f"Generated {generated}/{len(pages)} pages")
+                return result, channel
+        
+            with tracing.span("generate", **{"crawl.pages": len(pages)}) as generate_span:
+                outcomes = await asyncio.gather(*(generate_page(i, page) for i, page in enumerate(pages)), return_exceptions=True)
+                successful = [outcome[0] for outcome in outcomes if not isinstance(outcome, BaseException)]
+                tracing.set_attributes(generate_span, **{
+                    "crawl.generated": len(successful),
+                    "cache_hit": bool(successful) and all(result["cache_hit"] for result in successful),
+                    "tokens.input": sum(result["usage"]["input_tokens"] or 0 for result in successful),
+                    "tokens.output": sum(result["usage"]["output_tokens"] or 0 for result in successful),
+                    "tokens.cache_read": sum(result["usage"].get("cache_read_input_tokens") or 0 for result in successful),
+                })
+            record_stage(stage_timings, "generate", stage_started)
+            if isinstance(outcomes[0], BaseException):
+                raise outcomes[0]
+            start_result, start_channel = outcomes[0]
+        
+            result_pages = []
+            for page, outcome in zip(pages, outcomes):
+                entry = {"url": page["url"], "depth": page["depth"], "title": page["design_context"].get("title")}
+                if isinstance(outcome, BaseException):
+                    entry["error"] = str(outcome)
+                else:
+                    entry.update(html=outcome[0]["generated_html"], cache_hit=outcome[0]["cache_hit"])
+                result_pages.append(entry)
+            failed = [{"url": page["url"], "depth": page["depth"], "error": page["error"]} for page in crawl["pages"] if "error" in page]
+        
+            await job_store.save_result(job_id, {
+                "html": start_result["generated_html"],
+                "model_used": start_result["model_used"],
+                "url": url,
+                "completed_at": datetime.now().isoformat(),
+                "pages": result_pages + failed,
+                "site": {"shared": site["shared"], "pages": site["pages"]}
+            })
+        
+            record_stage(stage_timings, "total", started)
+            await update_job(
+                job_id,
+                status="completed",
+                message=f"Cloned {len(successful)} of {len(crawl['pages'])} pages",
+                completed_at=datetime.now().isoformat(),
+                crawl={**crawl["stats"], "generated": len(successful), "deduplication": site["stats"]},
+                cache_hits={
+                    "scrape": all(page["from_cache"] for page in pages),
+                    "generate": all(result["cache_hit"] for result in successful)
+                },
+                tokens={
+                    key: sum(result["usage"].get(field) or 0 for result in successful)
+                    for key, field in (("input", "input_tokens"), ("output", "output_tokens"), ("cache_read", "cache_read_input_tokens"))
+                },
+                stage_timings=stage_timings,
+                streamed_chars=len(event_hub.channel_text(start_channel)),
+                result={
+                    "html": start_result["generated_html"][:500] + "...",  # Preview only
+                    "model_used": start_result["model_used"],
+                    "pages": [page["url"] for page in result_pages]
+                }
+            )
+    
+        except Exception as e:
+            logger.error(f"Error processing crawl job {job_id}: {str(e)}")
+            tracing.record_error(job_span, e)
+            record_stage(stage_timings, "total", started)
+            await update_job(
+                job_id,
+                status="failed",
+                message=f"Failed to crawl website: {str(e)}",
+                completed_at=datetime.now().isoformat(),
+                stage_timings=stage_timings
+            )
+        finally:
+            event_hub.finish(job_id)
+
+def stream_writer(job_id: str, channel: str):
+    """on_text callback publishing generated text live and, periodically, to the job store"""
+    last_persisted = 0.0
+    
+    async def on_text(text: str):
+        nonlocal last_persisted
+        event_hub.append(channel, text)
+        loop_time = asyncio.get_running_loop().time()
+        if loop_time - last_persisted >= STREAM_PERSIST_INTERVAL_SECONDS:
+            last_persisted = loop_time
+            streamed = event_hub.channel_text(channel)
+            await job_store.save_result(job_id, {"html": streamed, "partial": True})
+            await job_store.update(job_id, streamed_chars=len(streamed))
+    
+    return on_text
 
 @app.get("/clone/{job_id}/html")
 async def get_cloned_html(job_id: str):
-    if job_id not in jobs:
+    job = await job_store.get(job_id)
+    if job is None:
         raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
     
-    if jobs[job_id]["status"] != "completed":
+    if job["status"] != "completed":
         raise HTTPException(status_code=400, detail=f"Job {job_id} is not completed yet")
     
-    job_result_path = os.path.join("jobs", f"{job_id}.json")
-    
-    if not os.path.exists(job_result_path):
-        raise HTTPException(status_code=404, detail=f"Result file for job {job_id} not found")
+    result = await job_store.get_result(job_id)
     
-    with open(job_result_path, "r") as f:
-        result = json.load(f)
+    if result is None:
+        raise HTTPException(status_code=404, detail=f"Result for job {job_id} not found")
     
     return {"html": result["html"]}
 
@@ -0,0 +1,136 @@
+"""
+Prometheus metrics for the clone pipeline, served at GET /metrics.
+
+Histograms time the stages of a scrape (navigation, each page.evaluate,
+screenshot processing, HTML parsing), cache reads and writes, LLM calls by
+model and the stages of each job; counters track cache lookups, job
+outcomes and tokens. Queue depth and open browsers are gauges refreshed
+from the scheduler and browser pool whenever /metrics is scraped.
+
+The series need the optional prometheus_client package. Without it every
+metric below is a no-op and /metrics answers 503.
+"""
+from contextlib import nullcontext
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+try:
+    from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+    PROMETHEUS_AVAILABLE = True
+except ImportError:
+    PROMETHEUS_AVAILABLE = False
+
+# Seconds; scrape stages and cache operations take milliseconds to a minute
+STAGE_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# LLM calls and whole job stages take seconds to minutes
+LONG_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 20, 30, 45, 60, 90, 120, 180, 300, 600)
+
+
+class _NoopMetric:
+    """Stands in for every metric when prometheus_client is not installed"""
+
+    def labels(self, *args, **kwargs):
+        return self
+
+    def observe(self, value):
+        pass
+
+    def inc(self, amount=1):
+        pass
+
+    def set(self, value):
+        pass
+
+    def time(self):
+        return nullcontext()
+
+
+if PROMETHEUS_AVAILABLE:
+    REGISTRY = CollectorRegistry()
+
+    def _histogram(name, documentation, labels=(), buckets=STAGE_BUCKETS):
+        return Histogram(name, documentation, labels, registry=REGISTRY, buckets=buckets)
+
+    def _counter(name, documentation, labels=()):
+        return Counter(name, documentation, labels, registry=REGISTRY)
+
+    def _gauge(name, documentation, labels=()):
+        return Gauge(name, documentation, labels, registry=REGISTRY)
+else:
+    REGISTRY = None
+    _histogram = _counter = _gauge = lambda *args, **kwargs: _NoopMetric()
+
+
+NAVIGATION_SECONDS = _histogram("clone_navigation_seconds", "Page navigation until the readiness wait is over")
+PAGE_EVALUATE_SECONDS = _histogram(
+    "clone_page_evaluate_seconds", "In-page scripts run with page.evaluate, by script", ["script"]
+)
+SCREENSHOT_PROCESSING_SECONDS = _histogram(
+    "clone_screenshot_processing_seconds", "Downscaling, tiling and storing a scrape's screenshots"
+)
+HTML_PARSING_SECONDS = _histogram(
+    "clone_html_parsing_seconds", "Parsing a scraped page's HTML, with its cross-origin stylesheets"
+)
+CACHE_OPERATION_SECONDS = _histogram(
+    "clone_cache_operation_seconds", "Cache reads and writes, by cache and operation", ["cache", "operation"]
+)
+LLM_REQUEST_SECONDS = _histogram(
+    "clone_llm_request_seconds", "LLM provider calls until the streamed response ends, retries included",
+    ["model"], LONG_BUCKETS
+)
+LLM_RESPONSE_HEADER_SECONDS = _histogram(
+    "clone_llm_response_header_seconds", "LLM provider calls until response headers arrive, retries included",
+    ["model"], LONG_BUCKETS
+)
+JOB_STAGE_SECONDS = _histogram(
+    "clone_job_stage_seconds", "Time jobs spent in each stage: queued, scrape, generate and total",
+    ["stage"], LONG_BUCKETS
+)
+
+CACHE_LOOKUPS = _counter("clone_cache_lookups_total", "Cache lookups, by cache and hit or miss", ["cache", "result"])
+JOBS = _counter("clone_jobs_total", "Jobs finished, by outcome", ["outcome"])
+LLM_TOKENS = _counter("clone_llm_tokens_total", "Tokens used by LLM calls, by model and input or output", ["model", "kind"])
+
+QUEUE_DEPTH = _gauge("clone_queue_depth", "Jobs waiting in the scheduler queue")
+JOBS_RUNNING = _gauge("clone_jobs_running", "Jobs being processed by this process")
+BROWSERS_OPEN = _gauge("clone_browsers_open", "Chromium browsers open in the browser pool, retiring ones included")
+BROWSER_CONTEXTS_OPEN = _gauge("clone_browser_contexts_open", "Browser contexts checked out of the browser pool")
+
+
+def observe_ms(histogram, milliseconds: Optional[float], **labels):
+    """Record a duration measured in milliseconds, as the pipeline's timings are"""
+    if milliseconds is None:
+        return
+    (histogram.labels(**labels) if labels else histogram).observe(milliseconds / 1000)
+
+
+def nearest_rank(ordered: Sequence[float], quantile: float) -> float:
+    """Nearest-rank quantile (0-1) of already sorted, non-empty samples"""
+    return ordered[min(int(quantile * len(ordered)), len(ordered) - 1)]
+
+
+def percentiles(samples, scale: float = 1.0, digits: int = 2) -> Dict[str, Optional[float]]:
+    """Nearest-rank p50/p95/p99 of samples, multiplied by scale (e.g. 1000 for seconds to ms) and rounded"""
+    if not samples:
+        return {"p50": None, "p95": None, "p99": None}
+    ordered = sorted(samples)
+    return {name: round(nearest_rank(ordered, q) * scale, digits) for name, q in (("p50", 0.50), ("p95", 0.95), ("p99", 0.99))}
+
+
+def record_tokens(model: str, usage: Dict[str, Any]):
+    """Count the tokens of one LLM call"""
+    for kind in ("input", "output"):
+        if usage.get(f"{kind}_tokens"):
+            LLM_TOKENS.labels(model=model, kind=kind).inc(usage[f"{kind}_tokens"])
+
+
+def update_gauges(scheduler_stats: Dict[str, Any], browser_pool_stats: Dict[str, Any]):
+    """Refresh the gauges from the scheduler's and browser pool's stats"""
+    QUEUE_DEPTH.set(scheduler_stats["queue_depth"])
+    JOBS_RUNNING.set(scheduler_stats["running"])
+    BROWSERS_OPEN.set(browser_pool_stats["open_browsers"])
+    BROWSER_CONTEXTS_OPEN.set(browser_pool_stats["open_contexts"])
+
+
+def render() -> Tuple[bytes, str]:
+    """(body, content type) of the metrics in the Prometheus text format"""
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
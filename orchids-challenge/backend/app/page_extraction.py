@@ -0,0 +1,471 @@
+"""
+In-page extraction script run by WebsiteScraper after navigation.
+
+Everything the scraper needs from the live DOM (stylesheets, css_rules,
+computed_styles, colors, fonts and layout) is collected by a single
+page.evaluate call that walks the DOM once and calls getComputedStyle at
+most once per element.
+"""
+import json
+from collections import Counter
+from typing import Dict, Any, List
+
+EXTRACTION_SCRIPT = r'''
+() => {
+    const timings = {};
+    const startedAt = performance.now();
+    let phaseStart = startedAt;
+
+    function endPhase(name) {
+        const now = performance.now();
+        timings[name] = Math.round((now - phaseStart) * 100) / 100;
+        phaseStart = now;
+    }
+
+    // ---- Stylesheets and CSS rules (no DOM walk needed) ----
+    const stylesheets = [];
+    const cssRules = [];
+    const unreadableStylesheets = [];
+    for (const sheet of Array.from(document.styleSheets)) {
+        if (sheet.href) stylesheets.push(sheet.href);
+        try {
+            if (sheet.cssRules) {
+                for (const rule of Array.from(sheet.cssRules)) {
+                    cssRules.push({
+                        selectorText: rule.selectorText || null,
+                        cssText: rule.cssText || null
+                    });
+                }
+            }
+        } catch (e) {
+            // Cross-origin stylesheets can't be read here; the scraper fetches
+            // them and splices their rules in at this position
+            if (sheet.href) {
+                unreadableStylesheets.push({
+                    href: sheet.href,
+                    index: cssRules.length,
+                    media: sheet.media ? sheet.media.mediaText : ''
+                });
+            }
+        }
+    }
+    endPhase('stylesheets_ms');
+
+    // ---- Per-element caches so each element is styled and measured once ----
+    const styleCache = new Map();
+    const rectCache = new Map();
+
+    function styleOf(el) {
+        let style = styleCache.get(el);
+        if (style === undefined) {
+            style = window.getComputedStyle(el);
+            styleCache.set(el, style);
+        }
+        return style;
+    }
+
+    function rectOf(el) {
+        let rect = rectCache.get(el);
+        if (rect === undefined) {
+            rect = el.getBoundingClientRect();
+            rectCache.set(el, rect);
+        }
+        return rect;
+    }
+
+    function classNameOf(el) {
+        // Handle SVG elements specially (SVGAnimatedString issue)
+        if (el.className && typeof el.className === 'object' && el.className.baseVal !== undefined) {
+            return el.className.baseVal;
+        } else if (el.className) {
+            return el.className.toString();
+        }
+        return null;
+    }
+
+    function positionOf(el) {
+        const rect = rectOf(el);
+        return { x: rect.x, y: rect.y, width: rect.width, height: rect.height };
+    }
+
+    // ---- Single DOM walk: colors, fonts, layout and selector matches ----
+    const TRANSPARENT = 'rgba(0, 0, 0, 0)';
+    const MAX_LAYOUT_DEPTH = 5;
+    const keySelectors = [
+        'body', 'header', 'footer', 'nav', 'main', 'aside', 'section', 'article',
+        '.header', '.footer', '.navigation', '.container', '.wrapper', '.content', '.sidebar',
+        '.hero', '.banner', '#header', '#footer', '#nav', '#content', '#main', '#sidebar',
+        '.btn', 'button', 'a.button', '.menu', '.card', '.alert', '.notification',
+        'form', 'input', 'select', 'textarea', '.form-control', '.input-group',
+        '.modal', '.dialog', '.overlay', '.popup', '.tooltip',
+        'table', 'tr', 'td', 'th', '.table',
+        'img', 'video', 'audio', 'iframe', '.media', '.image',
+        '.row', '.col', '.column', '.grid', '.flex',
+        'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'p', 'a', 'span', 'div'
+    ];
+    const colors = new Set();
+    const fonts = new Set();
+    const selectorMatches = new Map();
+    const domIndex = new Map();
+    let elementCount = 0;
+    let layoutRoot = null;
+
+    function isVisible(el) {
+        const rect = rectOf(el);
+        const style = styleOf(el);
+        return rect.width > 0 &&
+               rect.height > 0 &&
+               style.display !== 'none' &&
+               style.visibility !== 'hidden';
+    }
+
+    function matchSelectors(el) {
+        for (const selector of keySelectors) {
+            try {
+                if (el.matches(selector)) {
+                    let matched = selectorMatches.get(selector);
+                    if (!matched) {
+                        matched = [];
+                        selectorMatches.set(selector, matched);
+                    }
+                    matched.push(el);
+                }
+            } catch (e) {
+                // Invalid selector for this document, ignore
+            }
+        }
+    }
+
+    // layoutDepth: depth of this element in the layout tree, or -1 when the
+    // element is outside it. Returns the element's layout node (or null).
+    function visit(el, layoutDepth) {
+        domIndex.set(el, elementCount++);
+        const style = styleOf(el);
+
+        const color = style.getPropertyValue('color');
+        const bgColor = style.getPropertyValue('background-color');
+        const borderColor = style.getPropertyValue('border-color');
+        if (color && color !== TRANSPARENT) colors.add(color);
+        if (bgColor && bgColor !== TRANSPARENT) colors.add(bgColor);
+        if (borderColor && borderColor !== TRANSPARENT) colors.add(borderColor);
+
+        const fontFamily = style.getPropertyValue('font-family');
+        if (fontFamily) fonts.add(fontFamily);
+
+        matchSelectors(el);
+
+        let node = null;
+        let childDepth = -1;
+        if (el === document.body) {
+            // The body is the layout root; its children start at depth 1
+            node = { children: [] };
+            layoutRoot = node;
+            childDepth = 1;
+        } else if (layoutDepth > 0 && isVisible(el)) {
+            node = {
+                tag: el.tagName.toLowerCase(),
+                id: el.id || null,
+                className: classNameOf(el),
+                position: positionOf(el),
+                children: layoutDepth > MAX_LAYOUT_DEPTH ? null : []
+            };
+            childDepth = layoutDepth > MAX_LAYOUT_DEPTH ? -1 : layoutDepth + 1;
+        }
+
+        for (const child of el.children) {
+            const childNode = visit(child, childDepth);
+            if (childNode && childDepth > 0) node.children.push(childNode);
+        }
+        return node;
+    }
+
+    visit(document.documentElement, -1);
+    const layout = {
+        width: window.innerWidth,
+        height: window.innerHeight,
+        structure: layoutRoot ? layoutRoot.children : []
+    };
+    endPhase('dom_walk_ms');
+
+    // ---- Computed-style samples for the matched key elements ----
+    const properties = [
+        'color', 'background-color', 'background-image', 'font-family', 'font-size', 'font-weight',
+        'padding', 'padding-top', 'padding-right', 'padding-bottom', 'padding-left',
+        'margin', 'margin-top', 'margin-right', 'margin-bottom', 'margin-left',
+        'border', 'border-radius', 'border-top', 'border-right', 'border-bottom', 'border-left',
+        'width', 'height', 'max-width', 'max-height', 'min-width', 'min-height',
+        'display', 'position', 'top', 'right', 'bottom', 'left', 'z-index',
+        'flex-direction', 'flex-wrap', 'justify-content', 'align-items', 'align-content', 'flex-grow',
+        'grid-template-columns', 'grid-template-rows', 'grid-gap',
+        'text-align', 'line-height', 'letter-spacing', 'text-decoration', 'text-transform',
+        'box-shadow', 'opacity', 'transform', 'transition', 'animation',
+        'overflow', 'visibility'
+    ];
+
+    // Identical style dicts are stored once in a shared table and referenced
+    // by index; each element is captured once and keyed by its DOM-order id.
+    // Table entries only hold the properties that differ from base_style.
+    const styleValues = [];
+    const styleIndex = new Map();
+    const nodes = {};
+    const nodeDepth = new Map();
+
+    function styleRefOf(el) {
+        const style = styleOf(el);
+        const values = properties.map(prop => style.getPropertyValue(prop));
+        const signature = JSON.stringify(values);
+        let index = styleIndex.get(signature);
+        if (index === undefined) {
+            index = styleValues.length;
+            styleValues.push(values);
+            styleIndex.set(signature, index);
+        }
+        return index;
+    }
+
+    function compactText(element) {
+        const text = element.textContent;
+        if (!text) return null;
+        return text.substring(0, 200).replace(/\s+/g, ' ').trim().substring(0, 100) || null;
+    }
+
+    function compactPosition(el) {
+        const rect = rectOf(el);
+        const round = v => Math.round(v * 10) / 10;
+        return { x: round(rect.x), y: round(rect.y), width: round(rect.width), height: round(rect.height) };
+    }
+
+    const STRUCTURAL_TAGS = new Set(['BODY', 'HEADER', 'FOOTER', 'NAV', 'MAIN', 'ASIDE', 'SECTION', 'ARTICLE']);
+    const INTERACTIVE_TAGS = new Set(['BUTTON', 'A', 'INPUT', 'SELECT', 'TEXTAREA']);
+
+    function captureElement(element, depth = 0, maxDepth = 3) {
+        if (depth > maxDepth || !element) return null;
+
+        // Skip script/style tags
+        if (element.tagName === 'SCRIPT' || element.tagName === 'STYLE') return null;
+
+        const nodeId = String(domIndex.get(element));
+        const seenDepth = nodeDepth.get(nodeId);
+        // Already captured at this depth or shallower, so its children are complete
+        if (seenDepth !== undefined && seenDepth <= depth) return nodeId;
+        nodeDepth.set(nodeId, depth);
+
+        let info = nodes[nodeId];
+        const className = classNameOf(element);
+        if (!info) {
+            // Null, empty and false fields are omitted to keep entries small
+            info = {
+                tagName: element.tagName.toLowerCase(),
+                style: styleRefOf(element),
+                position: compactPosition(element)
+            };
+            if (element.id) info.id = element.id;
+            if (className) info.className = className;
+            const text = compactText(element);
+            if (text) info.text = text;
+            if (element.attributes.length > 0) {
+                info.attributes = {};
+                for (const attr of element.attributes) {
+                    info.attributes[attr.name] = attr.value;
+                }
+            }
+            if (INTERACTIVE_TAGS.has(element.tagName) ||
+                element.getAttribute('role') === 'button' ||
+                element.getAttribute('onclick') !== null) {
+                info.isInteractive = true;
+            }
+            nodes[nodeId] = info;
+        }
+
+        // Get important child elements (for key structural elements only)
+        if (STRUCTURAL_TAGS.has(element.tagName) ||
+            element.id ||
+            (className && className.includes('container'))) {
+            info.children = [];
+            for (const child of element.children) {
+                const childId = captureElement(child, depth + 1, maxDepth);
+                if (childId !== null) info.children.push(childId);
+            }
+        }
+
+        return nodeId;
+    }
+
+    const selectors = {};
+    for (const selector of keySelectors) {
+        const matched = selectorMatches.get(selector);
+        if (matched && matched.length > 0) {
+            selectors[selector] = matched.map(el => captureElement(el)).filter(id => id !== null);
+        }
+    }
+    // Base style: the most common value of each property across the table
+    const baseStyle = {};
+    properties.forEach((prop, i) => {
+        const counts = new Map();
+        let best = null;
+        let bestCount = 0;
+        for (const values of styleValues) {
+            const count = (counts.get(values[i]) || 0) + 1;
+            counts.set(values[i], count);
+            if (count > bestCount) {
+                best = values[i];
+                bestCount = count;
+            }
+        }
+        if (best !== null) baseStyle[prop] = best;
+    });
+    const styleTable = styleValues.map(values => {
+        const diff = {};
+        properties.forEach((prop, i) => {
+            if (values[i] !== baseStyle[prop]) diff[prop] = values[i];
+        });
+        return diff;
+    });
+
+    const computedStyles = {
+        format: 'normalized-v1',
+        base_style: baseStyle,
+        styles: styleTable,
+        nodes: nodes,
+        selectors: selectors
+    };
+    endPhase('computed_styles_ms');
+
+    timings.element_count = elementCount;
+    timings.captured_node_count = nodeDepth.size;
+    timings.style_table_size = styleTable.length;
+    timings.total_ms = Math.round((performance.now() - startedAt) * 100) / 100;
+
+    return {
+        stylesheets: stylesheets,
+        css_rules: cssRules,
+        unreadable_stylesheets: unreadableStylesheets,
+        computed_styles: computedStyles,
+        colors: Array.from(colors),
+        fonts: Array.from(fonts),
+        layout: layout,
+        timings: timings
+    };
+}
+'''
+
+# Marker stored in computed_styles by EXTRACTION_SCRIPT
+NORMALIZED_STYLES_FORMAT = 'normalized-v1'
+
+# Defaults for node fields omitted from normalized entries
+_NODE_DEFAULTS = {'id': None, 'className': None, 'text': None, 'attributes': {}, 'isInteractive': False}
+
+
+def is_normalized_styles(computed_styles) -> bool:
+    """Whether computed_styles uses the normalized node/style-table format"""
+    return isinstance(computed_styles, dict) and computed_styles.get('format') == NORMALIZED_STYLES_FORMAT
+
+
+def normalize_computed_styles(computed_styles):
+    """
+    Convert legacy computed_styles (selector -> list of full element trees)
+    into the normalized format produced by EXTRACTION_SCRIPT.
+
+    Legacy entries carry no element identity, so elements are matched on
+    their tag, id, class, text, attributes and position.
+    """
+    if not computed_styles or is_normalized_styles(computed_styles):
+        return computed_styles
+
+    style_values = []
+    style_index = {}
+    nodes = {}
+    node_keys = {}
+
+    def capture(info):
+        if not info:
+            return None
+        position = info.get('position') or {}
+        key = json.dumps([
+            info.get('tagName'), info.get('id'), info.get('className'), info.get('text'),
+            info.get('attributes'), position.get('x'), position.get('y'),
+            position.get('width'), position.get('height'),
+        ], sort_keys=True)
+        node_id = node_keys.get(key)
+        if node_id is None:
+            node_id = str(len(node_keys))
+            node_keys[key] = node_id
+            style = info.get('styles') or {}
+            signature = json.dumps(style, sort_keys=True)
+            if signature not in style_index:
+                style_index[signature] = len(style_values)
+                style_values.append(style)
+            node = {
+                'tagName': info.get('tagName'),
+                'style': style_index[signature],
+                'position': {k: round(v, 1) for k, v in position.items()},
+            }
+            text = ' '.join((info.get('text') or '').split())
+            for field, value in (('id', info.get('id')), ('className', info.get('className')),
+                                 ('text', text), ('attributes', info.get('attributes')),
+                                 ('isInteractive', info.get('isInteractive'))):
+                if value:
+                    node[field] = value
+            nodes[node_id] = node
+        if 'children' in info:
+            children = [c for c in (capture(child) for child in info['children']) if c is not None]
+            existing = nodes[node_id].get('children')
+            # Keep the most complete child list seen for this element
+            if existing is None or len(children) > len(existing):
+                nodes[node_id]['children'] = children
+        return node_id
+
+    selectors = {}
+    for selector, elements in computed_styles.items():
+        selectors[selector] = [node_id for node_id in (capture(el) for el in elements) if node_id is not None]
+
+    # Style table entries only hold the properties that differ from the base style
+    base_style = {}
+    for prop in (style_values[0] if style_values else {}):
+        counts = Counter(values.get(prop) for values in style_values)
+        base_style[prop] = counts.most_common(1)[0][0]
+    styles = [
+        {prop: value for prop, value in values.items() if base_style.get(prop) != value}
+        for values in style_values
+    ]
+
+    return {
+        'format': NORMALIZED_STYLES_FORMAT,
+        'base_style': base_style,
+        'styles': styles,
+        'nodes': nodes,
+        'selectors': selectors,
+    }
+
+
+def resolve_node_styles(computed_styles, node_id: str) -> Dict[str, str]:
+    """Full computed style dict for a node of a normalized entry"""
+    node = computed_styles['nodes'][node_id]
+    return {**computed_styles.get('base_style', {}), **computed_styles['styles'][node['style']]}
+
+
+def resolve_selector_styles(computed_styles, selector: str, max_depth: int = 3) -> List[Dict[str, Any]]:
+    """
+    Return the elements matched by a key selector as element dicts with their
+    styles and children inlined (the legacy shape), for either format.
+    """
+    if not computed_styles:
+        return []
+    if not is_normalized_styles(computed_styles):
+        return computed_styles.get(selector, [])
+
+    nodes = computed_styles['nodes']
+
+    def expand(node_id, depth):
+        node = nodes.get(node_id)
+        if node is None:
+            return None
+        info = {**_NODE_DEFAULTS, **{k: v for k, v in node.items() if k not in ('style', 'children')}}
+        info['styles'] = resolve_node_styles(computed_styles, node_id)
+        if 'children' in node:
+            info['children'] = [] if depth >= max_depth else [
+                child for child in (expand(c, depth + 1) for c in node['children']) if child is not None
+            ]
+        return info
+
+    return [expand(node_id, 0) for node_id in computed_styles['selectors'].get(selector, [])]
@@ -0,0 +1,274 @@
+"""
+Page navigation for the scraper: resource blocking and readiness detection.
+
+Requests for analytics, ads, media and (optionally) fonts are aborted
+through Playwright routing. Instead of waiting for "networkidle", which
+never comes on pages with trackers or long-polls, the default readiness
+strategy waits until the DOM has stopped changing, with a hard cap. The
+network keeps being watched while the page is captured, so the report can
+say how much sooner the page was ready than networkidle would have been.
+"""
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlparse
+
+from .metrics import PAGE_EVALUATE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+BLOCKABLE_RESOURCES = ("analytics", "ads", "media", "fonts")
+READINESS_STRATEGIES = ("quiescence", "networkidle", "load", "domcontentloaded")
+
+# Breakpoints a page can be captured at; the widest requested one is loaded
+# first and the page is then resized to each of the others
+VIEWPORTS = {
+    "desktop": {"width": 1920, "height": 1080},
+    "tablet": {"width": 820, "height": 1180},
+    "mobile": {"width": 390, "height": 844},
+}
+
+# Longest wait for the page to settle after a resize
+RESIZE_SETTLE_MAX_MS = 3000
+
+# Third-party hosts (and their subdomains) that never affect how a page looks
+ANALYTICS_HOSTS = frozenset({
+    "google-analytics.com", "googletagmanager.com", "analytics.google.com",
+    "segment.com", "segment.io", "mixpanel.com", "amplitude.com", "heapanalytics.com",
+    "hotjar.com", "hotjar.io", "fullstory.com", "clarity.ms", "plausible.io",
+    "posthog.com", "mouseflow.com", "newrelic.com", "nr-data.net", "sentry.io",
+    "connect.facebook.net", "bat.bing.com", "snap.licdn.com", "static.ads-twitter.com",
+    "px.ads.linkedin.com", "stats.wp.com", "cdn.vercel-insights.com",
+})
+AD_HOSTS = frozenset({
+    "doubleclick.net", "googlesyndication.com", "googleadservices.com", "adservice.google.com",
+    "amazon-adsystem.com", "adnxs.com", "criteo.com", "criteo.net", "taboola.com",
+    "outbrain.com", "pubmatic.com", "rubiconproject.com", "openx.net", "adsrvr.org",
+    "moatads.com", "scorecardresearch.com", "quantserve.com",
+})
+
+# Same threshold Playwright uses for "networkidle"
+NETWORK_IDLE_SECONDS = 0.5
+
+# Resolves once no DOM mutation has been seen for quietMs after the load
+# event, or when maxWaitMs runs out
+QUIESCENCE_SCRIPT = r'''
+async ({quietMs, maxWaitMs}) => {
+    const startedAt = performance.now();
+    let lastMutation = startedAt;
+    let mutations = 0;
+    const observer = new MutationObserver(records => {
+        mutations += records.length;
+        lastMutation = performance.now();
+    });
+    observer.observe(document, {subtree: true, childList: true, attributes: true, characterData: true});
+    try {
+        while (true) {
+            const now = performance.now();
+            if (document.readyState === 'complete' && now - lastMutation >= quietMs) {
+                return {quiet: true, mutations, waited_ms: Math.round(now - startedAt)};
+            }
+            if (now - startedAt >= maxWaitMs) {
+                return {quiet: false, mutations, waited_ms: Math.round(now - startedAt)};
+            }
+            await new Promise(resolve => setTimeout(resolve, 50));
+        }
+    } finally {
+        observer.disconnect();
+    }
+}
+'''
+
+
+def page_load_options(overrides: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Navigation and capture settings from the environment, with per-request overrides applied"""
+    options = {
+        "viewports": _split(os.getenv("SCRAPE_VIEWPORTS", "desktop")),
+        "block_resources": _split(os.getenv("SCRAPE_BLOCK_RESOURCES", "analytics,ads,media")),
+        "wait_until": os.getenv("SCRAPE_WAIT_UNTIL", "quiescence").lower(),
+        "quiet_ms": int(os.getenv("SCRAPE_QUIET_MS", "500")),
+        "max_wait_ms": int(os.getenv("SCRAPE_MAX_WAIT_MS", "10000")),
+    }
+    options.update({key: value for key, value in (overrides or {}).items() if value is not None})
+    unknown = set(options["block_resources"]) - set(BLOCKABLE_RESOURCES)
+    if unknown:
+        raise ValueError(f"Unknown resource categories to block: {sorted(unknown)}")
+    unknown = set(options["viewports"]) - set(VIEWPORTS)
+    if unknown or not options["viewports"]:
+        raise ValueError(f"Unknown or missing viewports: {sorted(unknown)}")
+    if options["wait_until"] not in READINESS_STRATEGIES:
+        raise ValueError(f"Unsupported readiness strategy: {options['wait_until']}")
+    return options
+
+
+def ordered_viewports(names: List[str]) -> List[str]:
+    """Viewport names without duplicates, widest first"""
+    return sorted(set(names), key=lambda name: -VIEWPORTS[name]["width"])
+
+
+def _split(value: str) -> List[str]:
+    return [item.strip().lower() for item in value.split(",") if item.strip()]
+
+
+def _host_in(host: str, domains: frozenset) -> bool:
+    """Whether host is one of domains or a subdomain of one"""
+    parts = host.split(".")
+    return any(".".join(parts[i:]) in domains for i in range(len(parts) - 1))
+
+
+def classify_request(url: str, resource_type: str) -> Optional[str]:
+    """Blockable category of a request, or None if the page may need it"""
+    host = (urlparse(url).hostname or "").lower()
+    if _host_in(host, AD_HOSTS):
+        return "ads"
+    if resource_type == "ping" or _host_in(host, ANALYTICS_HOSTS):
+        return "analytics"
+    if resource_type == "media":
+        return "media"
+    if resource_type == "font":
+        return "fonts"
+    return None
+
+
+class PageLoad:
+    """
+    One navigation of a page under the given load options.
+
+    Blocking is installed as a page route before navigating. Network
+    activity is tracked for the life of the page, so report() called after
+    the page has been captured can compare when the page was considered
+    ready with when networkidle fired; if it never fired while we watched,
+    the saving reported is a lower bound.
+    """
+
+    def __init__(self, page, options: Dict[str, Any]):
+        self.page = page
+        self.options = options
+        self.block = frozenset(options["block_resources"])
+        self.blocked: Dict[str, int] = {}
+        self.requests = 0
+        self.quiescence: Optional[Dict[str, Any]] = None
+        # Response headers of the main document, for revalidating it later
+        self.document_headers: Dict[str, str] = {}
+
+        self._started: Optional[float] = None
+        self._ready_at: Optional[float] = None
+        self._loaded_at: Optional[float] = None
+        self._network_idle_at: Optional[float] = None
+        self._in_flight = 0
+        self._idle_generation = 0
+
+    async def goto(self, url: str, timeout_ms: int = 60000):
+        """Navigate to url and return once the page is ready under the configured strategy"""
+        if self.block:
+            await self.page.route("**/*", self._route)
+        self.page.on("request", self._on_request)
+        self.page.on("requestfinished", self._on_request_done)
+        self.page.on("requestfailed", self._on_request_done)
+        self.page.on("load", self._on_load)
+
+        strategy = self.options["wait_until"]
+        self._started = time.monotonic()
+        if strategy != "quiescence":
+            response = await self.page.goto(url, wait_until=strategy, timeout=timeout_ms)
+        else:
+            response = await self.page.goto(url, wait_until="domcontentloaded", timeout=timeout_ms)
+            await self._wait_for_quiescence()
+        if response is not None:
+            self.document_headers = dict(response.headers)
+        self._ready_at = time.monotonic()
+
+    async def resize(self, viewport: Dict[str, int]) -> Dict[str, Any]:
+        """Resize the loaded page and wait until its DOM settles at the new size"""
+        await self.page.set_viewport_size(viewport)
+        with PAGE_EVALUATE_SECONDS.labels(script="resize_settle").time():
+            return await self.page.evaluate(QUIESCENCE_SCRIPT, {
+                "quietMs": min(self.options["quiet_ms"], RESIZE_SETTLE_MAX_MS),
+                "maxWaitMs": min(self.options["max_wait_ms"], RESIZE_SETTLE_MAX_MS),
+            })
+
+    async def _wait_for_quiescence(self):
+        deadline = self._started + self.options["max_wait_ms"] / 1000
+        while True:
+            remaining_ms = max(0, int((deadline - time.monotonic()) * 1000))
+            try:
+                with PAGE_EVALUATE_SECONDS.labels(script="quiescence").time():
+                    self.quiescence = await self.page.evaluate(
+                        QUIESCENCE_SCRIPT, {"quietMs": self.options["quiet_ms"], "maxWaitMs": remaining_ms}
+                    )
+                if not self.quiescence["quiet"]:
+                    logger.info(f"DOM of {self.page.url} still changing after {self.options['max_wait_ms']}ms, capturing anyway")
+                return
+            except Exception as e:
+                # A client-side redirect destroys the context the script runs in; wait on the new document
+                if "context was destroyed" not in str(e) or remaining_ms == 0:
+                    raise
+                await self.page.wait_for_load_state("domcontentloaded")
+
+    async def _route(self, route):
+        request = route.request
+        category = classify_request(request.url, request.resource_type)
+        if category in self.block and not request.is_navigation_request():
+            self.blocked[category] = self.blocked.get(category, 0) + 1
+            await route.abort("blockedbyclient")
+        else:
+            await route.continue_()
+
+    def _on_request(self, request):
+        self.requests += 1
+        self._in_flight += 1
+        self._idle_generation += 1
+
+    def _on_request_done(self, request):
+        self._in_flight = max(0, self._in_flight - 1)
+        if self._in_flight == 0:
+            self._start_idle_timer()
+
+    def _on_load(self, page):
+        self._loaded_at = time.monotonic()
+        if self._in_flight == 0:
+            self._start_idle_timer()
+
+    def _start_idle_timer(self):
+        self._idle_generation += 1
+        generation, idle_since = self._idle_generation, time.monotonic()
+        asyncio.get_running_loop().call_later(NETWORK_IDLE_SECONDS, self._idle_elapsed, generation, idle_since)
+
+    def _idle_elapsed(self, generation: int, idle_since: float):
+        # Like Playwright's networkidle: after load, 500ms without a request in flight
+        if (generation == self._idle_generation and self._loaded_at is not None
+                and self._network_idle_at is None):
+            self._network_idle_at = idle_since + NETWORK_IDLE_SECONDS
+
+    def report(self) -> Dict[str, Any]:
+        """How the page was loaded and how long that saved against waiting for networkidle"""
+        to_ms = lambda moment: round((moment - self._started) * 1000, 2) if moment is not None else None
+        ready_ms = to_ms(self._ready_at)
+        network_idle_ms = to_ms(self._network_idle_at)
+        if self.options["wait_until"] == "networkidle":
+            saved_ms, lower_bound = 0.0, False
+        elif network_idle_ms is not None:
+            saved_ms, lower_bound = max(0.0, round(network_idle_ms - ready_ms, 2)), False
+        else:
+            # The network was still busy when we stopped watching
+            saved_ms, lower_bound = max(0.0, round(to_ms(time.monotonic()) - ready_ms, 2)), True
+        return {
+            "wait_until": self.options["wait_until"],
+            "ready_ms": ready_ms,
+            "load_event_ms": to_ms(self._loaded_at),
+            "network_idle_ms": network_idle_ms,
+            "saved_ms": saved_ms,
+            "saved_ms_is_lower_bound": lower_bound,
+            "quiescence": self.quiescence,
+            "requests": self.requests,
+            "blocked": dict(self.blocked),
+        }
+
+
+def describe(report: Dict[str, Any]) -> str:
+    """One-line summary of a navigation report for logs and job messages"""
+    saved = f"{'>=' if report['saved_ms_is_lower_bound'] else ''}{report['saved_ms']:.0f}ms"
+    return (f"ready in {report['ready_ms']:.0f}ms via {report['wait_until']}, "
+            f"{saved} sooner than networkidle, {sum(report['blocked'].values())} requests blocked")
@@ -0,0 +1,219 @@
+import asyncio
+import logging
+import os
+import random
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, Optional
+
+import httpx
+
+from .metrics import LLM_REQUEST_SECONDS, LLM_RESPONSE_HEADER_SECONDS, percentiles
+
+logger = logging.getLogger(__name__)
+
+# HTTP/2 needs the optional h2 package; without it the client speaks HTTP/1.1
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# Responses worth retrying: rate limiting, overload and transient server errors
+RETRYABLE_STATUS_CODES = (408, 429, 500, 502, 503, 504, 529)
+
+
+class _ProviderMetrics:
+    """Rolling request statistics for one provider"""
+
+    def __init__(self, window: int = 500):
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.status_codes: Dict[int, int] = {}
+        # Seconds until response headers, and until the response was fully consumed
+        self.header_latencies = deque(maxlen=window)
+        self.total_latencies = deque(maxlen=window)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "retries": self.retries,
+            "error_rate": self.errors / self.requests if self.requests else 0.0,
+            "status_codes": dict(self.status_codes),
+            "header_latency_ms": percentiles(self.header_latencies, scale=1000, digits=1),
+            "total_latency_ms": percentiles(self.total_latencies, scale=1000, digits=1),
+        }
+
+
+class ProviderClient:
+    """
+    Long-lived HTTP client shared by all calls to the LLM providers.
+
+    One pooled httpx client (HTTP/2 when available) keeps connections alive
+    between jobs. Each provider has its own concurrency semaphore, and
+    requests that fail with a connection error, 429 or 5xx are retried with
+    exponential backoff and full jitter, waiting at least as long as the
+    response's Retry-After. Only the attempt that gets response headers is
+    handed to the caller, so a streamed body is never replayed.
+    """
+
+    def __init__(
+        self,
+        max_connections: Optional[int] = None,
+        max_keepalive_connections: Optional[int] = None,
+        max_retries: Optional[int] = None,
+        backoff_base: float = 0.5,
+        backoff_max: float = 30.0,
+        timeout: float = 120.0,
+    ):
+        self.max_connections = max_connections or int(os.getenv("LLM_MAX_CONNECTIONS", "20"))
+        self.max_keepalive_connections = max_keepalive_connections or int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "10"))
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv("LLM_MAX_RETRIES", "3"))
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+
+        self._client: Optional[httpx.AsyncClient] = None
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._concurrency: Dict[str, int] = {}
+        self._metrics: Dict[str, _ProviderMetrics] = {}
+
+    async def start(self):
+        """Create the pooled client"""
+        if self._client is not None:
+            return
+        self._client = httpx.AsyncClient(
+            http2=HTTP2_AVAILABLE,
+            limits=httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_keepalive_connections,
+                keepalive_expiry=60.0,
+            ),
+            timeout=httpx.Timeout(self.timeout, connect=10.0),
+        )
+        logger.info(
+            f"Provider HTTP client started: {self.max_connections} connections, "
+            f"{'HTTP/2' if HTTP2_AVAILABLE else 'HTTP/1.1'}, {self.max_retries} retries"
+        )
+
+    async def stop(self):
+        """Close the pooled client and its connections"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def concurrency(self, provider: str) -> int:
+        """Concurrent request limit for a provider, from LLM_CONCURRENCY_<PROVIDER>"""
+        if provider not in self._concurrency:
+            self._concurrency[provider] = int(os.getenv(f"LLM_CONCURRENCY_{provider.upper()}", "4"))
+        return self._concurrency[provider]
+
+    @asynccontextmanager
+    async def stream(self, provider: str, method: str, url: str, **kwargs):
+        """
+        Send a request with retries and yield the streamed response.
+
+        A provider concurrency slot is held while each attempt is in flight,
+        but not while backing off between retries, and until the block exits.
+        Non-retryable error responses are yielded as-is for the caller to
+        report; the last retryable one is yielded once retries run out.
+        """
+        if self._client is None:
+            await self.start()
+        metrics = self._metrics.setdefault(provider, _ProviderMetrics())
+        semaphore = self._semaphores.setdefault(provider, asyncio.Semaphore(self.concurrency(provider)))
+
+        started = time.monotonic()
+        # Returns holding the provider's slot, released below once the response is done
+        response = await self._send_with_retries(provider, metrics, semaphore, method, url, **kwargs)
+        try:
+            metrics.header_latencies.append(time.monotonic() - started)
+            LLM_RESPONSE_HEADER_SECONDS.labels(model=provider).observe(metrics.header_latencies[-1])
+            metrics.status_codes[response.status_code] = metrics.status_codes.get(response.status_code, 0) + 1
+            if response.status_code >= 400:
+                metrics.errors += 1
+            try:
+                yield response
+            except BaseException:
+                if response.status_code < 400:
+                    metrics.errors += 1
+                raise
+            finally:
+                await response.aclose()
+                metrics.total_latencies.append(time.monotonic() - started)
+                LLM_REQUEST_SECONDS.labels(model=provider).observe(metrics.total_latencies[-1])
+        finally:
+            semaphore.release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "http2": HTTP2_AVAILABLE,
+            "max_connections": self.max_connections,
+            "providers": {
+                provider: {**metrics.to_dict(), "concurrency": self.concurrency(provider)}
+                for provider, metrics in self._metrics.items()
+            },
+        }
+
+    async def _send_with_retries(self, provider, metrics, semaphore, method, url, **kwargs) -> httpx.Response:
+        """
+        Send a request, retrying transport errors and retryable statuses.
+
+        The semaphore is acquired for each attempt and released before
+        backing off, so requests waiting out a Retry-After do not hold a
+        slot other jobs could use. The returned response still holds it.
+        """
+        attempt = 0
+        while True:
+            metrics.requests += 1
+            request = self._client.build_request(method, url, **kwargs)
+            await semaphore.acquire()
+            try:
+                response = await self._client.send(request, stream=True)
+            except httpx.TransportError as e:
+                semaphore.release()
+                if attempt >= self.max_retries:
+                    metrics.errors += 1
+                    raise
+                delay = self._backoff(attempt)
+                logger.warning(f"[{provider}] {type(e).__name__} on attempt {attempt + 1}, retrying in {delay:.1f}s")
+            except BaseException:
+                semaphore.release()
+                raise
+            else:
+                if response.status_code not in RETRYABLE_STATUS_CODES or attempt >= self.max_retries:
+                    return response
+                delay = max(self._backoff(attempt), self._retry_after(response))
+                logger.warning(f"[{provider}] HTTP {response.status_code} on attempt {attempt + 1}, retrying in {delay:.1f}s")
+                metrics.status_codes[response.status_code] = metrics.status_codes.get(response.status_code, 0) + 1
+                try:
+                    await response.aclose()
+                finally:
+                    semaphore.release()
+            # Failed attempts count as errors even if a retry succeeds
+            metrics.errors += 1
+            metrics.retries += 1
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    def _backoff(self, attempt: int) -> float:
+        """Exponential backoff with full jitter"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def _retry_after(self, response: httpx.Response) -> float:
+        """Seconds the server asked us to wait, capped at backoff_max"""
+        value = response.headers.get("retry-after")
+        if not value:
+            return 0.0
+        try:
+            seconds = float(value)
+        except ValueError:
+            try:
+                seconds = parsedate_to_datetime(value).timestamp() - time.time()
+            except (TypeError, ValueError):
+                return 0.0
+        return min(max(seconds, 0.0), self.backoff_max)
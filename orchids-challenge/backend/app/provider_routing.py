@@ -0,0 +1,266 @@
+"""
+Routing of clone generations across the LLM providers.
+
+ProviderClient retries transient HTTP failures within one provider; this
+layer sits above it and decides which provider generates a clone. When no
+model is requested, providers are picked at random weighted by their
+rolling first-token latency and error rate. A generation that fails falls
+back to the next provider. With hedging on, a second provider is started
+if the first has not produced its first token within a high percentile of
+its usual first-token latency; whichever streams first wins and the other
+is cancelled.
+
+Text is forwarded to the caller from one attempt only. If that attempt
+fails after streaming, the fallback runs without streaming and the caller
+relies on the final result.
+"""
+import asyncio
+import logging
+import os
+import random
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from .metrics import nearest_rank, percentiles
+
+logger = logging.getLogger(__name__)
+
+# Completed generations a provider needs before its stats steer routing or hedging
+MIN_ROUTING_SAMPLES = 5
+
+
+class _RouteStats:
+    """Rolling outcomes of one provider's generations"""
+
+    def __init__(self, window: int):
+        # (succeeded, seconds to first token or None)
+        self.outcomes = deque(maxlen=window)
+        self.first_token = deque(maxlen=window)
+        self.attempts = 0
+        self.failures = 0
+        self.fallbacks_to = 0
+        self.hedges_started = 0
+        self.hedges_won = 0
+
+    def error_rate(self) -> float:
+        if not self.outcomes:
+            return 0.0
+        return sum(1 for ok, _ in self.outcomes if not ok) / len(self.outcomes)
+
+    def median_first_token(self) -> Optional[float]:
+        if not self.first_token:
+            return None
+        ordered = sorted(self.first_token)
+        return ordered[len(ordered) // 2]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "attempts": self.attempts,
+            "failures": self.failures,
+            "error_rate": round(self.error_rate(), 4),
+            "first_token_ms": percentiles(self.first_token, scale=1000, digits=1),
+            "fallbacks_to": self.fallbacks_to,
+            "hedges_started": self.hedges_started,
+            "hedges_won": self.hedges_won,
+        }
+
+
+class _Race:
+    """Decides which of the concurrent attempts of one generation streams to the caller"""
+
+    def __init__(self, on_text: Optional[Callable[[str], Awaitable[None]]]):
+        self.on_text = on_text
+        self.winner: Optional[str] = None
+        self.started: Dict[str, float] = {}
+        self.first_token: Dict[str, float] = {}
+        self.tasks: Dict[str, asyncio.Task] = {}
+
+    def forwarder(self, provider: str) -> Callable[[str], Awaitable[None]]:
+        async def forward(text: str):
+            if provider not in self.first_token:
+                self.first_token[provider] = time.monotonic() - self.started[provider]
+            if self.winner is None:
+                # First attempt to produce text wins; the others stop here
+                self.winner = provider
+                for other, task in self.tasks.items():
+                    if other != provider:
+                        task.cancel()
+            if self.winner == provider and self.on_text is not None:
+                await self.on_text(text)
+        return forward
+
+
+class ProviderRouter:
+    """
+    Orders providers for a generation and runs it with fallback and hedging.
+
+    LLM_FALLBACK (default on) tries the remaining configured providers when
+    one fails. LLM_HEDGE (default off) starts the next provider once the
+    current one has gone LLM_HEDGE_PERCENTILE (default p95) of its recent
+    first-token latency without streaming anything; hedging needs
+    LLM_HEDGE_MIN_SAMPLES (default 20) completed generations to know that
+    latency.
+    """
+
+    def __init__(
+        self,
+        fallback: Optional[bool] = None,
+        hedge: Optional[bool] = None,
+        hedge_percentile: Optional[float] = None,
+        hedge_min_samples: Optional[int] = None,
+        window: Optional[int] = None,
+    ):
+        self.fallback = fallback if fallback is not None else _env_flag("LLM_FALLBACK", True)
+        self.hedge = hedge if hedge is not None else _env_flag("LLM_HEDGE", False)
+        self.hedge_percentile = hedge_percentile or float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+        self.hedge_min_samples = hedge_min_samples or int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+        self.window = window or int(os.getenv("LLM_ROUTING_WINDOW", "200"))
+        self._stats: Dict[str, _RouteStats] = {}
+
+    def _provider_stats(self, provider: str) -> _RouteStats:
+        return self._stats.setdefault(provider, _RouteStats(self.window))
+
+    def weight(self, provider: str) -> Optional[float]:
+        """Routing weight from rolling stats, or None until the provider has enough history"""
+        stats = self._stats.get(provider)
+        if stats is None or len(stats.outcomes) < MIN_ROUTING_SAMPLES:
+            return None
+        latency = stats.median_first_token() or 1.0
+        # Errors are penalized harder than latency: a failed call costs a whole fallback
+        return (1 - stats.error_rate()) ** 2 / max(latency, 0.05)
+
+    def rank(self, providers: List[str], preferred: Optional[str] = None) -> List[str]:
+        """
+        Providers in the order to try them.
+
+        A preferred provider goes first. Otherwise the first is drawn at
+        random weighted by weight(); providers without history get the best
+        known weight so they are tried too. The rest follow by weight, ties
+        keeping the given order.
+        """
+        if preferred is not None:
+            rest = [p for p in providers if p != preferred] if self.fallback else []
+            return [preferred] + self.rank(rest)[:len(rest)] if rest else [preferred]
+        if len(providers) <= 1:
+            return list(providers)
+        known = [w for w in (self.weight(p) for p in providers) if w is not None]
+        default = max(known) if known else 1.0
+        weights = {p: self.weight(p) if self.weight(p) is not None else default for p in providers}
+        first = random.choices(providers, weights=[weights[p] or 1e-6 for p in providers])[0]
+        rest = sorted((p for p in providers if p != first), key=lambda p: -weights[p])
+        ranked = [first] + rest
+        return ranked if self.fallback else ranked[:1]
+
+    def hedge_delay(self, provider: str) -> Optional[float]:
+        """Seconds to wait for a first token before hedging, or None if the provider's latency is not known yet"""
+        stats = self._stats.get(provider)
+        if stats is None or len(stats.first_token) < self.hedge_min_samples:
+            return None
+        return nearest_rank(sorted(stats.first_token), self.hedge_percentile / 100)
+
+    async def run(
+        self,
+        providers: List[str],
+        attempt: Callable[[str, Callable[[str], Awaitable[None]]], Awaitable[Any]],
+        on_text: Optional[Callable[[str], Awaitable[None]]] = None,
+        hedge: Optional[bool] = None,
+    ) -> Tuple[Any, Dict[str, Any]]:
+        """
+        Run attempt(provider, on_text) over providers in order until one succeeds.
+
+        Returns (result, report); the report names the provider used and
+        every attempt made. Raises the last error if every provider fails.
+        """
+        hedge = self.hedge if hedge is None else hedge
+        pending = list(providers)
+        report: Dict[str, Any] = {"order": list(providers), "provider": None, "hedged": False, "attempts": []}
+        streamed = False
+        last_error: Optional[BaseException] = None
+
+        while pending:
+            provider = pending.pop(0)
+            if report["attempts"]:
+                self._provider_stats(provider).fallbacks_to += 1
+                logger.warning(f"Falling back to {provider} after {report['attempts'][-1]['provider']} failed")
+            # Once text has gone out, a retry cannot be streamed on top of it
+            race = _Race(None if streamed else on_text)
+            self._start(race, provider, attempt)
+
+            delay = self.hedge_delay(provider) if hedge and pending and not streamed else None
+            if delay is not None:
+                await asyncio.wait(list(race.tasks.values()), timeout=delay)
+                if race.winner is None and not any(task.done() for task in race.tasks.values()):
+                    backup = pending.pop(0)
+                    logger.info(f"No first token from {provider} after {delay * 1000:.0f}ms, hedging with {backup}")
+                    report["hedged"] = True
+                    self._provider_stats(backup).hedges_started += 1
+                    self._start(race, backup, attempt)
+
+            try:
+                while race.tasks:
+                    done, _ = await asyncio.wait(list(race.tasks.values()), return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        name = next(p for p, t in race.tasks.items() if t is task)
+                        del race.tasks[name]
+                        if task.cancelled():
+                            # Lost the hedge race; still healthy, so it can be a fallback later
+                            report["attempts"].append({"provider": name, "outcome": "cancelled"})
+                            pending.append(name)
+                            continue
+                        error = task.exception()
+                        elapsed = time.monotonic() - race.started[name]
+                        if error is None:
+                            self._record(name, True, race.first_token.get(name))
+                            if report["hedged"] and name != provider:
+                                self._provider_stats(name).hedges_won += 1
+                            for other, other_task in race.tasks.items():
+                                other_task.cancel()
+                                report["attempts"].append({"provider": other, "outcome": "cancelled"})
+                            report["attempts"].append({"provider": name, "outcome": "succeeded",
+                                                       "duration_ms": round(elapsed * 1000, 2)})
+                            report["provider"] = name
+                            return task.result(), report
+                        self._record(name, False, race.first_token.get(name))
+                        last_error = error
+                        report["attempts"].append({"provider": name, "outcome": "failed", "error": str(error),
+                                                   "duration_ms": round(elapsed * 1000, 2)})
+                        logger.warning(f"Generation with {name} failed after {elapsed:.1f}s: {error}")
+            finally:
+                for task in race.tasks.values():
+                    task.cancel()
+            streamed = streamed or race.winner is not None
+
+        raise last_error or Exception("No provider available")
+
+    def _start(self, race: _Race, provider: str, attempt):
+        self._provider_stats(provider).attempts += 1
+        race.started[provider] = time.monotonic()
+        race.tasks[provider] = asyncio.create_task(attempt(provider, race.forwarder(provider)))
+
+    def _record(self, provider: str, succeeded: bool, first_token: Optional[float]):
+        stats = self._provider_stats(provider)
+        stats.outcomes.append((succeeded, first_token))
+        if not succeeded:
+            stats.failures += 1
+        elif first_token is not None:
+            stats.first_token.append(first_token)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "fallback": self.fallback,
+            "hedge": self.hedge,
+            "hedge_percentile": self.hedge_percentile,
+            "providers": {
+                provider: {**stats.to_dict(), "weight": self.weight(provider), "hedge_delay_ms":
+                           round(self.hedge_delay(provider) * 1000, 1) if self.hedge_delay(provider) is not None else None}
+                for provider, stats in self._stats.items()
+            },
+        }
+
+
+def _env_flag(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.lower() in ("1", "true", "yes")
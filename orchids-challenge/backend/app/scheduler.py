@@ -0,0 +1,181 @@
+import asyncio
+import logging
+import os
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted while the queue is at capacity"""
+
+
+class SchedulerClosedError(Exception):
+    """Raised when a job is submitted while the scheduler is draining"""
+
+
+class JobScheduler:
+    """
+    Bounded job queue with a fixed pool of workers.
+
+    Jobs wait in a FIFO queue of limited depth (submissions beyond it are
+    rejected) and are run by worker tasks. Within a job, the scraping and
+    generation stages take slots from separate semaphores so each stage has
+    its own concurrency limit. On shutdown the scheduler stops accepting
+    jobs and drains the queue before cancelling what is left.
+    """
+
+    def __init__(
+        self,
+        max_queue_depth: Optional[int] = None,
+        scrape_concurrency: Optional[int] = None,
+        generate_concurrency: Optional[int] = None,
+        drain_timeout: Optional[float] = None,
+        on_abandon: Optional[Callable[[str], Awaitable[None]]] = None,
+    ):
+        self.max_queue_depth = max_queue_depth or int(os.getenv("JOB_QUEUE_MAX_DEPTH", "100"))
+        self.scrape_concurrency = scrape_concurrency or int(os.getenv("SCRAPE_CONCURRENCY", "4"))
+        self.generate_concurrency = generate_concurrency or int(os.getenv("GENERATE_CONCURRENCY", "8"))
+        self.drain_timeout = drain_timeout if drain_timeout is not None else float(os.getenv("JOB_DRAIN_TIMEOUT_SECONDS", "60"))
+        # Called for jobs that were dropped or cancelled during shutdown
+        self.on_abandon = on_abandon
+
+        # Enough workers to keep both stages busy at once
+        self.worker_count = self.scrape_concurrency + self.generate_concurrency
+
+        self._pending = deque()  # (job_id, fn)
+        self._running: Dict[str, asyncio.Task] = {}
+        self._workers = []
+        self._wakeup = asyncio.Event()
+        self._accepting = False
+        self._stages = {
+            "scrape": asyncio.Semaphore(self.scrape_concurrency),
+            "generate": asyncio.Semaphore(self.generate_concurrency),
+        }
+        self._stage_waiting = {name: 0 for name in self._stages}
+        self._stage_active = {name: 0 for name in self._stages}
+        self._stats = {"submitted": 0, "rejected": 0, "completed": 0, "failed": 0, "abandoned": 0}
+
+    def start(self):
+        """Start the worker tasks"""
+        if self._workers:
+            return
+        self._accepting = True
+        self._workers = [asyncio.create_task(self._worker(i)) for i in range(self.worker_count)]
+        logger.info(
+            f"Job scheduler started: {self.worker_count} workers, queue depth {self.max_queue_depth}, "
+            f"scrape={self.scrape_concurrency}, generate={self.generate_concurrency}"
+        )
+
+    async def stop(self):
+        """Stop accepting jobs, drain the queue, then cancel whatever is still running"""
+        self._accepting = False
+        if not self._workers:
+            return
+        logger.info(f"Draining job scheduler ({len(self._pending)} queued, {len(self._running)} running)")
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.drain_timeout
+        while (self._pending or self._running) and loop.time() < deadline:
+            await asyncio.sleep(0.1)
+
+        # Anything left over is abandoned
+        while self._pending:
+            job_id, _ = self._pending.popleft()
+            await self._abandon(job_id)
+        for job_id, task in list(self._running.items()):
+            task.cancel()
+            await self._abandon(job_id)
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        logger.info("Job scheduler stopped")
+
+    def submit(self, job_id: str, fn: Callable[[], Awaitable[Any]]):
+        """Queue a job, raising if the scheduler is draining or the queue is full"""
+        if not self._accepting:
+            raise SchedulerClosedError("Scheduler is not accepting new jobs")
+        if len(self._pending) >= self.max_queue_depth:
+            self._stats["rejected"] += 1
+            raise QueueFullError(f"Job queue is full ({self.max_queue_depth} jobs waiting)")
+        self._pending.append((job_id, fn))
+        self._stats["submitted"] += 1
+        self._wakeup.set()
+
+    def position(self, job_id: str) -> Optional[int]:
+        """1-based position of a job in the queue, or None if it is not queued"""
+        for index, (queued_id, _) in enumerate(self._pending):
+            if queued_id == job_id:
+                return index + 1
+        return None
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._pending)
+
+    @asynccontextmanager
+    async def stage(self, name: str):
+        """Hold a concurrency slot of the given stage for the duration of the block"""
+        semaphore = self._stages[name]
+        self._stage_waiting[name] += 1
+        try:
+            await semaphore.acquire()
+        finally:
+            self._stage_waiting[name] -= 1
+        self._stage_active[name] += 1
+        try:
+            yield
+        finally:
+            self._stage_active[name] -= 1
+            semaphore.release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self._stats,
+            "queue_depth": len(self._pending),
+            "max_queue_depth": self.max_queue_depth,
+            "running": len(self._running),
+            "workers": len(self._workers),
+            "accepting": self._accepting,
+            "stages": {
+                name: {
+                    "limit": self.scrape_concurrency if name == "scrape" else self.generate_concurrency,
+                    "active": self._stage_active[name],
+                    "waiting": self._stage_waiting[name],
+                }
+                for name in self._stages
+            },
+        }
+
+    async def _worker(self, index: int):
+        while True:
+            if not self._pending:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            job_id, fn = self._pending.popleft()
+            task = asyncio.ensure_future(fn())
+            self._running[job_id] = task
+            try:
+                await task
+                self._stats["completed"] += 1
+            except asyncio.CancelledError:
+                # Jobs are only cancelled on shutdown, when the worker stops too
+                if not task.done():
+                    task.cancel()
+                raise
+            except Exception as e:
+                self._stats["failed"] += 1
+                logger.error(f"Job {job_id} raised in worker {index}: {str(e)}")
+            finally:
+                self._running.pop(job_id, None)
+
+    async def _abandon(self, job_id: str):
+        self._stats["abandoned"] += 1
+        if self.on_abandon is not None:
+            try:
+                await self.on_abandon(job_id)
+            except Exception as e:
+                logger.error(f"Error abandoning job {job_id}: {str(e)}")
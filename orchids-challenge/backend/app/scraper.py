@@ -1,19 +1,18 @@
 import requests
-from bs4 import BeautifulSoup
 import base64
 from playwright.async_api import async_playwright
 import asyncio
-from urllib.parse import urljoin, urlparse
+from urllib.parse import urlparse
 import os
 import logging
+import hashlib
 import json
-from io import BytesIO
-from PIL import Image
 import re
+import time
 from typing import Dict, Any, List, Optional
 
-import aiofiles
 import aiohttp
+import httpx
 from dotenv import load_dotenv
 
 # Load environment variables for Browserbase
@@ -31,13 +30,100 @@ except ImportError:
     logger.warning("Browserbase SDK not installed. Using default Playwright.")
     BROWSERBASE_AVAILABLE = False
 
+from .page_extraction import EXTRACTION_SCRIPT, normalize_computed_styles
+from .cache import TieredCache, cache_key
+from .blob_store import BlobStore
+from .image_processing import process_screenshot, screenshot_options
+from .html_extraction import HTML_SAMPLE_CHARS, extract_html_data
+from .metrics import (
+    HTML_PARSING_SECONDS, NAVIGATION_SECONDS, PAGE_EVALUATE_SECONDS, SCREENSHOT_PROCESSING_SECONDS, observe_ms,
+)
+from . import tracing
+from .incremental import conditional_headers, describe as describe_changes, diff_page, document_validators, markup_fingerprint
+from .page_loading import VIEWPORTS, PageLoad, describe, ordered_viewports, page_load_options
+from .stylesheets import StylesheetFetcher, prune_unused_rules
+from .worker_pool import ProcessWorkerPool
+
 # Note: logger is now defined above
 
+DEFAULT_VIEWPORT = VIEWPORTS["desktop"]
+
+DEFAULT_USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+
+def normalize_url(url: str) -> str:
+    """Canonical form of a URL for cache keys: lowercase scheme/host, no fragment"""
+    parsed = urlparse(url.strip())
+    netloc = parsed.netloc.lower()
+    if (parsed.scheme == 'http' and netloc.endswith(':80')) or (parsed.scheme == 'https' and netloc.endswith(':443')):
+        netloc = netloc.rsplit(':', 1)[0]
+    path = parsed.path or '/'
+    query = f"?{parsed.query}" if parsed.query else ''
+    return f"{parsed.scheme.lower()}://{netloc}{path}{query}"
+
+def captured_viewports(design_context) -> set:
+    """Names of the viewports a design context was captured at"""
+    # Entries scraped before multi-viewport capture are desktop only
+    primary = (design_context.get('viewport') or {}).get('name', 'desktop')
+    return {primary, *(design_context.get('breakpoints') or {})}
+
+# Design context fields derived from the page's markup by HTML extraction
+MARKUP_FIELDS = ('favicon', 'structure', 'meta_tags', 'images', 'navigation_links', 'page_links',
+                 'inline_styles', 'ui_components', 'html_sample')
+
+def screenshot_refs(design_context):
+    """Blob references of every screenshot image a design context points to"""
+    refs = [design_context['screenshot_ref']] if design_context.get('screenshot_ref') else []
+    for holder in [design_context, *(design_context.get('breakpoints') or {}).values()]:
+        for variant in (holder.get('screenshot_variants') or {}).values():
+            refs.extend(variant)
+    return refs
+
+def design_context_sizes(design_context):
+    """Element counts and payload sizes of a design context, as span attributes"""
+    structure = design_context.get('structure') or {}
+    return {
+        "html_sample.chars": len(design_context.get('html_sample') or ''),
+        "css_rules": len(design_context.get('css_rules') or []),
+        "computed_styles.nodes": len((design_context.get('computed_styles') or {}).get('nodes') or []),
+        "headings": len(structure.get('headings') or []),
+        "images": len(design_context.get('images') or []),
+        "navigation_links": len(design_context.get('navigation_links') or []),
+        "breakpoints": len(design_context.get('breakpoints') or {}),
+    }
+
+def _elapsed_ms(started: float) -> float:
+    """Milliseconds since a time.perf_counter() reading"""
+    return round((time.perf_counter() - started) * 1000, 2)
+
 class WebsiteScraper:
-    def __init__(self, cache_dir: str = ".cache"):
+    def __init__(self, cache_dir: str = ".cache", browser_pool=None, blob_store=None, worker_pool=None, stylesheet_fetcher=None):
         self.cache_dir = cache_dir
+        # Shared browser pool, managed by the FastAPI lifespan
+        self.browser_pool = browser_pool
         if not os.path.exists(cache_dir):
             os.makedirs(cache_dir)
+        
+        # Screenshots are kept out of the JSON entries, in a content-addressed blob store
+        self.blob_store = blob_store or BlobStore(os.path.join(cache_dir, "blobs"))
+        # CPU-bound post-processing runs in worker processes, off the event loop
+        self.worker_pool = worker_pool or ProcessWorkerPool()
+        self.screenshot_options = screenshot_options()
+        # Cross-origin stylesheets are downloaded and parsed once across all scrapes
+        self.stylesheet_fetcher = stylesheet_fetcher or StylesheetFetcher(cache_dir, worker_pool=self.worker_pool)
+        
+        # Tiered (memory + compressed disk) cache for scraped design contexts
+        self.cache = TieredCache(
+            os.path.join(cache_dir, "scrape"),
+            # Kept past freshness so stale pages can be revalidated and diffed
+            default_ttl=float(os.getenv("SCRAPE_CACHE_TTL_SECONDS", str(7 * 86400))),
+            max_bytes=int(os.getenv("SCRAPE_CACHE_MAX_BYTES", str(512 * 1024 * 1024))),
+            memory_max_bytes=int(os.getenv("SCRAPE_CACHE_MEMORY_MAX_BYTES", str(64 * 1024 * 1024))),
+        )
+        # Cached contexts are served without checking the page for this long,
+        # then revalidated or re-scraped and diffed against the cached copy
+        self.fresh_seconds = float(os.getenv("SCRAPE_FRESH_SECONDS", "86400"))
+        # Client for conditional GETs of cached pages, created on first use
+        self._http_client: Optional[httpx.AsyncClient] = None
             
         # Browserbase API configuration
         self.browserbase_api_key = os.getenv("BROWSERBASE_API_KEY")
@@ -53,22 +139,37 @@ class WebsiteScraper:
         else:
             logger.info("Using standard Playwright for scraping. Install Browserbase SDK for enhanced capabilities.")
 
-    async def scrape_website(self, url):
+    async def scrape_website(self, url, load_options=None, previous=None):
+        """
+        Scrape a URL into a design context.
+
+        load_options overrides the resource blocking, readiness and viewport
+        settings from page_load_options() for this scrape. With several
+        viewports the page is loaded once at the widest, whose capture fills
+        the design context as usual, then resized to each of the others,
+        which are captured into design_context['breakpoints'].
+
+        previous is the stale cached context of the same page, if any; the
+        new capture is diffed against it into design_context['changes'], and
+        if nothing changed the previous context is reused.
+        """
+        load_options = page_load_options(load_options)
+        with tracing.span("scrape_website", url=url, viewports=",".join(load_options["viewports"]),
+                          wait_until=load_options["wait_until"]) as scrape_span:
+            design_context = await self._scrape(url, load_options, previous)
+            tracing.set_attributes(scrape_span, changed=(design_context.get('changes') or {}).get('changed'),
+                                   **design_context_sizes(design_context))
+        return design_context
+
+    async def _scrape(self, url, load_options, previous):
+        """Load and capture the page, through Browserbase when configured, and build its design context"""
         # Extract the base domain from the URL for resolving relative paths
         parsed_url = urlparse(url)
         base_domain = f"{parsed_url.scheme}://{parsed_url.netloc}"
         
-        # Check if the result is already cached
-        cache_key = url.replace("/", "_").replace(":", "_")
-        cache_file = os.path.join(self.cache_dir, f"{cache_key}.json")
-        
-        if os.path.exists(cache_file):
-            async with aiofiles.open(cache_file, "r") as f:
-                cached_data = json.loads(await f.read())
-                logger.info(f"Retrieved cached data for URL: {url}")
-                return cached_data
-        
         logger.info(f"Starting scraping process for URL: {url}")
+        # Per-phase timing breakdown in milliseconds, stored on the design context
+        timings = {}
         
         if self.use_browserbase:
             # Use Browserbase with stealth mode and proxies for enhanced scraping
@@ -94,459 +195,406 @@ class WebsiteScraper:
                 
                 # Connect using Playwright
                 browser = await session.connect_with_playwright()
-                context = await browser.new_context()
-                page = await context.new_page()
+                try:
+                    context = await browser.new_context()
+                    page = await context.new_page()
+                    
+                    # Navigate to URL with generous timeout
+                    logger.info(f"Connected to Browserbase session {session.id}, navigating to {url}")
+                    page_data = await self._load_and_capture(page, url, load_options, timings)
+                finally:
+                    await browser.close()
                 
-                # Navigate to URL with generous timeout
-                logger.info(f"Connected to Browserbase session {session.id}, navigating to {url}")
-                await page.goto(url, wait_until="networkidle", timeout=60000)
+                return await self._build_design_context(url, base_domain, page_data, timings, previous)
                 
             except Exception as e:
                 logger.error(f"Error with Browserbase: {str(e)}. Falling back to standard Playwright.")
-                # Fall back to regular Playwright
-                async with async_playwright() as p:
-                    browser = await p.chromium.launch(headless=True)
-                    context = await browser.new_context(
-                        viewport={"width": 1920, "height": 1080},
-                        user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
-                    )
-                    page = await context.new_page()
-                    await page.goto(url, wait_until="networkidle", timeout=60000)
-        else:
-            # Use regular Playwright
-            async with async_playwright() as p:
-                browser = await p.chromium.launch(headless=True)
-                context = await browser.new_context(
-                    viewport={"width": 1920, "height": 1080},
-                    user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
-                )
+        
+        page_data = await self._scrape_with_playwright(url, load_options, timings)
+        return await self._build_design_context(url, base_domain, page_data, timings, previous)
+
+    async def _scrape_with_playwright(self, url, load_options, timings):
+        """Load the page in Chromium, using the shared browser pool when available"""
+        context_options = {
+            "viewport": VIEWPORTS[ordered_viewports(load_options["viewports"])[0]],
+            "user_agent": DEFAULT_USER_AGENT,
+        }
+        
+        if self.browser_pool is not None and self.browser_pool.started:
+            async with self.browser_pool.context(**context_options) as context:
                 page = await context.new_page()
-                await page.goto(url, wait_until="networkidle", timeout=60000)
-                
-                # Take a screenshot of the full page
-                screenshot = await page.screenshot(full_page=True, type="jpeg", quality=80)
-                screenshot_base64 = base64.b64encode(screenshot).decode('utf-8')
-                
-                # Get HTML content
-                html_content = await page.content()
-                
-                # Extract stylesheets
-                stylesheets = await page.evaluate('''
-                    () => Array.from(document.styleSheets)
-                        .filter(sheet => sheet.href)
-                        .map(sheet => sheet.href)
-                ''')
-                
-                # Get all CSS style rules from stylesheets
-                css_rules = await page.evaluate('''
-                    () => {
-                        const styleSheets = Array.from(document.styleSheets);
-                        let rules = [];
-                        
-                        styleSheets.forEach(sheet => {
-                            try {
-                                if (sheet.cssRules) {
-                                    const sheetRules = Array.from(sheet.cssRules)
-                                        .map(rule => {
-                                            return {
-                                                selectorText: rule.selectorText || null,
-                                                cssText: rule.cssText || null
-                                            };
-                                        });
-                                    rules = rules.concat(sheetRules);
-                                }
-                            } catch (e) {
-                                // Skip cross-origin stylesheets that can't be accessed
-                                console.log('Could not access stylesheet rules');
-                            }
-                        });
-                        
-                        return rules;
-                    }
-                ''')
-                
-                # Extract computed styles for key elements
-                computed_styles = await page.evaluate('''
-                    () => {
-                        function getComputedStylesForElement(element) {
-                            const styles = window.getComputedStyle(element);
-                            const relevantStyles = {};
-                            
-                            // Get relevant CSS properties
-                            const properties = [
-                                'color', 'background-color', 'background-image', 'font-family', 'font-size', 'font-weight',
-                                'padding', 'padding-top', 'padding-right', 'padding-bottom', 'padding-left',
-                                'margin', 'margin-top', 'margin-right', 'margin-bottom', 'margin-left',
-                                'border', 'border-radius', 'border-top', 'border-right', 'border-bottom', 'border-left',
-                                'width', 'height', 'max-width', 'max-height', 'min-width', 'min-height',
-                                'display', 'position', 'top', 'right', 'bottom', 'left', 'z-index',
-                                'flex-direction', 'flex-wrap', 'justify-content', 'align-items', 'align-content', 'flex-grow',
-                                'grid-template-columns', 'grid-template-rows', 'grid-gap',
-                                'text-align', 'line-height', 'letter-spacing', 'text-decoration', 'text-transform',
-                                'box-shadow', 'opacity', 'transform', 'transition', 'animation',
-                                'overflow', 'visibility'
-                            ];
-                            
-                            for (const prop of properties) {
-                                relevantStyles[prop] = styles.getPropertyValue(prop);
-                            }
-                            
-                            return relevantStyles;
-                        }
-                        
-                        function getElementInfo(element, depth = 0, maxDepth = 3) {
-                            if (depth > maxDepth || !element) return null;
-                            
-                            // Skip hidden elements and script/style tags
-                            if (element.tagName === 'SCRIPT' || element.tagName === 'STYLE') return null;
-                            
-                            const styles = getComputedStylesForElement(element);
-                            const rect = element.getBoundingClientRect();
-                            
-                            // Handle SVG elements specially (SVGAnimatedString issue)
-                            let className;
-                            if (element.className && typeof element.className === 'object' && element.className.baseVal !== undefined) {
-                                // SVG element with SVGAnimatedString
-                                className = element.className.baseVal;
-                            } else if (element.className) {
-                                // Regular DOM element
-                                className = element.className.toString();
-                            } else {
-                                className = null;
-                            }
-                            
-                            const info = {
-                                tagName: element.tagName.toLowerCase(),
-                                id: element.id || null,
-                                className: className,
-                                text: element.textContent?.substring(0, 100) || null,
-                                attributes: {},
-                                styles,
-                                position: {
-                                    x: rect.x,
-                                    y: rect.y,
-                                    width: rect.width,
-                                    height: rect.height
-                                },
-                                isInteractive: element.tagName === 'BUTTON' || 
-                                               element.tagName === 'A' || 
-                                               element.tagName === 'INPUT' ||
-                                               element.tagName === 'SELECT' ||
-                                               element.tagName === 'TEXTAREA' ||
-                                               (element.getAttribute('role') === 'button') ||
-                                               (element.getAttribute('onclick') !== null)
-                            };
-                            
-                            // Get attributes
-                            for (const attr of element.attributes) {
-                                info.attributes[attr.name] = attr.value;
-                            }
-                            
-                            // Get important child elements (for key structural elements only)
-                            if (element.tagName === 'BODY' || 
-                                element.tagName === 'HEADER' || 
-                                element.tagName === 'FOOTER' || 
-                                element.tagName === 'NAV' || 
-                                element.tagName === 'MAIN' || 
-                                element.tagName === 'ASIDE' || 
-                                element.tagName === 'SECTION' || 
-                                element.tagName === 'ARTICLE' || 
-                                element.id || 
-                                (element.className && element.className.includes('container'))) {
-                                
-                                info.children = [];
-                                for (const child of element.children) {
-                                    const childInfo = getElementInfo(child, depth + 1, maxDepth);
-                                    if (childInfo) {
-                                        info.children.push(childInfo);
-                                    }
-                                }
-                            }
-                            
-                            return info;
-                        }
-                        
-                        // Start with body and selected key elements
-                        const keySelectors = [
-                            'body', 'header', 'footer', 'nav', 'main', 'aside', 'section', 'article',
-                            '.header', '.footer', '.navigation', '.container', '.wrapper', '.content', '.sidebar',
-                            '.hero', '.banner', '#header', '#footer', '#nav', '#content', '#main', '#sidebar',
-                            '.btn', 'button', 'a.button', '.menu', '.card', '.alert', '.notification',
-                            'form', 'input', 'select', 'textarea', '.form-control', '.input-group',
-                            '.modal', '.dialog', '.overlay', '.popup', '.tooltip',
-                            'table', 'tr', 'td', 'th', '.table',
-                            'img', 'video', 'audio', 'iframe', '.media', '.image',
-                            '.row', '.col', '.column', '.grid', '.flex',
-                            'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'p', 'a', 'span', 'div'
-                        ];
-                        
-                        const result = {};
-                        
-                        for (const selector of keySelectors) {
-                            try {
-                                const elements = document.querySelectorAll(selector);
-                                if (elements.length > 0) {
-                                    result[selector] = Array.from(elements).map(el => getElementInfo(el));
-                                }
-                            } catch(e) {
-                                console.error(`Error getting info for ${selector}:`, e);
-                            }
-                        }
-                        
-                        return result;
-                    }
-                ''')
-                
-                # Extract colors
-                colors = await page.evaluate('''
-                    () => {
-                        const colors = new Set();
-                        const elements = document.querySelectorAll('*');
-                        
-                        elements.forEach(el => {
-                            const styles = window.getComputedStyle(el);
-                            const color = styles.getPropertyValue('color');
-                            const bgColor = styles.getPropertyValue('background-color');
-                            const borderColor = styles.getPropertyValue('border-color');
-                            
-                            if (color && color !== 'rgba(0, 0, 0, 0)') colors.add(color);
-                            if (bgColor && bgColor !== 'rgba(0, 0, 0, 0)') colors.add(bgColor);
-                            if (borderColor && borderColor !== 'rgba(0, 0, 0, 0)') colors.add(borderColor);
-                        });
-                        
-                        return Array.from(colors);
-                    }
-                ''')
-                
-                # Extract font information
-                fonts = await page.evaluate('''
-                    () => {
-                        const fonts = new Set();
-                        const elements = document.querySelectorAll('*');
-                        
-                        elements.forEach(el => {
-                            const fontFamily = window.getComputedStyle(el).getPropertyValue('font-family');
-                            if (fontFamily) fonts.add(fontFamily);
-                        });
-                        
-                        return Array.from(fonts);
-                    }
-                ''')
-                
-                # Extract layout structure
-                layout = await page.evaluate('''
-                    () => {
-                        function getLayoutStructure() {
-                            const body = document.body;
-                            
-                            function getStructure(element, depth = 0) {
-                                if (depth > 5) return null;  // Increased depth to capture more structure
-                                
-                                const children = Array.from(element.children)
-                                    .filter(el => {
-                                        // Filter out invisible elements
-                                        const rect = el.getBoundingClientRect();
-                                        const style = window.getComputedStyle(el);
-                                        return rect.width > 0 && 
-                                               rect.height > 0 && 
-                                               style.display !== 'none' && 
-                                               style.visibility !== 'hidden';
-                                    })
-                                    .map(child => {
-                                        const rect = child.getBoundingClientRect();
-                                        // Handle SVG elements' className properly
-                                        let classNameValue;
-                                        if (child.className && typeof child.className === 'object' && child.className.baseVal !== undefined) {
-                                            classNameValue = child.className.baseVal;
-                                        } else if (child.className) {
-                                            classNameValue = child.className.toString();
-                                        } else {
-                                            classNameValue = null;
-                                        }
-                                        
-                                        return {
-                                            tag: child.tagName.toLowerCase(),
-                                            id: child.id || null,
-                                            className: classNameValue,
-                                            position: {
-                                                x: rect.x,
-                                                y: rect.y,
-                                                width: rect.width,
-                                                height: rect.height
-                                            },
-                                            children: getStructure(child, depth + 1)
-                                        };
-                                    });
-                                
-                                return children;
-                            }
-                            
-                            return {
-                                width: window.innerWidth,
-                                height: window.innerHeight,
-                                structure: getStructure(body)
-                            };
-                        }
-                        
-                        return getLayoutStructure();
-                    }
-                ''')
-                
-                # Close browser
+                return await self._load_and_capture(page, url, load_options, timings)
+        
+        # No pool running (e.g. scraper used standalone), launch a one-off browser
+        async with async_playwright() as p:
+            browser = await p.chromium.launch(headless=True)
+            try:
+                context = await browser.new_context(**context_options)
+                page = await context.new_page()
+                return await self._load_and_capture(page, url, load_options, timings)
+            finally:
                 await browser.close()
+
+    async def _load_and_capture(self, page, url, load_options, timings):
+        """Navigate to url with resource blocking and the configured readiness wait, then capture the page"""
+        page_load = PageLoad(page, load_options)
+        phase_started = time.perf_counter()
+        with tracing.span("page.goto", url=url, wait_until=load_options["wait_until"]) as goto_span:
+            await page_load.goto(url, timeout_ms=60000)
+            tracing.set_attributes(goto_span, requests=page_load.requests,
+                                   blocked_requests=sum(page_load.blocked.values()))
+        timings['navigation_ms'] = _elapsed_ms(phase_started)
+        observe_ms(NAVIGATION_SECONDS, timings['navigation_ms'])
+        page_data = await self._capture_page(page, timings)
+        viewports = ordered_viewports(load_options["viewports"])
+        page_data['viewport'] = {'name': viewports[0], **VIEWPORTS[viewports[0]]}
+        page_data['validators'] = document_validators(page_load.document_headers)
+        # Where the page ended up after redirects, for resolving its relative links
+        page_data['final_url'] = page.url
+        if len(viewports) > 1:
+            page_data['breakpoints'] = {}
+            timings['breakpoints'] = {}
+        for name in viewports[1:]:
+            page_data['breakpoints'][name] = await self._capture_breakpoint(page_load, name, timings)
+        # Network activity seen during capture tells us when networkidle would have fired
+        timings['navigation'] = page_load.report()
+        logger.info(f"Loaded {url}: {describe(timings['navigation'])}")
+        return page_data
+
+    async def _capture_breakpoint(self, page_load, name, timings):
+        """Resize the loaded page to a breakpoint and capture what changes with the viewport"""
+        breakpoint_timings = timings['breakpoints'][name] = {}
+        with tracing.span("capture_breakpoint", viewport=name) as breakpoint_span:
+            phase_started = time.perf_counter()
+            settle = await page_load.resize(VIEWPORTS[name])
+            breakpoint_timings['resize_ms'] = _elapsed_ms(phase_started)
+            breakpoint_timings['settled'] = settle['quiet']
             
-            # Process and resize screenshot to save memory
-            img_data = BytesIO(base64.b64decode(screenshot_base64))
-            img = Image.open(img_data)
-            # Resize to maintain aspect ratio but limit height
-            width, height = img.size
-            max_height = 1200
-            if height > max_height:
-                ratio = max_height / height
-                new_width = int(width * ratio)
-                img = img.resize((new_width, max_height), Image.LANCZOS)
-                
-                # Save as a new byte array
-                buffer = BytesIO()
-                img.save(buffer, format="JPEG", quality=80)
-                screenshot_base64 = base64.b64encode(buffer.getvalue()).decode('utf-8')
-            
-            # Parse HTML with BeautifulSoup for easier extraction
-            soup = BeautifulSoup(html_content, 'html.parser')
-            
-            # Extract meta tags
-            meta_tags = []
-            for meta in soup.find_all('meta'):
-                if meta.get('name') or meta.get('property'):
-                    meta_tags.append({
-                        'name': meta.get('name', meta.get('property')),
-                        'content': meta.get('content')
-                    })
+            phase_started = time.perf_counter()
+            screenshot = await page_load.page.screenshot(full_page=True, type="jpeg", quality=80)
+            breakpoint_timings['screenshot_ms'] = _elapsed_ms(phase_started)
             
-            # Extract images
-            images = []
-            for img in soup.find_all('img', src=True):
-                src = img['src']
-                if not src.startswith(('http://', 'https://')):
-                    src = urljoin(base_domain, src)
-                
-                alt = img.get('alt', '')
-                width = img.get('width', '')
-                height = img.get('height', '')
-                
-                images.append({
-                    'src': src,
-                    'alt': alt,
-                    'width': width,
-                    'height': height
-                })
-            
-            # Extract links for navigation structure
-            navigation_links = []
-            for a in soup.find_all('a', href=True):
-                href = a['href']
-                if not href.startswith(('http://', 'https://')):
-                    href = urljoin(base_domain, href)
-                
-                navigation_links.append({
-                    'href': href,
-                    'text': a.get_text(strip=True)
+            # Stylesheets and rules are the same at every size; media queries only change computed values
+            phase_started = time.perf_counter()
+            extracted = await page_load.page.evaluate(EXTRACTION_SCRIPT)
+            breakpoint_timings['extraction_ms'] = _elapsed_ms(phase_started)
+            tracing.set_attributes(breakpoint_span, settled=settle['quiet'], **{
+                "screenshot.bytes": len(screenshot),
+                "captured_nodes": extracted.get('timings', {}).get('captured_node_count'),
+            })
+        observe_ms(PAGE_EVALUATE_SECONDS, breakpoint_timings['extraction_ms'], script="breakpoint_extraction")
+        return {
+            'viewport': {'name': name, **VIEWPORTS[name]},
+            'screenshot': screenshot,
+            'computed_styles': extracted['computed_styles'],
+            'colors': extracted['colors'],
+            'fonts': extracted['fonts'],
+            'layout': extracted['layout'],
+        }
+
+    async def _capture_page(self, page, timings):
+        """Capture the screenshot, HTML and in-page style data from a loaded page"""
+        # Take a screenshot of the full page
+        phase_started = time.perf_counter()
+        with tracing.span("page.screenshot") as screenshot_span:
+            screenshot = await page.screenshot(full_page=True, type="jpeg", quality=80)
+            screenshot_span.set_attribute("screenshot.bytes", len(screenshot))
+        timings['screenshot_ms'] = _elapsed_ms(phase_started)
+        
+        # Get HTML content
+        phase_started = time.perf_counter()
+        with tracing.span("page.content") as content_span:
+            html_content = await page.content()
+            content_span.set_attribute("html.chars", len(html_content))
+        timings['html_content_ms'] = _elapsed_ms(phase_started)
+        
+        # Extract stylesheets, css rules, computed styles, colors, fonts and
+        # layout in a single in-page DOM walk
+        phase_started = time.perf_counter()
+        with tracing.span("page.evaluate", script="extraction") as extraction_span:
+            extracted = await page.evaluate(EXTRACTION_SCRIPT)
+            in_page = extracted.get('timings', {})
+            tracing.set_attributes(extraction_span, **{
+                "elements": in_page.get('element_count'),
+                "captured_nodes": in_page.get('captured_node_count'),
+                "style_table_size": in_page.get('style_table_size'),
+                "css_rules": len(extracted.get('css_rules') or []),
+                "stylesheets": len(extracted.get('stylesheets') or []),
+                "unreadable_stylesheets": len(extracted.get('unreadable_stylesheets') or []),
+            })
+        timings['extraction_ms'] = _elapsed_ms(phase_started)
+        observe_ms(PAGE_EVALUATE_SECONDS, timings['extraction_ms'], script="extraction")
+        timings['in_page'] = extracted.pop('timings', {})
+        
+        return {
+            'screenshot': screenshot,
+            'html_content': html_content,
+            **extracted,
+        }
+
+    async def _build_design_context(self, url, base_domain, page_data, timings, previous=None):
+        """Post-process captured page data into the design context"""
+        html_content = page_data['html_content']
+        scraped_at = time.time()
+        
+        # Fingerprints of what each post-capture step reads, so steps whose
+        # inputs are unchanged since the cached capture can reuse its output
+        page_url = page_data.get('final_url') or url
+        fingerprints = await self._capture_fingerprints(page_data, html_content, page_url)
+        previous_prints = (previous or {}).get('capture_fingerprints') or {}
+        reused = []
+        
+        changes = None
+        if previous is not None:
+            # Compare with the cached capture before doing any post-processing
+            phase_started = time.perf_counter()
+            with tracing.span("diff_page") as diff_span:
+                changes = await self.worker_pool.run(
+                    diff_page, previous.get('layout'), previous.get('html_sample'),
+                    page_data['layout'], html_content[:HTML_SAMPLE_CHARS]
+                )
+                tracing.set_attributes(diff_span, changed=changes['changed'], **{
+                    f"sections.{status}": count for status, count in changes['summary'].items()
                 })
-            
-            # Extract page structure
-            structure = {
-                'title': soup.title.string if soup.title else '',
-                'headings': {
-                    'h1': [h.get_text(strip=True) for h in soup.find_all('h1')],
-                    'h2': [h.get_text(strip=True) for h in soup.find_all('h2')],
-                    'h3': [h.get_text(strip=True) for h in soup.find_all('h3')],
+            timings['diff_ms'] = _elapsed_ms(phase_started)
+            logger.info(f"Re-scraped {url}: {describe_changes(changes)}")
+            # Entries cached before fingerprints were stored are compared on markup alone
+            same_capture = not previous_prints or previous_prints == fingerprints
+            if not changes['changed'] and same_capture and captured_viewports(page_data) <= captured_viewports(previous):
+                # Same markup: keep the processed screenshots, styles and the clone cache key
+                return {
+                    **previous,
+                    'validators': page_data['validators'],
+                    'final_url': page_url,
+                    'scraped_at': scraped_at,
+                    'checked_at': scraped_at,
+                    'changes': changes,
+                    'timings': timings,
                 }
-            }
-            
-            # Extract favicon
-            favicon = None
-            favicon_tags = soup.find_all('link', rel=lambda r: r and ('icon' in r.lower() or 'shortcut icon' in r.lower()))
-            if favicon_tags:
-                favicon_href = favicon_tags[0].get('href')
-                if favicon_href:
-                    if not favicon_href.startswith(('http://', 'https://')):  
-                        favicon = urljoin(base_domain, favicon_href)
-                    else:
-                        favicon = favicon_href
-            
-            # Extract and categorize UI components
-            ui_components = {}
-            component_selectors = {
-                'buttons': ['button', '.btn', '.button', '[role="button"]'],
-                'forms': ['form'],
-                'inputs': ['input', 'textarea', 'select'],
-                'navigation': ['nav', '.nav', '.navigation', '.menu'],
-                'cards': ['.card', '.box', '.panel', '.item'],
-                'modals': ['.modal', '.dialog', '.popup', '.overlay'],
-                'headers': ['header', '.header', '#header'],
-                'footers': ['footer', '.footer', '#footer'],
-                'sidebars': ['aside', '.sidebar', '#sidebar'],
-            }
-            
-            for component_type, selectors in component_selectors.items():
-                components = []
-                for selector in selectors:
-                    try:
-                        for element in soup.select(selector):
-                            components.append({
-                                'html': str(element),
-                                'text': element.get_text(strip=True),
-                                'attributes': {attr: element.get(attr) for attr in element.attrs}
-                            })
-                    except Exception as e:
-                        logger.warning(f"Error extracting {component_type} with selector {selector}: {e}")
-                
-                ui_components[component_type] = components[:5]  # Limit to first 5 of each type
-            
-            # Extract CSS styles from style tags
-            inline_styles = ""
-            for style_tag in soup.find_all('style'):
-                inline_styles += style_tag.string or ""
-            
-            # Compile all scraped data with enhanced information
-            design_context = {
-                'screenshot': screenshot_base64,
-                'url': url,  # Ensure URL is always included, was causing errors before
-                'base_domain': base_domain,
-                'favicon': favicon,
-                'title': structure.get('title', ''),
-                'structure': structure,
-                'meta_tags': meta_tags,
-                'images': images[:20],  # Include more images
-                'navigation_links': navigation_links[:30],  # Include more navigation links
-                'stylesheets': stylesheets,
-                'inline_styles': inline_styles,
-                'css_rules': css_rules, 
-                'colors': colors,
-                'fonts': fonts,
-                'computed_styles': computed_styles,
-                'layout': layout,
-                'ui_components': ui_components,
-                'html_sample': str(soup)[:100000]  # Increased to 100k characters of HTML for better fidelity
-            }
+        
+        # Downscale / tile the screenshot for each model in a worker process
+        phase_started = time.perf_counter()
+        with tracing.span("screenshot_processing") as processing_span:
+            viewport = page_data.get('viewport') or {'name': 'desktop', **DEFAULT_VIEWPORT}
+            screenshot = page_data.pop('screenshot')
+            processing_span.set_attribute("screenshot.bytes", len(screenshot))
+            previous_viewport = ((previous or {}).get('viewport') or {}).get('name')
+            if (previous_viewport == viewport['name'] and previous.get('screenshot_variants')
+                    and previous_prints.get('screenshots', {}).get(viewport['name']) == fingerprints['screenshots'][viewport['name']]):
+                screenshot_variants = previous['screenshot_variants']
+                reused.append(f"screenshot:{viewport['name']}")
+            else:
+                screenshot_variants = await self._store_screenshot(screenshot, viewport['height'])
+            del screenshot
+            # First image of the first profile, for readers that only know a single screenshot
+            screenshot_ref = next(iter(screenshot_variants.values()))[0]
             
-            return design_context
+            breakpoints = {}
+            previous_breakpoints = (previous or {}).get('breakpoints') or {}
+            for name, captured in (page_data.get('breakpoints') or {}).items():
+                screenshot = captured.pop('screenshot')
+                if (previous_breakpoints.get(name, {}).get('screenshot_variants')
+                        and previous_prints.get('screenshots', {}).get(name) == fingerprints['screenshots'][name]):
+                    variants = previous_breakpoints[name]['screenshot_variants']
+                    reused.append(f"screenshot:{name}")
+                else:
+                    variants = await self._store_screenshot(screenshot, captured['viewport']['height'])
+                breakpoints[name] = {**captured, 'screenshot_variants': variants}
+            processing_span.set_attribute("images", sum(
+                len(refs) for variants in [screenshot_variants, *(b['screenshot_variants'] for b in breakpoints.values())]
+                for refs in variants.values()
+            ))
+            processing_span.set_attribute("reused", len(reused))
+        timings['screenshot_processing_ms'] = _elapsed_ms(phase_started)
+        observe_ms(SCREENSHOT_PROCESSING_SECONDS, timings['screenshot_processing_ms'])
+        
+        # Parse the HTML off the event loop while the stylesheets the page
+        # could not read are downloaded
+        phase_started = time.perf_counter()
+        with tracing.span("html_parsing", **{"html.chars": len(html_content)}) as parsing_span:
+            if previous_prints.get('markup') == fingerprints['markup'] and all(field in previous for field in MARKUP_FIELDS):
+                # Only markup that differs on every load changed
+                html_data = {field: previous[field] for field in MARKUP_FIELDS}
+                css_rules, css_stats = previous['css_rules'], previous['css_stats']
+                reused.append("markup")
+            else:
+                html_data, css_rules, css_stats = await self._extract_html_and_css(page_data, html_content, page_url)
+                # Every link on the page, for crawls; the prompt only uses navigation_links
+                html_data['page_links'] = list(dict.fromkeys(link['href'] for link in html_data['navigation_links']))
+                html_data['navigation_links'] = html_data['navigation_links'][:30]  # Include more navigation links
+            tracing.set_attributes(parsing_span, **{
+                "reused": "markup" in reused,
+                "css_rules.before": css_stats['rules_before'],
+                "css_rules.after": css_stats['rules_after'],
+                "stylesheets_fetched": css_stats['stylesheets_fetched'],
+                "headings": len(html_data['structure'].get('headings') or []),
+                "images": len(html_data['images']),
+                "navigation_links": len(html_data['navigation_links']),
+            })
+        timings['html_parsing_ms'] = _elapsed_ms(phase_started)
+        observe_ms(HTML_PARSING_SECONDS, timings['html_parsing_ms'])
+        if changes is not None:
+            changes['reused'] = reused
+        logger.info(f"Scrape timings for {url}: {timings}")
+        
+        # Compile all scraped data with enhanced information
+        design_context = {
+            'screenshot_ref': screenshot_ref,
+            'screenshot_variants': screenshot_variants,
+            'viewport': viewport,
+            'breakpoints': breakpoints,
+            'url': url,  # Ensure URL is always included, was causing errors before
+            'final_url': page_url,  # After redirects
+            'base_domain': base_domain,
+            'favicon': html_data['favicon'],
+            'title': html_data['structure'].get('title', ''),
+            'structure': html_data['structure'],
+            'meta_tags': html_data['meta_tags'],
+            'images': html_data['images'][:20],  # Include more images
+            'navigation_links': html_data['navigation_links'],
+            'page_links': html_data['page_links'],
+            'stylesheets': page_data['stylesheets'],
+            'inline_styles': html_data['inline_styles'],
+            'css_rules': css_rules,
+            'css_stats': css_stats,
+            'colors': page_data['colors'],
+            'fonts': page_data['fonts'],
+            'computed_styles': page_data['computed_styles'],
+            'layout': page_data['layout'],
+            'ui_components': html_data['ui_components'],
+            'html_sample': html_data['html_sample'],
+            'validators': page_data['validators'],
+            'capture_fingerprints': fingerprints,
+            'scraped_at': scraped_at,
+            'checked_at': scraped_at,
+            'changes': changes,
+            'timings': timings
+        }
+        
+        return design_context
 
-    async def get_cached_website_data(self, url):
-        """Check if we have cached data for this URL"""
-        # Create a filename from URL (simplified approach)
-        filename = base64.b64encode(url.encode()).decode().replace('/', '_') + '.json'
-        cache_path = os.path.join(self.cache_dir, filename)  # Use self.cache_dir for consistency
+    async def _capture_fingerprints(self, page_data, html_content, page_url):
+        """{"screenshots": {viewport: hash}, "markup": hash} of a capture's post-processing inputs"""
+        options = json.dumps(self.screenshot_options, sort_keys=True).encode('utf-8')
+        
+        def screenshot_hash(screenshot):
+            return hashlib.sha256(options + screenshot).hexdigest()
         
-        if os.path.exists(cache_path):
-            with open(cache_path, 'r') as f:
-                return json.load(f)
-        return None
+        viewport_name = (page_data.get('viewport') or {}).get('name', 'desktop')
+        captures = {viewport_name: page_data['screenshot'],
+                    **{name: captured['screenshot'] for name, captured in (page_data.get('breakpoints') or {}).items()}}
+        hashes, markup = await asyncio.gather(
+            asyncio.gather(*(asyncio.to_thread(screenshot_hash, screenshot) for screenshot in captures.values())),
+            self.worker_pool.run(markup_fingerprint, html_content, page_url, page_data['css_rules'],
+                                 page_data.get('unreadable_stylesheets') or []),
+        )
+        return {'screenshots': dict(zip(captures, hashes)), 'markup': markup}
+
+    async def _extract_html_and_css(self, page_data, html_content, page_url):
+        """Extract page structure and complete the CSS rules with fetched stylesheets, pruned to what the page uses"""
+        unreadable = page_data.get('unreadable_stylesheets') or []
+        html_data, (fetched, fetch_report) = await asyncio.gather(
+            self.worker_pool.run(extract_html_data, html_content, page_url),
+            self.stylesheet_fetcher.fetch_all([sheet['href'] for sheet in unreadable]),
+        )
+
+        # Splice each fetched sheet in where the page skipped it, last first so indexes hold
+        css_rules = list(page_data['css_rules'])
+        for sheet in sorted(unreadable, key=lambda sheet: sheet['index'], reverse=True):
+            rules = fetched.get(sheet['href'])
+            if not rules:
+                continue
+            media = (sheet.get('media') or '').strip()
+            if media and media.lower() != 'all':
+                rules = [{'selectorText': None, 'cssText': f"@media {media} {{{''.join(rule['cssText'] for rule in rules)}}}"}]
+            css_rules[sheet['index']:sheet['index']] = rules
+
+        css_rules, prune_stats = await self.worker_pool.run(prune_unused_rules, css_rules, html_data.pop('used_selectors'))
+        css_stats = {
+            **prune_stats,
+            'stylesheets_fetched': len(fetched),
+            'stylesheet_errors': fetch_report['errors'],
+            'stylesheet_requests': fetch_report['requests'],
+            'stylesheet_cache_hits': fetch_report['fresh_hits'] + fetch_report['not_modified'] + fetch_report['content_hits'],
+        }
+        return html_data, css_rules, css_stats
+
+    async def _store_screenshot(self, screenshot, viewport_height):
+        """Process a screenshot for every model profile and store the images as blobs; returns the references"""
+        processed = await self.worker_pool.run(
+            process_screenshot, screenshot, viewport_height,
+            self.screenshot_options["image_format"], self.screenshot_options["quality"],
+            self.screenshot_options["tile"], self.screenshot_options["max_tiles"]
+        )
+        del screenshot
+        
+        # Store the images as raw blobs; the design context only keeps references
+        screenshot_variants = {}
+        for profile, images in processed["images"].items():
+            refs = []
+            for image in images:
+                ref = await self.blob_store.put(image["data"], processed["media_type"])
+                refs.append({**ref, "width": image["width"], "height": image["height"]})
+            screenshot_variants[profile] = refs
+        return screenshot_variants
+
+    async def get_cached_website_data(self, url, viewports=None):
+        """Check if we have cached data for this URL, captured at least at the given viewports"""
+        data = await self.cache.get(self._cache_key(url))
+        if data is not None and viewports and not set(viewports) <= captured_viewports(data):
+            logger.info(f"Cached data for {url} lacks viewports {sorted(set(viewports) - captured_viewports(data))}, rescraping")
+            return None
+        if data is not None and not all(self.blob_store.has(ref) for ref in screenshot_refs(data)):
+            # The screenshot is the model's main reference, so an entry whose
+            # images were evicted from the blob store is scraped again
+            logger.info(f"Screenshots of cached data for {url} are no longer stored, rescraping")
+            return None
+        if data is not None:
+            # Older entries store full element trees per selector
+            data['computed_styles'] = normalize_computed_styles(data.get('computed_styles'))
+        return data
     
+    def is_fresh(self, data):
+        """Whether a cached context can be served without checking the page"""
+        # Entries cached before revalidation have no timestamp and are checked
+        return time.time() - data.get('checked_at', 0) < self.fresh_seconds
+
+    async def revalidate(self, url, data):
+        """
+        Ask the server whether a stale cached page changed.
+
+        Returns the cached context, marked as checked now, if the server
+        answers 304 Not Modified; None if the page changed, has no
+        validators or could not be checked, in which case it is re-scraped.
+        """
+        headers = conditional_headers(data.get('validators'))
+        if not headers:
+            return None
+        if self._http_client is None:
+            self._http_client = httpx.AsyncClient(
+                timeout=httpx.Timeout(15.0, connect=5.0),
+                follow_redirects=True,
+                headers={"User-Agent": DEFAULT_USER_AGENT},
+            )
+        try:
+            async with self._http_client.stream("GET", url, headers=headers) as response:
+                if response.status_code != 304:
+                    return None
+        except httpx.HTTPError as e:
+            logger.info(f"Could not revalidate {url}, re-scraping: {e}")
+            return None
+        logger.info(f"{url} not modified since it was scraped, keeping cached data")
+        return {**data, 'checked_at': time.time(), 'changes': {'changed': False, 'not_modified': True}}
+
+    async def close(self):
+        """Close the revalidation client"""
+        if self._http_client is not None:
+            await self._http_client.aclose()
+            self._http_client = None
+
     def save_to_cache(self, url, data):
-        """Save scraped data to cache"""
-        filename = base64.b64encode(url.encode()).decode().replace('/', '_') + '.json'
-        cache_path = os.path.join(self.cache_dir, filename)  # Use self.cache_dir for consistency
-        
-        with open(cache_path, 'w') as f:
-            json.dump(data, f)
+        """Save scraped data to cache (written to disk in the background)"""
+        self.cache.set_nowait(self._cache_key(url), data)
+
+    def _cache_key(self, url):
+        return cache_key('scrape', normalize_url(url))
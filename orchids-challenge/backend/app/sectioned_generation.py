@@ -0,0 +1,333 @@
+"""
+Sectioned generation: long pages cloned as regions generated concurrently.
+
+A single completion is capped at the model's max_output_tokens, which cuts
+clones of long pages off part way. In sectioned mode the page's top-level
+layout sections are grouped into a few regions (header, hero, content
+sections, footer), each region is generated by its own concurrent call
+from the part of the design context that covers it, and the fragments are
+stitched into one document. Every region is given the same style preamble,
+built from the page's base styles, colors, fonts and root CSS rules, which
+also heads the stitched document; there is no serial call to agree on
+styles first.
+"""
+import html
+import logging
+import os
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from .context_compaction import minify_css
+from .incremental import layout_sections
+from .stylesheets import parse_css, prune_unused_rules
+
+logger = logging.getLogger(__name__)
+
+GENERATION_MODES = ("single", "sectioned", "auto")
+
+# Name fragments of elements that hold a page's header or footer
+_HEADER_NAMES = re.compile(r'header|navbar|topbar|masthead|(?:^|[\s_-])nav(?:$|[\s_-])', re.I)
+_FOOTER_NAMES = re.compile(r'footer', re.I)
+_CLASS_SELECTOR = re.compile(r'(?<!\\)\.((?:\\.|[\w-])+)')
+_ID_SELECTOR = re.compile(r'(?<!\\)#((?:\\.|[\w-])+)')
+_ROOT_SELECTOR = re.compile(r'^\s*(?::root|html|body)(?:\s*,\s*(?::root|html|body))*\s*$', re.I)
+_CODE_FENCE = re.compile(r'```(?:html)?\s*(.*?)```', re.S | re.I)
+_BODY = re.compile(r'<body\b[^>]*>(.*?)(?:</body\s*>|$)', re.S | re.I)
+_HEAD = re.compile(r'<head\b[^>]*>(.*?)</head\s*>', re.S | re.I)
+_STYLE_BLOCK = re.compile(r'<style\b[^>]*>.*?</style\s*>', re.S | re.I)
+
+# Elements nearly every region contains below the depth the layout is captured to
+CONTENT_TAGS = frozenset({
+    "a", "p", "span", "div", "img", "picture", "source", "svg", "path", "g", "ul", "ol", "li",
+    "h1", "h2", "h3", "h4", "h5", "h6", "strong", "em", "b", "i", "small", "br", "hr",
+    "button", "input", "label", "form", "textarea", "select", "option", "table", "thead",
+    "tbody", "tr", "td", "th", "figure", "figcaption", "video", "blockquote", "code", "pre",
+})
+
+# Body properties taken from the page's most common computed values
+_BODY_PROPERTIES = ("font-family", "font-size", "line-height", "color", "letter-spacing")
+
+
+def sectioned_settings() -> Dict[str, Any]:
+    """Sectioned generation settings from the environment"""
+    return {
+        "mode": os.getenv("GENERATION_MODE", "single").lower(),
+        "max_regions": int(os.getenv("SECTIONED_MAX_REGIONS", "6")),
+        "min_page_viewports": float(os.getenv("SECTIONED_MIN_PAGE_VIEWPORTS", "2.5")),
+        "preamble_max_chars": int(os.getenv("SECTIONED_PREAMBLE_MAX_CHARS", "8000")),
+    }
+
+
+def _span(nodes: List[Dict[str, Any]]) -> Tuple[Optional[float], Optional[float]]:
+    """Top and bottom of the nodes in the page, ignoring ones positioned off the page"""
+    boxes = [node.get("position") or {} for node in nodes]
+    boxes = [box for box in boxes if box.get("height") and box.get("y", -1) >= 0]
+    if not boxes:
+        return None, None
+    return min(box["y"] for box in boxes), max(box["y"] + box["height"] for box in boxes)
+
+
+def _names(node: Dict[str, Any]) -> str:
+    return f"{node.get('id') or ''} {node.get('className') or ''}"
+
+
+def _group_by_height(nodes: List[Dict[str, Any]], groups: int) -> List[List[Dict[str, Any]]]:
+    """Split nodes, in order, into at most `groups` runs of roughly equal height"""
+    if groups <= 1 or len(nodes) <= 1:
+        return [nodes] if nodes else []
+    heights = [max(0.0, (node.get("position") or {}).get("height") or 0.0) for node in nodes]
+    target = (sum(heights) or len(nodes)) / groups
+    runs, current, filled = [], [], 0.0
+    for node, height in zip(nodes, heights if sum(heights) else [1.0] * len(nodes)):
+        current.append(node)
+        filled += height
+        if filled >= target * (len(runs) + 1) and len(runs) < groups - 1:
+            runs.append(current)
+            current = []
+    if current:
+        runs.append(current)
+    return runs
+
+
+def plan_regions(design_context: Dict[str, Any], max_regions: int) -> List[Dict[str, Any]]:
+    """
+    Regions of the page in document order, each {name, role, nodes, top, bottom}.
+
+    The first section is the header if it looks like one, and one of the
+    last two the footer likewise; the first remaining section is the hero
+    and the rest are grouped into runs of similar height to stay within
+    max_regions.
+    Pages with fewer than two sections give no regions.
+    """
+    sections = layout_sections(design_context.get("layout"))
+    if len(sections) < 2:
+        return []
+    sections = list(sections)
+    viewport_height = (design_context.get("layout") or {}).get("height") or 1080
+
+    parts: List[Tuple[str, List[Dict[str, Any]]]] = []
+    first = sections[0]
+    first_top, first_bottom = _span([first])
+    if (first.get("tag") in ("header", "nav") or _HEADER_NAMES.search(_names(first))
+            or (first_top is not None and first_top <= 1 and first_bottom - first_top <= viewport_height / 4)):
+        parts.append(("header", [sections.pop(0)]))
+    footer = None
+    # Out-of-flow elements (back-to-top links, overlays) often come after the footer
+    for index in range(len(sections) - 1, max(len(sections) - 3, -1), -1):
+        if sections[index].get("tag") == "footer" or _FOOTER_NAMES.search(_names(sections[index])):
+            footer = sections.pop(index)
+            break
+    if sections:
+        parts.append(("hero", [sections.pop(0)]))
+    room = max(1, max_regions - len(parts) - (1 if footer else 0))
+    for run in _group_by_height(sections, room):
+        parts.append(("section", run))
+    if footer:
+        parts.append(("footer", [footer]))
+
+    regions, numbered = [], 0
+    for role, nodes in parts:
+        if role == "section":
+            numbered += 1
+            name = f"section-{numbered}"
+        else:
+            name = role
+        top, bottom = _span(nodes)
+        regions.append({"name": name, "role": role, "nodes": nodes, "top": top, "bottom": bottom})
+    return regions
+
+
+def page_height(design_context: Dict[str, Any]) -> Optional[float]:
+    return _span(layout_sections(design_context.get("layout")))[1]
+
+
+def resolve_mode(requested: Optional[str], design_context: Dict[str, Any], settings: Optional[Dict[str, Any]] = None) -> str:
+    """
+    "single" or "sectioned" for a generation.
+
+    "auto" sections pages at least min_page_viewports viewports tall that
+    split into three or more regions.
+    """
+    settings = settings or sectioned_settings()
+    mode = (requested or settings["mode"]).lower()
+    if mode not in GENERATION_MODES:
+        raise ValueError(f"Unsupported generation mode: {mode}")
+    if mode != "auto":
+        if mode == "sectioned" and not plan_regions(design_context, settings["max_regions"]):
+            logger.info(f"{design_context.get('url')} has a single layout section, generating it in one piece")
+            return "single"
+        return mode
+    height = page_height(design_context)
+    viewport_height = (design_context.get("layout") or {}).get("height") or 1080
+    if height is None or height < viewport_height * settings["min_page_viewports"]:
+        return "single"
+    return "sectioned" if len(plan_regions(design_context, settings["max_regions"])) >= 3 else "single"
+
+
+def style_preamble(design_context: Dict[str, Any], max_chars: int) -> str:
+    """
+    CSS shared by every region: custom properties for the page's colors and
+    fonts, a body rule from its most common computed values, and the site's
+    own :root / html / body and @font-face rules as far as max_chars allows.
+    """
+    variables = [f"--color-{i + 1}:{color}" for i, color in enumerate((design_context.get("colors") or [])[:12])]
+    variables += [f"--font-{i + 1}:{font}" for i, font in enumerate((design_context.get("fonts") or [])[:4])]
+    rules = []
+    if variables:
+        rules.append(f":root{{{';'.join(variables)}}}")
+    rules.append("*,*::before,*::after{box-sizing:border-box}")
+
+    computed_styles = design_context.get("computed_styles")
+    base_style = computed_styles.get("base_style") if isinstance(computed_styles, dict) else None
+    body = ["margin:0"] + [f"{prop}:{(base_style or {})[prop]}" for prop in _BODY_PROPERTIES if (base_style or {}).get(prop)]
+    rules.append(f"body{{{';'.join(body)}}}")
+
+    size = sum(len(rule) for rule in rules)
+    for rule in design_context.get("css_rules") or []:
+        text = rule.get("cssText") or ""
+        selector = rule.get("selectorText") or ""
+        if not (text.lower().startswith("@font-face") or _ROOT_SELECTOR.match(selector)):
+            continue
+        text = minify_css(text)
+        if size + len(text) > max_chars:
+            continue
+        rules.append(text)
+        size += len(text)
+    return "\n".join(rules)
+
+
+def _collect_names(nodes: List[Dict[str, Any]], tags: set, classes: set, ids: set):
+    for node in nodes:
+        if not isinstance(node, dict):
+            continue
+        if node.get("tag"):
+            tags.add(node["tag"])
+        classes.update((node.get("className") or "").split())
+        if node.get("id"):
+            ids.add(node["id"])
+        _collect_names(node.get("children") or [], tags, classes, ids)
+
+
+def region_contexts(context: Dict[str, Any], regions: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    The simplified design context cut down to each region.
+
+    Each region keeps the page-wide basics, its own layout subtrees, the
+    CSS rules whose selectors can match inside it, the UI components whose
+    classes occur in it, and (for the header and footer) the navigation
+    links. Classes and ids the CSS uses that appear in no captured layout
+    node may sit below the captured depth anywhere, so every region keeps
+    their rules.
+    """
+    css_rules = list(context.get("css_rules") or [])
+    if context.get("inline_styles"):
+        css_rules += parse_css(context["inline_styles"])["rules"]
+
+    names = []
+    for region in regions:
+        tags, classes, ids = set(CONTENT_TAGS), set(), set()
+        _collect_names(region["nodes"], tags, classes, ids)
+        names.append((tags, classes, ids))
+    located_classes = set().union(*(classes for _, classes, _ in names))
+    located_ids = set().union(*(ids for _, _, ids in names))
+    css_classes, css_ids = set(), set()
+    for rule in css_rules:
+        selector = rule.get("selectorText") or rule.get("cssText") or ""
+        css_classes.update(_CLASS_SELECTOR.findall(selector))
+        css_ids.update(_ID_SELECTOR.findall(selector))
+    unlocated_classes, unlocated_ids = css_classes - located_classes, css_ids - located_ids
+
+    contexts = []
+    for region, (tags, classes, ids) in zip(regions, names):
+        used = {"tags": tags, "classes": classes | unlocated_classes, "ids": ids | unlocated_ids}
+        rules, _ = prune_unused_rules(css_rules, used)
+        components = {
+            kind: [item for item in items if set(_component_classes(item)) & classes]
+            for kind, items in (context.get("ui_components") or {}).items()
+        }
+        identities = {(node.get("tag"), node.get("id"), node.get("className")) for node in region["nodes"]}
+        breakpoints = {}
+        for name, breakpoint in (context.get("breakpoints") or {}).items():
+            layout = breakpoint.get("layout") or {}
+            nodes = [node for node in layout_sections(layout)
+                     if (node.get("tag"), node.get("id"), node.get("className")) in identities]
+            breakpoints[name] = {**breakpoint, "layout": {**layout, "structure": nodes}}
+        region_context = {
+            "url": context.get("url"),
+            "base_domain": context.get("base_domain"),
+            "title": context.get("title"),
+            "favicon": context.get("favicon") if region["role"] == "header" else None,
+            "region": {"name": region["name"], "role": region["role"], "top": region["top"], "bottom": region["bottom"]},
+            "headings": context.get("headings"),
+            "colors": context.get("colors"),
+            "fonts": context.get("fonts"),
+            "navigation_links": context.get("navigation_links") if region["role"] in ("header", "footer") else [],
+            "ui_components": {kind: items for kind, items in components.items() if items},
+            "layout": {**(context.get("layout") or {}), "structure": region["nodes"]},
+            "breakpoints": breakpoints,
+            "css_rules": rules,
+        }
+        contexts.append(region_context)
+    return contexts
+
+
+def _component_classes(component: Dict[str, Any]) -> List[str]:
+    classes = (component.get("attributes") or {}).get("class") or []
+    return classes.split() if isinstance(classes, str) else list(classes)
+
+
+def region_screenshots(screenshots: List[Tuple[str, str]], region: Dict[str, Any], viewport_height: float) -> List[Tuple[str, str]]:
+    """The screenshot tiles covering a region; all of them if the page was not tiled"""
+    if len(screenshots) < 2 or region["top"] is None:
+        return screenshots
+    # Tile i is the slice [i * viewport_height, (i + 1) * viewport_height) of the page
+    covering = [
+        tile for i, tile in enumerate(screenshots)
+        if i * viewport_height < region["bottom"] and (i + 1) * viewport_height > region["top"]
+    ]
+    return covering or screenshots
+
+
+def region_instructions(region: Dict[str, Any], regions: List[Dict[str, Any]], preamble: str, page_width: int) -> str:
+    """Prompt text telling the model which part of the page to write and how it is assembled"""
+    order = ", ".join(r["name"] for r in regions)
+    span = (f" It covers the page from y={region['top']:.0f}px to y={region['bottom']:.0f}px at {page_width}px wide."
+            if region["top"] is not None else "")
+    return (
+        f"\n\nGenerate ONLY the \"{region['name']}\" region of this page ({region['role']}).{span} "
+        f"The page is assembled from these regions in order: {order}; the others are written separately. "
+        "The design context above covers just this region.\n\n"
+        f"Output a single root element with the attribute data-region=\"{region['name']}\" containing the region's "
+        "markup, optionally preceded by one <style> block whose selectors all start with "
+        f"[data-region=\"{region['name']}\"]. Do not output <!DOCTYPE>, <html>, <head> or <body>. "
+        "The document head already contains this shared stylesheet; use its custom properties and do not repeat it:\n\n"
+        f"<style>\n{preamble}\n</style>"
+    )
+
+
+def extract_fragment(text: str) -> str:
+    """The region markup from a model response, without fences, prose or document wrappers"""
+    fenced = _CODE_FENCE.search(text)
+    if fenced:
+        text = fenced.group(1)
+    body = _BODY.search(text)
+    if body:
+        head = _HEAD.search(text)
+        styles = _STYLE_BLOCK.findall(head.group(1)) if head else []
+        text = "\n".join(styles + [body.group(1)])
+    start, end = text.find("<"), text.rfind(">")
+    return text[start:end + 1].strip() if start != -1 and end > start else text.strip()
+
+
+def document_head(context: Dict[str, Any], preamble: str) -> str:
+    """Start of the stitched document, up to and including <body>"""
+    favicon = f'\n<link rel="icon" href="{html.escape(context["favicon"])}">' if context.get("favicon") else ""
+    return (
+        "<!DOCTYPE html>\n<html lang=\"en\">\n<head>\n<meta charset=\"utf-8\">\n"
+        '<meta name="viewport" content="width=device-width, initial-scale=1.0">\n'
+        f"<title>{html.escape(context.get('title') or '')}</title>{favicon}\n"
+        f"<style>\n{preamble}\n</style>\n</head>\n<body>\n"
+    )
+
+
+DOCUMENT_TAIL = "</body>\n</html>\n"
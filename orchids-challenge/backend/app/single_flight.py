@@ -0,0 +1,62 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls for the same key onto one in-flight task.
+
+    The first caller for a key (the leader) starts the work; callers that
+    arrive before it finishes await the same task and get the same result or
+    exception. The work is shielded, so a cancelled caller never cancels it
+    for the others. Once the task finishes the key is released and the next
+    call starts fresh work.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        # key -> (task, owner of the leading call)
+        self._calls: Dict[str, Tuple[asyncio.Task, Optional[str]]] = {}
+        self._stats = {"leaders": 0, "followers": 0}
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]], owner: Optional[str] = None):
+        """
+        Run fn once per key across concurrent callers.
+
+        Returns (result, leader) where leader is the owner of the call whose
+        work was shared, or None if this caller did the work itself.
+        """
+        call = self._calls.get(key)
+        if call is not None:
+            task, leader = call
+            self._stats["followers"] += 1
+            logger.info(f"[{self.name}] {owner} joined in-flight work of {leader}")
+            return await asyncio.shield(task), leader
+
+        task = asyncio.ensure_future(fn())
+        self._calls[key] = (task, owner)
+        self._stats["leaders"] += 1
+        task.add_done_callback(lambda done: self._release(key, done))
+        return await asyncio.shield(task), None
+
+    def leader(self, key: str) -> Optional[str]:
+        """Owner of the call in flight for key, or None if there is none"""
+        call = self._calls.get(key)
+        return call[1] if call is not None else None
+
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self._stats, "in_flight": len(self._calls)}
+
+    def _release(self, key: str, task: asyncio.Task):
+        current = self._calls.get(key)
+        if current is not None and current[0] is task:
+            del self._calls[key]
+        # Mark the exception as retrieved even if every caller was cancelled
+        if not task.cancelled():
+            task.exception()
@@ -0,0 +1,389 @@
+"""
+Linked stylesheets the page's CSSOM would not expose, and pruning of CSS
+rules the page never uses.
+
+Cross-origin stylesheets (CDN frameworks, font CSS) cannot be read through
+document.styleSheets, so they are downloaded here over a pooled client and
+parsed into the same {selectorText, cssText} rules. Parsed sheets are
+cached by content hash, with the URL's ETag / Last-Modified kept to
+revalidate, so a shared bundle is downloaded and parsed once across jobs.
+
+parse_css and prune_unused_rules are module-level so they can run in the
+process worker pool.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import re
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urljoin
+
+import httpx
+
+from .cache import TieredCache, cache_key
+from .single_flight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+# Nested @import chains followed from a fetched stylesheet
+MAX_IMPORT_DEPTH = 2
+
+# Group rules whose body is itself a list of rules
+_GROUP_RULES = ("@media", "@supports", "@container", "@layer", "@document", "@-moz-document")
+_KEYFRAMES = re.compile(r'^@(?:-[a-z]+-)?keyframes\s+([^\s{]+)', re.I)
+_FONT_FACE_FAMILY = re.compile(r'font-family\s*:\s*([^;}]+)', re.I)
+_COMMENT = re.compile(r'/\*.*?\*/', re.S)
+_URL = re.compile(r'url\(\s*([\'"]?)([^\'")]+)\1\s*\)', re.I)
+_IMPORT = re.compile(r'^@import\s+(?:url\(\s*)?[\'"]?([^\'")\s;]+)', re.I)
+
+# Pieces of a selector that do not name an element: pseudo-classes and
+# -elements (with arguments) and attribute conditions, unless escaped
+_PSEUDO = re.compile(r'(?<!\\)::?[\w-]+(?:\((?:[^()]|\([^()]*\))*\))?')
+_ATTRIBUTE = re.compile(r'(?<!\\)\[[^\]]*\]')
+_COMBINATOR = re.compile(r'\s*(?<!\\)[>+~]\s*|(?<!\\)\s+')
+_SIMPLE = re.compile(r'(?<!\\)([.#])((?:\\.|[\w-])+)')
+_TAG = re.compile(r'^((?:\\.|[\w-])+)')
+_ESCAPE = re.compile(r'\\([0-9a-fA-F]{1,6}\s?|.)')
+
+
+def split_rules(css: str) -> List[str]:
+    """Top-level rules and statements of a stylesheet, respecting nesting, strings and comments"""
+    css = _COMMENT.sub('', css)
+    rules, depth, start, quote = [], 0, 0, None
+    i, length = 0, len(css)
+    while i < length:
+        char = css[i]
+        if quote:
+            if char == '\\':
+                i += 1
+            elif char == quote:
+                quote = None
+        elif char in ('"', "'"):
+            quote = char
+        elif char == '{':
+            depth += 1
+        elif char == '}':
+            depth -= 1
+            if depth <= 0:
+                depth = 0
+                rule = css[start:i + 1].strip()
+                if rule and rule != '}':
+                    rules.append(rule)
+                start = i + 1
+        elif char == ';' and depth == 0:
+            # Statement at-rules: @import, @charset, @layer a, b;
+            rule = css[start:i + 1].strip()
+            if rule.startswith('@'):
+                rules.append(rule)
+            start = i + 1
+        i += 1
+    return rules
+
+
+def _absolute_urls(css: str, base_url: str) -> str:
+    def resolve(match):
+        url = match.group(2).strip()
+        if url.startswith(('data:', 'http://', 'https://', '#')):
+            return match.group(0)
+        return f'url("{urljoin(base_url, url)}")'
+    return _URL.sub(resolve, css)
+
+
+def parse_css(css: str, base_url: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Parse stylesheet text into {"rules": [{selectorText, cssText}], "imports": [url]}.
+
+    Relative url() references are resolved against base_url so rules still
+    work once taken out of their stylesheet. At-rules have no selectorText,
+    like their CSSOM counterparts.
+    """
+    rules, imports = [], []
+    for text in split_rules(css):
+        if base_url:
+            text = _absolute_urls(text, base_url)
+        if text.startswith('@'):
+            match = _IMPORT.match(text)
+            if match:
+                imports.append(urljoin(base_url, match.group(1)) if base_url else match.group(1))
+                continue
+            if text.lower().startswith('@charset'):
+                continue
+            rules.append({'selectorText': None, 'cssText': text})
+        else:
+            rules.append({'selectorText': text[:text.index('{')].strip(), 'cssText': text})
+    return {'rules': rules, 'imports': imports}
+
+
+def _unescape(identifier: str) -> str:
+    def replace(match):
+        value = match.group(1)
+        if len(value.strip()) > 1 or re.fullmatch(r'[0-9a-fA-F]\s?', value):
+            return chr(int(value.strip(), 16))
+        return value
+    return _ESCAPE.sub(replace, identifier)
+
+
+def _split_selectors(selector_text: str) -> List[str]:
+    """Comma-separated selectors, ignoring commas inside :is(...) and similar"""
+    selectors, depth, start = [], 0, 0
+    for i, char in enumerate(selector_text):
+        if char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        elif char == ',' and depth == 0:
+            selectors.append(selector_text[start:i].strip())
+            start = i + 1
+    selectors.append(selector_text[start:].strip())
+    return [s for s in selectors if s]
+
+
+def selector_matches(selector: str, used: Dict[str, set]) -> bool:
+    """
+    Whether the element a selector targets can be on the page.
+
+    Only the rightmost compound selector is checked: its tag, classes and
+    ids must all occur in the page's HTML. Selectors that name nothing
+    checkable (*, :root, pseudo-only) are kept.
+    """
+    bare = _ATTRIBUTE.sub('', _PSEUDO.sub('', selector)).strip()
+    if not bare:
+        return True
+    compound = _COMBINATOR.split(bare)[-1]
+    if not compound or compound == '*':
+        return True
+    tag = _TAG.match(compound)
+    if tag and tag.group(1).lower() not in used['tags']:
+        return False
+    for kind, name in _SIMPLE.findall(compound):
+        if _unescape(name) not in (used['classes'] if kind == '.' else used['ids']):
+            return False
+    return True
+
+
+def _prune_rule(text: str, used: Dict[str, set]) -> Optional[str]:
+    """The rule with unused selectors removed, or None if nothing in it applies"""
+    if text.startswith('@') or '{' not in text:
+        lowered = text.lower()
+        if lowered.startswith(_GROUP_RULES) and '{' in text:
+            prelude, body = text[:text.index('{')], text[text.index('{') + 1:text.rindex('}')]
+            kept = [rule for rule in (_prune_rule(inner, used) for inner in split_rules(body)) if rule]
+            return f"{prelude.strip()} {{ {' '.join(kept)} }}" if kept else None
+        return text
+    selector_text, body = text[:text.index('{')], text[text.index('{'):]
+    kept = [selector for selector in _split_selectors(selector_text) if selector_matches(selector, used)]
+    return f"{', '.join(kept)} {body}" if kept else None
+
+
+def prune_unused_rules(css_rules: List[Dict[str, Any]], used_selectors: Dict[str, List[str]]) -> Tuple[List[Dict[str, Any]], Dict[str, int]]:
+    """
+    Drop rules and selectors that match nothing in the page's HTML.
+
+    used_selectors holds the tags, classes and ids present in the HTML.
+    @keyframes and @font-face blocks are kept only if a remaining rule
+    refers to their name. Returns (rules, stats).
+    """
+    used = {key: set(values) for key, values in used_selectors.items()}
+    kept, deferred = [], []
+    chars_before = 0
+    for rule in css_rules:
+        text = rule.get('cssText') if isinstance(rule, dict) else rule
+        if not text:
+            continue
+        chars_before += len(text)
+        if _KEYFRAMES.match(text) or text.lower().startswith('@font-face'):
+            deferred.append((len(kept), text))
+            kept.append(None)
+            continue
+        pruned = _prune_rule(text, used)
+        if pruned:
+            kept.append({'selectorText': None if pruned.startswith('@') else pruned[:pruned.index('{')].strip(), 'cssText': pruned})
+
+    # Animations and fonts are referenced by name from the rules that survived
+    referenced = ' '.join(rule['cssText'] for rule in kept if rule).lower()
+    for index, text in deferred:
+        keyframes = _KEYFRAMES.match(text)
+        if keyframes:
+            name = keyframes.group(1).strip('\'"').lower()
+        else:
+            family = _FONT_FACE_FAMILY.search(text)
+            name = family.group(1).strip().strip('\'"').lower() if family else ''
+        if name and name in referenced:
+            kept[index] = {'selectorText': None, 'cssText': text}
+
+    rules = [rule for rule in kept if rule]
+    stats = {
+        'rules_before': sum(1 for rule in css_rules if (rule.get('cssText') if isinstance(rule, dict) else rule)),
+        'rules_after': len(rules),
+        'chars_before': chars_before,
+        'chars_after': sum(len(rule['cssText']) for rule in rules),
+    }
+    return rules, stats
+
+
+class StylesheetFetcher:
+    """
+    Downloads and parses stylesheets, shared by every scrape.
+
+    Parsed rule lists are cached by content hash (and the directory they
+    were served from, since relative URLs are resolved against it). Each
+    URL's ETag / Last-Modified is cached too: within CSS_CACHE_FRESH_SECONDS
+    a URL is served from cache without a request, after that it is
+    revalidated with a conditional GET. Concurrent fetches of one URL are
+    coalesced.
+    """
+
+    def __init__(
+        self,
+        cache_dir: str = ".cache",
+        worker_pool=None,
+        max_connections: Optional[int] = None,
+        concurrency: Optional[int] = None,
+        timeout: float = 15.0,
+        user_agent: Optional[str] = None,
+    ):
+        self.worker_pool = worker_pool
+        self.max_connections = max_connections or int(os.getenv("CSS_FETCH_MAX_CONNECTIONS", "20"))
+        self.concurrency = concurrency or int(os.getenv("CSS_FETCH_CONCURRENCY", "8"))
+        self.max_bytes = int(os.getenv("CSS_FETCH_MAX_BYTES", str(5 * 1024 * 1024)))
+        self.fresh_seconds = float(os.getenv("CSS_CACHE_FRESH_SECONDS", "3600"))
+        self.timeout = timeout
+        self.user_agent = user_agent
+        self.cache = TieredCache(
+            os.path.join(cache_dir, "css"),
+            default_ttl=float(os.getenv("CSS_CACHE_TTL_SECONDS", str(7 * 86400))),
+            max_bytes=int(os.getenv("CSS_CACHE_MAX_BYTES", str(256 * 1024 * 1024))),
+            memory_max_bytes=int(os.getenv("CSS_CACHE_MEMORY_MAX_BYTES", str(32 * 1024 * 1024))),
+            memory_max_entries=256,
+        )
+        self._client: Optional[httpx.AsyncClient] = None
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._flight = SingleFlight("stylesheet")
+        self._stats = {"requests": 0, "fresh_hits": 0, "not_modified": 0, "content_hits": 0,
+                       "parsed": 0, "errors": 0, "bytes_downloaded": 0}
+
+    async def start(self):
+        """Create the pooled client"""
+        if self._client is not None:
+            return
+        headers = {"Accept": "text/css,*/*;q=0.1"}
+        if self.user_agent:
+            headers["User-Agent"] = self.user_agent
+        self._client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections),
+            timeout=httpx.Timeout(self.timeout, connect=5.0),
+            follow_redirects=True,
+            headers=headers,
+        )
+
+    async def stop(self):
+        """Close the pooled client and write pending cache entries"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+        await self.cache.flush()
+
+    async def fetch_all(self, urls: List[str]) -> Tuple[Dict[str, List[Dict[str, Any]]], Dict[str, Any]]:
+        """
+        Fetch and parse stylesheets concurrently.
+
+        Returns ({url: rules}, report). A stylesheet that cannot be fetched
+        is left out and listed in the report's errors.
+        """
+        if self._client is None:
+            await self.start()
+        started = time.perf_counter()
+        before = dict(self._stats)
+        unique = list(dict.fromkeys(urls))
+        results = await asyncio.gather(*(self._fetch_with_imports(url, 0) for url in unique), return_exceptions=True)
+
+        sheets, errors = {}, {}
+        for url, result in zip(unique, results):
+            if isinstance(result, BaseException):
+                errors[url] = (str(result).splitlines() or [type(result).__name__])[0]
+            else:
+                sheets[url] = result
+        report = {key: self._stats[key] - before[key] for key in self._stats}
+        report.update(stylesheets=len(unique), errors=errors, duration_ms=round((time.perf_counter() - started) * 1000, 2))
+        return sheets, report
+
+    async def _fetch_with_imports(self, url: str, depth: int) -> List[Dict[str, Any]]:
+        parsed, _ = await self._flight.do(url, lambda: self._fetch(url))
+        rules = []
+        if depth < MAX_IMPORT_DEPTH:
+            # Imported sheets come first, as in the cascade
+            for imported in parsed["imports"]:
+                try:
+                    rules.extend(await self._fetch_with_imports(imported, depth + 1))
+                except Exception as e:
+                    logger.info(f"Skipping stylesheet {imported} imported by {url}: {e}")
+        rules.extend(parsed["rules"])
+        return rules
+
+    async def _fetch(self, url: str) -> Dict[str, Any]:
+        """Parsed stylesheet for a URL, from cache, after revalidation or freshly downloaded"""
+        url_key = cache_key("stylesheet-url", url)
+        meta = await self.cache.get(url_key)
+        if meta is not None and time.time() - meta["checked_at"] < self.fresh_seconds:
+            parsed = await self.cache.get(meta["parsed_key"])
+            if parsed is not None:
+                self._stats["fresh_hits"] += 1
+                return parsed
+
+        headers = {}
+        if meta is not None:
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+
+        async with self._semaphore:
+            self._stats["requests"] += 1
+            try:
+                async with self._client.stream("GET", url, headers=headers) as response:
+                    if response.status_code == 304 and meta is not None:
+                        parsed = await self.cache.get(meta["parsed_key"])
+                        if parsed is not None:
+                            self._stats["not_modified"] += 1
+                            self.cache.set_nowait(url_key, {**meta, "checked_at": time.time()})
+                            return parsed
+                    response.raise_for_status()
+                    body = bytearray()
+                    async for chunk in response.aiter_bytes():
+                        body.extend(chunk)
+                        if len(body) > self.max_bytes:
+                            raise ValueError(f"Stylesheet larger than {self.max_bytes} bytes")
+                    encoding = response.encoding or "utf-8"
+                    etag, last_modified = response.headers.get("etag"), response.headers.get("last-modified")
+            except Exception:
+                self._stats["errors"] += 1
+                raise
+        self._stats["bytes_downloaded"] += len(body)
+
+        # Same bytes from the same directory parse to the same rules, whatever the URL
+        digest = hashlib.sha256(body).hexdigest()
+        parsed_key = cache_key("stylesheet", digest, urljoin(url, "."))
+        parsed = await self.cache.get(parsed_key)
+        if parsed is not None:
+            self._stats["content_hits"] += 1
+        else:
+            text = bytes(body).decode(encoding, errors="replace")
+            if self.worker_pool is not None:
+                parsed = await self.worker_pool.run(parse_css, text, url)
+            else:
+                parsed = await asyncio.to_thread(parse_css, text, url)
+            self._stats["parsed"] += 1
+            self.cache.set_nowait(parsed_key, parsed)
+        self.cache.set_nowait(url_key, {
+            "etag": etag,
+            "last_modified": last_modified,
+            "sha256": digest,
+            "parsed_key": parsed_key,
+            "checked_at": time.time(),
+        })
+        return parsed
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self._stats, "cache": self.cache.stats(), "in_flight": self._flight.in_flight()}
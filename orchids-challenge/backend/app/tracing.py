@@ -0,0 +1,165 @@
+"""
+Optional OpenTelemetry tracing of the clone pipeline.
+
+Each clone job is one trace. The job's span has child spans for the scrape
+(navigation, screenshots, the in-page computed-style walk, HTML parsing)
+and the generation (each provider call, each region of a sectioned clone),
+carrying payload sizes and element counts as attributes. The trace ID is
+stored on the job so a slow job can be looked up in the trace backend.
+
+Tracing is off unless TRACING_EXPORTER is set:
+- "otlp" sends spans to a collector, at OTEL_EXPORTER_OTLP_ENDPOINT
+  (default http://localhost:4318).
+- "file" appends them as JSON lines to TRACING_FILE
+  (default traces/spans.jsonl), which works offline.
+- "console" prints them.
+
+It needs the optional opentelemetry-sdk package, and "otlp" also needs
+opentelemetry-exporter-otlp-proto-http. Without them, or with tracing
+off, span() yields a no-op span.
+"""
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from typing import Any, Optional
+
+try:
+    from opentelemetry import trace
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import (
+        BatchSpanProcessor, ConsoleSpanExporter, SpanExporter, SpanExportResult,
+    )
+    OTEL_AVAILABLE = True
+except ImportError:
+    OTEL_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+TRACING_EXPORTERS = ("none", "otlp", "file", "console")
+
+_provider = None
+_tracer = None
+
+
+class _NoopSpan:
+    """Span used while tracing is off"""
+
+    def set_attribute(self, key, value):
+        pass
+
+    def add_event(self, name, attributes=None):
+        pass
+
+    def record_exception(self, exception):
+        pass
+
+    def set_status(self, status):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+if OTEL_AVAILABLE:
+    class FileSpanExporter(SpanExporter):
+        """Appends finished spans to a file, one JSON object per line"""
+
+        def __init__(self, path: str):
+            self.path = path
+            self._lock = threading.Lock()
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+        def export(self, spans):
+            lines = "".join(span.to_json(indent=None) + "\n" for span in spans)
+            try:
+                with self._lock, open(self.path, "a", encoding="utf-8") as f:
+                    f.write(lines)
+            except OSError as e:
+                logger.warning(f"Could not write spans to {self.path}: {e}")
+                return SpanExportResult.FAILURE
+            return SpanExportResult.SUCCESS
+
+        def shutdown(self):
+            pass
+
+
+def setup_tracing(service_name: str = "website-cloning-api") -> bool:
+    """Start exporting spans as TRACING_EXPORTER says; returns whether tracing is on"""
+    global _provider, _tracer
+    exporter_name = os.getenv("TRACING_EXPORTER", "none").lower()
+    if exporter_name == "none" or _provider is not None:
+        return _provider is not None
+    if exporter_name not in TRACING_EXPORTERS:
+        logger.warning(f"Unknown TRACING_EXPORTER {exporter_name!r}, tracing is off")
+        return False
+    if not OTEL_AVAILABLE:
+        logger.warning("TRACING_EXPORTER is set but opentelemetry-sdk is not installed, tracing is off")
+        return False
+
+    if exporter_name == "otlp":
+        try:
+            from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        except ImportError:
+            logger.warning("TRACING_EXPORTER=otlp needs opentelemetry-exporter-otlp-proto-http, tracing is off")
+            return False
+        # Reads OTEL_EXPORTER_OTLP_ENDPOINT / _HEADERS itself
+        exporter = OTLPSpanExporter()
+    elif exporter_name == "file":
+        exporter = FileSpanExporter(os.getenv("TRACING_FILE", os.path.join("traces", "spans.jsonl")))
+    else:
+        exporter = ConsoleSpanExporter()
+
+    _provider = TracerProvider(resource=Resource.create({"service.name": os.getenv("OTEL_SERVICE_NAME", service_name)}))
+    _provider.add_span_processor(BatchSpanProcessor(exporter))
+    _tracer = _provider.get_tracer(__name__)
+    logger.info(f"Tracing enabled, exporting spans to {exporter_name}")
+    return True
+
+
+def shutdown_tracing():
+    """Export the spans still buffered and stop tracing"""
+    global _provider, _tracer
+    if _provider is not None:
+        _provider.shutdown()
+    _provider = _tracer = None
+
+
+@contextmanager
+def span(name: str, **attributes: Any):
+    """
+    Run the block in a child span of the current one.
+
+    Attributes whose value is None are skipped. An exception escaping the
+    block is recorded on the span and marks it as an error.
+    """
+    if _tracer is None:
+        yield _NOOP_SPAN
+        return
+    with _tracer.start_as_current_span(name) as current:
+        set_attributes(current, **attributes)
+        yield current
+
+
+def set_attributes(current, **attributes: Any):
+    """Set span attributes, skipping None values, which OpenTelemetry rejects"""
+    for key, value in attributes.items():
+        if value is not None:
+            current.set_attribute(key, value)
+
+
+def record_error(current, error: BaseException):
+    """Mark a span as failed by an exception that was handled inside it"""
+    if _tracer is None:
+        return
+    current.record_exception(error)
+    current.set_status(trace.Status(trace.StatusCode.ERROR, str(error)))
+
+
+def current_trace_id() -> Optional[str]:
+    """Hex ID of the trace the caller is running in, or None when tracing is off"""
+    if _tracer is None:
+        return None
+    context = trace.get_current_span().get_span_context()
+    return format(context.trace_id, "032x") if context.is_valid else None
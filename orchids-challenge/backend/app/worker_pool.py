@@ -0,0 +1,79 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ProcessWorkerPool:
+    """
+    Process pool for CPU-bound post-processing of scraped pages.
+
+    Work such as image resizing runs in separate processes so it neither
+    blocks the event loop nor competes for the GIL with request handling.
+    Workers are spawned (not forked) so they never inherit the loop, the
+    browser or open sockets. Before start() and after stop() work runs in a
+    thread instead, so callers need not care whether the pool is up.
+    """
+
+    def __init__(self, max_workers: Optional[int] = None):
+        self.max_workers = max_workers or int(os.getenv("PROCESS_POOL_WORKERS", str(min(4, os.cpu_count() or 1))))
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._active = 0
+        self._stats = {"tasks": 0, "errors": 0, "thread_fallbacks": 0, "restarts": 0}
+
+    def start(self):
+        """Create the pool; worker processes are spawned on first use"""
+        if self._executor is not None:
+            return
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+        logger.info(f"Process worker pool started with {self.max_workers} workers")
+
+    async def stop(self):
+        """Shut the pool down, cancelling work that has not started"""
+        executor, self._executor = self._executor, None
+        if executor is not None:
+            await asyncio.to_thread(executor.shutdown, wait=True, cancel_futures=True)
+
+    @property
+    def started(self) -> bool:
+        return self._executor is not None
+
+    async def run(self, fn: Callable[..., Any], *args) -> Any:
+        """Run a picklable module-level function in a worker process and return its result"""
+        self._stats["tasks"] += 1
+        if self._executor is None:
+            self._stats["thread_fallbacks"] += 1
+            return await asyncio.to_thread(fn, *args)
+
+        self._active += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+        except BrokenProcessPool:
+            # A worker died (e.g. OOM-killed); replace the pool so later work can run
+            self._stats["errors"] += 1
+            self._stats["restarts"] += 1
+            logger.error("Process worker pool broke, restarting it")
+            self._executor = None
+            self.start()
+            raise
+        except Exception:
+            self._stats["errors"] += 1
+            raise
+        finally:
+            self._active -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self._stats,
+            "max_workers": self.max_workers,
+            "active": self._active,
+            "started": self.started,
+        }
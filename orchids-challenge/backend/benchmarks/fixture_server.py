@@ -0,0 +1,151 @@
+"""
+Static stand-in for the websites stored in .cache.
+
+Serves each cached page's HTML at /<host><path> so scrapes can be replayed
+without the network. Pages are made self-contained: scripts and external
+stylesheet links are dropped, the page's captured CSS rules are inlined in
+their place and remote images point at a local placeholder.
+
+Run from the backend directory:
+    python -m benchmarks.fixture_server [--port 8801] [--latency-ms 0]
+"""
+import argparse
+import base64
+import glob
+import json
+import os
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Tuple
+from urllib.parse import urlparse
+
+# 1x1 transparent PNG served for every image
+PIXEL_PNG = base64.b64decode(
+    "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNkYPhfDwAChwGA60e6kgAAAABJRU5ErkJggg=="
+)
+PIXEL_PATH = "/_fixture/pixel.png"
+
+_SCRIPTS = re.compile(r"<script\b[^>]*>.*?</script\s*>", re.I | re.S)
+_REMOTE_LINKS = re.compile(r"<link\b[^>]*\bhref=[\"']?(?:https?:)?//[^>]*>", re.I)
+_REMOTE_SOURCES = re.compile(r"\b(src|srcset)=([\"'])(?:https?:)?//[^\"']*\2", re.I)
+_IFRAMES = re.compile(r"<iframe\b[^>]*>.*?</iframe\s*>", re.I | re.S)
+
+
+def page_path(url: str) -> str:
+    """Path a cached page is served at"""
+    parsed = urlparse(url)
+    return f"/{parsed.netloc}{parsed.path or '/'}"
+
+
+def self_contained(html: str, css_rules: List[Dict[str, str]]) -> str:
+    """A page's HTML without anything that would be fetched from another host"""
+    html = _SCRIPTS.sub("", html)
+    html = _IFRAMES.sub("", html)
+    html = _REMOTE_LINKS.sub("", html)
+    html = _REMOTE_SOURCES.sub(lambda match: f'{match.group(1)}="{PIXEL_PATH}"', html)
+    style = "<style data-fixture>" + "\n".join(rule.get("cssText", "") for rule in css_rules) + "</style>"
+    head_end = html.lower().find("</head>")
+    if head_end == -1:
+        return style + html
+    return html[:head_end] + style + html[head_end:]
+
+
+def load_fixtures(cache_dir: str = ".cache") -> Dict[str, Tuple[str, bytes]]:
+    """path -> (original url, page bytes) for every page snapshot stored directly in the cache directory"""
+    fixtures = {}
+    for path in sorted(glob.glob(os.path.join(cache_dir, "*.json"))):
+        with open(path) as f:
+            data = json.load(f)
+        if not data.get("html_sample"):
+            continue
+        html = self_contained(data["html_sample"], data.get("css_rules") or [])
+        fixtures[page_path(data["url"])] = (data["url"], html.encode("utf-8"))
+    return fixtures
+
+
+class FixtureServer:
+    """Threaded HTTP server for the cached pages, with an optional delay before each document"""
+
+    def __init__(self, cache_dir: str = ".cache", host: str = "127.0.0.1", port: int = 0, latency_ms: float = 0):
+        self.fixtures = load_fixtures(cache_dir)
+        if not self.fixtures:
+            raise ValueError(f"No cached pages with html_sample in {cache_dir}")
+        self.latency_ms = latency_ms
+        self.requests = 0
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def urls(self) -> List[str]:
+        """Address of every served page"""
+        return [self.base_url + path for path in self.fixtures]
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fixture-server", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.requests += 1
+                path = urlparse(self.path).path
+                if path == PIXEL_PATH:
+                    return self._send(200, "image/png", PIXEL_PNG)
+                if path == "/":
+                    listing = "".join(f'<li><a href="{p}">{url}</a></li>' for p, (url, _) in server.fixtures.items())
+                    return self._send(200, "text/html; charset=utf-8", f"<ul>{listing}</ul>".encode("utf-8"))
+                fixture = server.fixtures.get(path) or server.fixtures.get(path.rstrip("/") + "/")
+                if fixture is None:
+                    return self._send(404, "text/plain", b"not found")
+                if server.latency_ms:
+                    time.sleep(server.latency_ms / 1000)
+                self._send(200, "text/html; charset=utf-8", fixture[1])
+
+            def _send(self, status, content_type, body):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.send_header("Cache-Control", "no-store")
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--cache-dir", default=".cache")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8801)
+    parser.add_argument("--latency-ms", type=float, default=0, help="delay before serving each page")
+    args = parser.parse_args()
+
+    server = FixtureServer(args.cache_dir, args.host, args.port, args.latency_ms)
+    for url in server.urls():
+        print(url)
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server._server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Benchmark HTML extraction on the pages stored in .cache.
+
+Compares the BeautifulSoup passes with the single-pass lxml walk, checks
+that both produce the same fields, and measures the round trip through
+the process worker pool.
+
+Run from the backend directory:
+    python -m benchmarks.html_extraction [--repeat N]
+"""
+import argparse
+import asyncio
+import glob
+import json
+import os
+import statistics
+import time
+
+from app.html_extraction import LXML_AVAILABLE, extract_html_data, extract_with_soup
+from app.worker_pool import ProcessWorkerPool
+
+
+def load_pages(cache_dir: str):
+    """(url, html) for every page snapshot stored directly in the cache directory"""
+    pages = []
+    for path in sorted(glob.glob(os.path.join(cache_dir, "*.json"))):
+        with open(path) as f:
+            data = json.load(f)
+        if data.get("html_sample"):
+            pages.append((data["url"], data["html_sample"]))
+    return pages
+
+
+def comparable(data):
+    """Extraction output without component markup, where void tags serialize differently (<br/> vs <br>)"""
+    components = {
+        kind: [{k: v for k, v in item.items() if k != "html"} for item in items]
+        for kind, items in data["ui_components"].items()
+    }
+    return {**data, "ui_components": components}
+
+
+def time_ms(fn, *args, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn(*args)
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+async def time_pool_ms(pool: ProcessWorkerPool, html: str, url: str, repeat: int) -> float:
+    # Warm the workers so process start-up is not counted
+    await pool.run(extract_html_data, html, url)
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        await pool.run(extract_html_data, html, url)
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--cache-dir", default=".cache")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    pages = load_pages(args.cache_dir)
+    if not pages:
+        raise SystemExit(f"No cached pages with html_sample in {args.cache_dir}")
+    if not LXML_AVAILABLE:
+        print("lxml is not installed; extract_html_data falls back to BeautifulSoup\n")
+
+    pool = ProcessWorkerPool(max_workers=1)
+    pool.start()
+    print(f"{'page':<40} {'KB':>6} {'soup ms':>9} {'single-pass ms':>15} {'speedup':>8} {'pooled ms':>10} {'same':>5}")
+    try:
+        for url, html in pages:
+            soup_ms = time_ms(extract_with_soup, html, url, repeat=args.repeat)
+            fast_ms = time_ms(extract_html_data, html, url, repeat=args.repeat)
+            pooled_ms = asyncio.run(time_pool_ms(pool, html, url, args.repeat))
+            same = comparable(extract_with_soup(html, url)) == comparable(extract_html_data(html, url))
+            print(f"{url:<40} {len(html) / 1024:>6.1f} {soup_ms:>9.2f} {fast_ms:>15.2f} "
+                  f"{soup_ms / fast_ms:>7.1f}x {pooled_ms:>10.2f} {'yes' if same else 'no':>5}")
+    finally:
+        asyncio.run(pool.stop())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,390 @@
+"""
+Load test of the clone API against offline stand-ins.
+
+Starts the cached-page fixture server (benchmarks.fixture_server), the mock
+LLM providers (benchmarks.mock_llm) and the app (uvicorn app.main:app) in
+a scratch directory, so caches and the job database start empty. Clone
+jobs are then submitted to POST /clone at --rate jobs per second and
+followed until they finish.
+
+The report covers:
+- p50/p95/p99 of every stage in the jobs' stage_timings, and of end-to-end latency
+- jobs/sec
+- peak RSS of the app and of its browsers
+- peak browser count
+
+The report is printed and written as JSON to --output, so runs can be
+compared to catch regressions.
+
+Run from the backend directory:
+    python -m benchmarks.load_test [--jobs 20] [--rate 1] [--output benchmark-results.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from app.metrics import percentiles
+from benchmarks.fixture_server import FixtureServer
+
+try:
+    import psutil
+    PSUTIL_AVAILABLE = True
+except ImportError:
+    PSUTIL_AVAILABLE = False
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TERMINAL_STATUSES = ("completed", "failed")
+# Process names of the browsers Playwright launches
+BROWSER_PROCESS_NAMES = ("chrome", "chromium", "headless_shell")
+
+
+def latency_summary(values: List[float]) -> Dict[str, Optional[float]]:
+    """Nearest-rank p50/p95/p99, mean and count of a list of milliseconds"""
+    mean = round(sum(values) / len(values), 2) if values else None
+    return {**percentiles(values), "mean": mean, "count": len(values)}
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def process_tree(pid: int) -> List[Dict[str, Any]]:
+    """[{pid, name, rss_bytes}] for a process and all its descendants"""
+    if PSUTIL_AVAILABLE:
+        try:
+            root = psutil.Process(pid)
+            processes = [root] + root.children(recursive=True)
+        except psutil.NoSuchProcess:
+            return []
+        tree = []
+        for process in processes:
+            try:
+                tree.append({"pid": process.pid, "name": process.name(), "rss_bytes": process.memory_info().rss})
+            except psutil.NoSuchProcess:
+                continue
+        return tree
+    if not os.path.isdir("/proc"):
+        return []
+    # Without psutil, walk /proc (Linux only)
+    children: Dict[int, List[int]] = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # The name is in parentheses and may contain spaces
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+    tree, pending = [], [pid]
+    while pending:
+        current = pending.pop()
+        try:
+            with open(f"/proc/{current}/comm") as f:
+                name = f.read().strip()
+            with open(f"/proc/{current}/status") as f:
+                rss_kb = next((int(line.split()[1]) for line in f if line.startswith("VmRSS:")), 0)
+        except OSError:
+            continue
+        tree.append({"pid": current, "name": name, "rss_bytes": rss_kb * 1024})
+        pending.extend(children.get(current, []))
+    return tree
+
+
+def is_browser(process: Dict[str, Any]) -> bool:
+    name = process["name"].lower()
+    return any(marker in name for marker in BROWSER_PROCESS_NAMES)
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=BACKEND_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def wait_until_up(client: httpx.AsyncClient, url: str, process: subprocess.Popen, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{url} exited with code {process.returncode} before it came up")
+        try:
+            if (await client.get(url)).status_code < 500:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout:.0f}s")
+
+
+class ResourceSampler:
+    """Samples the app's process tree and browser pool while the load runs"""
+
+    def __init__(self, client: httpx.AsyncClient, app_url: str, app_pid: Optional[int], interval: float = 0.5):
+        self.client = client
+        self.app_url = app_url
+        self.app_pid = app_pid
+        self.interval = interval
+        self.peak = {"rss_mb": 0.0, "app_rss_mb": 0.0, "browser_rss_mb": 0.0, "browser_processes": 0,
+                     "open_browsers": 0, "open_contexts": 0, "queue_depth": 0, "running_jobs": 0}
+        self.samples = 0
+
+    async def run(self):
+        while True:
+            await self.sample()
+            await asyncio.sleep(self.interval)
+
+    async def sample(self):
+        self.samples += 1
+        if self.app_pid is not None:
+            tree = await asyncio.to_thread(process_tree, self.app_pid)
+            browser_rss = sum(p["rss_bytes"] for p in tree if is_browser(p))
+            total_rss = sum(p["rss_bytes"] for p in tree)
+            self._peak("rss_mb", round(total_rss / 2 ** 20, 1))
+            self._peak("app_rss_mb", round((total_rss - browser_rss) / 2 ** 20, 1))
+            self._peak("browser_rss_mb", round(browser_rss / 2 ** 20, 1))
+            self._peak("browser_processes", sum(1 for p in tree if is_browser(p)))
+        try:
+            stats = (await self.client.get(f"{self.app_url}/stats")).json()
+        except (httpx.HTTPError, ValueError):
+            return
+        self._peak("open_browsers", stats["browser_pool"]["open_browsers"])
+        self._peak("open_contexts", stats["browser_pool"]["open_contexts"])
+        self._peak("queue_depth", stats["scheduler"]["queue_depth"])
+        self._peak("running_jobs", stats["scheduler"]["running"])
+
+    def _peak(self, name, value):
+        self.peak[name] = max(self.peak[name], value)
+
+
+async def run_job(client: httpx.AsyncClient, app_url: str, request: Dict[str, Any], poll_interval: float,
+                  timeout: float) -> Dict[str, Any]:
+    """Submit one clone job and wait for it; returns the outcome with the final job record"""
+    submitted = time.monotonic()
+    response = await client.post(f"{app_url}/clone", json=request)
+    if response.status_code != 200:
+        return {"outcome": "rejected", "status_code": response.status_code, "detail": response.text[:200],
+                "submitted": submitted, "finished": time.monotonic()}
+    job_id = response.json()["job_id"]
+    deadline = submitted + timeout
+    while time.monotonic() < deadline:
+        await asyncio.sleep(poll_interval)
+        job = (await client.get(f"{app_url}/jobs/{job_id}")).json()
+        if job["status"] in TERMINAL_STATUSES:
+            return {"outcome": job["status"], "job": job, "submitted": submitted, "finished": time.monotonic(),
+                    "latency_ms": (time.monotonic() - submitted) * 1000}
+    return {"outcome": "timeout", "job_id": job_id, "submitted": submitted, "finished": time.monotonic()}
+
+
+def summarize(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Outcome counts, throughput and per-stage percentiles of a run's jobs"""
+    outcomes: Dict[str, int] = {}
+    for result in results:
+        outcomes[result["outcome"]] = outcomes.get(result["outcome"], 0) + 1
+    completed = [r for r in results if r["outcome"] == "completed"]
+
+    stages: Dict[str, List[float]] = {}
+    cache_hits = {"scrape": 0, "generate": 0}
+    tokens = {"input": 0, "output": 0}
+    for result in completed:
+        job = result["job"]
+        for name, value in (job.get("stage_timings") or {}).items():
+            if isinstance(value, dict):
+                # Phases of a scrape the job ran itself
+                for phase, ms in value.items():
+                    stages.setdefault(f"{name}.{phase}", []).append(ms)
+            else:
+                stages.setdefault(name, []).append(value)
+        for stage, hit in (job.get("cache_hits") or {}).items():
+            cache_hits[stage] = cache_hits.get(stage, 0) + int(bool(hit))
+        for kind in tokens:
+            tokens[kind] += (job.get("tokens") or {}).get(kind) or 0
+
+    started = min((r["submitted"] for r in results), default=0)
+    finished = max((r["finished"] for r in results), default=0)
+    wall_seconds = finished - started
+    return {
+        "outcomes": outcomes,
+        "wall_seconds": round(wall_seconds, 2),
+        "jobs_per_second": round(len(completed) / wall_seconds, 3) if wall_seconds > 0 else None,
+        "latency_ms": latency_summary([r["latency_ms"] for r in completed]),
+        "stages_ms": {name: latency_summary(values) for name, values in sorted(stages.items())},
+        "cache_hits": cache_hits,
+        "tokens": tokens,
+        "errors": sorted({((r.get("job") or {}).get("message") or r.get("detail") or r["outcome"]).splitlines()[0]
+                          for r in results if r["outcome"] != "completed"})[:10],
+    }
+
+
+async def run(args) -> Dict[str, Any]:
+    fixtures = FixtureServer(args.cache_dir, latency_ms=args.page_latency_ms)
+    fixtures.start()
+    scratch = tempfile.mkdtemp(prefix="clone-bench-")
+    processes: List[subprocess.Popen] = []
+    log = open(os.path.join(scratch, "servers.log"), "w")
+    try:
+        mock_port = free_port()
+        mock_url = f"http://127.0.0.1:{mock_port}"
+        processes.append(subprocess.Popen(
+            [sys.executable, "-m", "benchmarks.mock_llm", "--port", str(mock_port),
+             "--latency-ms", str(args.llm_latency_ms), "--tokens-per-second", str(args.llm_tokens_per_second),
+             "--output-tokens", str(args.llm_output_tokens), "--error-rate", str(args.llm_error_rate)],
+            cwd=BACKEND_DIR, stdout=log, stderr=subprocess.STDOUT,
+        ))
+
+        app_process = None
+        app_url = args.app_url
+        if app_url is None:
+            app_port = free_port()
+            app_url = f"http://127.0.0.1:{app_port}"
+            env = {
+                **os.environ,
+                "PYTHONPATH": BACKEND_DIR,
+                "ANTHROPIC_API_KEY": "mock",
+                "GOOGLE_API_KEY": "mock",
+                "ANTHROPIC_BASE_URL": mock_url,
+                "GEMINI_BASE_URL": mock_url,
+                **dict(item.split("=", 1) for item in args.env),
+            }
+            # The scratch directory holds the app's caches and job database
+            app_process = subprocess.Popen(
+                [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(app_port),
+                 "--log-level", "warning"],
+                cwd=scratch, env=env, stdout=log, stderr=subprocess.STDOUT,
+            )
+            processes.append(app_process)
+
+        limits = httpx.Limits(max_connections=max(100, args.jobs * 2))
+        async with httpx.AsyncClient(timeout=30, limits=limits) as client:
+            await wait_until_up(client, f"{mock_url}/stats", processes[0])
+            if app_process is not None:
+                await wait_until_up(client, f"{app_url}/health", app_process, timeout=120)
+
+            sampler = ResourceSampler(client, app_url, app_process.pid if app_process else None)
+            sampler_task = asyncio.create_task(sampler.run())
+            pages = fixtures.urls()
+            tasks = []
+            load_started = time.monotonic()
+            for index in range(args.jobs):
+                # Open-loop arrivals: submit on schedule whether or not earlier jobs are done
+                await asyncio.sleep(max(0.0, load_started + index / args.rate - time.monotonic()))
+                url = pages[index % len(pages)]
+                if not args.repeat_urls:
+                    # A distinct query string makes every job scrape and generate from scratch
+                    url += f"?bench={index}"
+                request = {"url": url, "model": args.model, "force_refresh": args.force_refresh}
+                if args.generation_mode:
+                    request["generation_mode"] = args.generation_mode
+                tasks.append(asyncio.create_task(run_job(client, app_url, request, args.poll_interval, args.job_timeout)))
+            results = await asyncio.gather(*tasks)
+            sampler_task.cancel()
+            await asyncio.gather(sampler_task, return_exceptions=True)
+            await sampler.sample()
+
+            app_stats = (await client.get(f"{app_url}/stats")).json()
+            mock_stats = (await client.get(f"{mock_url}/stats")).json()
+
+        summary = summarize(results)
+        return {
+            "benchmark": "load_test",
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "commit": git_commit(),
+            "environment": {
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpu_count": os.cpu_count(),
+                "psutil": PSUTIL_AVAILABLE,
+            },
+            "config": {key: value for key, value in vars(args).items() if key != "output"},
+            "fixtures": {"pages": len(pages), "requests": fixtures.requests},
+            **summary,
+            "resources": {**sampler.peak, "samples": sampler.samples},
+            "app": {
+                "scheduler": app_stats.get("scheduler"),
+                "browser_pool": app_stats.get("browser_pool"),
+                "scrape_cache_hit_ratio": (app_stats.get("scrape_cache") or {}).get("hit_ratio"),
+                "clone_cache_hit_ratio": (app_stats.get("clone_cache") or {}).get("hit_ratio"),
+            },
+            "mock_llm": mock_stats,
+        }
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            try:
+                process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        fixtures.stop()
+        log.close()
+        if args.keep_scratch:
+            print(f"Scratch directory kept at {scratch}")
+        else:
+            shutil.rmtree(scratch, ignore_errors=True)
+
+
+def print_report(report: Dict[str, Any]):
+    print(f"\nJobs: {report['outcomes']} in {report['wall_seconds']}s, {report['jobs_per_second']} jobs/sec")
+    print(f"{'stage':<36} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10} {'n':>5}")
+    for name, stats in [("end-to-end", report["latency_ms"]), *report["stages_ms"].items()]:
+        if stats["count"]:
+            print(f"{name:<36} {stats['p50']:>10.1f} {stats['p95']:>10.1f} {stats['p99']:>10.1f} {stats['count']:>5}")
+    resources = report["resources"]
+    print(f"Peak RSS {resources['rss_mb']} MB (app {resources['app_rss_mb']} MB, browsers {resources['browser_rss_mb']} MB); "
+          f"peak browsers {resources['open_browsers']} ({resources['browser_processes']} processes), "
+          f"peak queue depth {resources['queue_depth']}")
+    for error in report["errors"]:
+        print(f"  {error}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--jobs", type=int, default=20)
+    parser.add_argument("--rate", type=float, default=1.0, help="jobs submitted per second")
+    parser.add_argument("--model", default="claude", choices=("claude", "gemini"))
+    parser.add_argument("--generation-mode", choices=("single", "sectioned", "auto"))
+    parser.add_argument("--repeat-urls", action="store_true",
+                        help="reuse the fixture URLs as they are, so later jobs can hit the caches")
+    parser.add_argument("--force-refresh", action="store_true", help="bypass the clone cache")
+    parser.add_argument("--cache-dir", default=".cache", help="where the fixture pages are read from")
+    parser.add_argument("--page-latency-ms", type=float, default=0, help="fixture server delay per page")
+    parser.add_argument("--llm-latency-ms", type=float, default=800, help="mock LLM time to first token")
+    parser.add_argument("--llm-tokens-per-second", type=float, default=80)
+    parser.add_argument("--llm-output-tokens", type=int, default=2000)
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                        help="extra environment for the app, e.g. BROWSER_POOL_MAX_CONTEXTS=8")
+    parser.add_argument("--app-url", help="load an already running app instead of starting one (no RSS sampling)")
+    parser.add_argument("--poll-interval", type=float, default=0.25)
+    parser.add_argument("--job-timeout", type=float, default=300)
+    parser.add_argument("--keep-scratch", action="store_true", help="keep the app's caches, job database and logs")
+    parser.add_argument("--output", default="benchmark-results.json")
+    args = parser.parse_args()
+    if args.rate <= 0 or args.jobs <= 0:
+        parser.error("--rate and --jobs must be positive")
+
+    report = asyncio.run(run(args))
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print_report(report)
+    print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""
+Local stand-in for the Anthropic and Gemini streaming APIs.
+
+Answers POST /v1/messages (Anthropic) and
+POST /v1beta/models/<model>:streamGenerateContent (Gemini) with a
+Server-Sent Event stream in each provider's format. The stream waits
+--latency-ms before the first token, then emits a generated HTML page of
+--output-tokens tokens at --tokens-per-second. --error-rate of requests
+fail with 529 so retries and provider fallback can be exercised. Point the
+app at it with ANTHROPIC_BASE_URL / GEMINI_BASE_URL.
+
+Run from the backend directory:
+    python -m benchmarks.mock_llm [--port 8802] [--latency-ms 800] [--tokens-per-second 80]
+"""
+import argparse
+import asyncio
+import json
+import random
+from typing import Any, AsyncIterator, Dict
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+# Rough tokenizer: characters per token of English text and HTML
+CHARS_PER_TOKEN = 4
+# Tokens billed per attached image
+IMAGE_TOKENS = 1500
+
+
+def mock_page(output_tokens: int) -> str:
+    """An HTML document about output_tokens long"""
+    head = "<!DOCTYPE html>\n<html><head><title>Mock clone</title><style>body{font-family:sans-serif}</style></head><body>\n"
+    tail = "</body></html>\n"
+    paragraph = "<section><h2>Section</h2><p>Lorem ipsum dolor sit amet, consectetur adipiscing elit.</p></section>\n"
+    body_chars = max(0, output_tokens * CHARS_PER_TOKEN - len(head) - len(tail))
+    return head + paragraph * (body_chars // len(paragraph) + 1) + tail
+
+
+def _chunks(text: str, chunk_tokens: int):
+    size = chunk_tokens * CHARS_PER_TOKEN
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+def create_app(latency_ms: float = 800, tokens_per_second: float = 80, output_tokens: int = 2000,
+               chunk_tokens: int = 20, error_rate: float = 0.0, seed: int = 0) -> FastAPI:
+    """The mock API with the given response timing"""
+    app = FastAPI(title="Mock LLM providers")
+    rng = random.Random(seed)
+    page = mock_page(output_tokens)
+    stats = {"requests": 0, "errors": 0, "active": 0, "peak_active": 0, "input_tokens": 0, "output_tokens": 0}
+
+    async def stream(chunks, format_chunk, first=None, last=None) -> AsyncIterator[str]:
+        stats["active"] += 1
+        stats["peak_active"] = max(stats["peak_active"], stats["active"])
+        try:
+            if first:
+                yield first
+            await asyncio.sleep(latency_ms / 1000)
+            for text in chunks:
+                yield format_chunk(text)
+                await asyncio.sleep(chunk_tokens / tokens_per_second)
+            if last:
+                yield last
+            stats["output_tokens"] += output_tokens
+        finally:
+            stats["active"] -= 1
+
+    def overloaded() -> bool:
+        stats["requests"] += 1
+        if rng.random() < error_rate:
+            stats["errors"] += 1
+            return True
+        return False
+
+    def sse(payload: Dict[str, Any]) -> str:
+        return f"data: {json.dumps(payload)}\n\n"
+
+    @app.post("/v1/messages")
+    async def anthropic_messages(request: Request):
+        body = await request.json()
+        if overloaded():
+            return JSONResponse({"type": "error", "error": {"type": "overloaded_error", "message": "Overloaded"}}, status_code=529)
+        text_chars, images = 0, 0
+        for message in body.get("messages", []):
+            content = message.get("content")
+            for part in content if isinstance(content, list) else [{"type": "text", "text": content or ""}]:
+                if part.get("type") == "image":
+                    images += 1
+                else:
+                    text_chars += len(part.get("text") or "")
+        input_tokens = text_chars // CHARS_PER_TOKEN + images * IMAGE_TOKENS
+        stats["input_tokens"] += input_tokens
+        start = sse({"type": "message_start", "message": {"usage": {"input_tokens": input_tokens, "output_tokens": 1}}})
+        end = sse({"type": "message_delta", "delta": {"stop_reason": "end_turn"}, "usage": {"output_tokens": output_tokens}}) \
+            + sse({"type": "message_stop"})
+        chunk = lambda text: sse({"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": text}})
+        return StreamingResponse(stream(_chunks(page, chunk_tokens), chunk, start, end), media_type="text/event-stream")
+
+    @app.post("/v1beta/models/{model}:streamGenerateContent")
+    async def gemini_stream(model: str, request: Request):
+        body = await request.json()
+        if overloaded():
+            return JSONResponse([{"error": {"code": 529, "message": "Overloaded"}}], status_code=529)
+        parts = [part for content in body.get("contents", []) for part in content.get("parts", [])]
+        input_tokens = sum(len(p.get("text") or "") for p in parts) // CHARS_PER_TOKEN \
+            + sum(1 for p in parts if "inline_data" in p) * IMAGE_TOKENS
+        stats["input_tokens"] += input_tokens
+        chunks = _chunks(page, chunk_tokens)
+        emitted = {"tokens": 0}
+
+        def chunk(text):
+            emitted["tokens"] += chunk_tokens
+            return sse({
+                "candidates": [{"content": {"role": "model", "parts": [{"text": text}]}}],
+                "usageMetadata": {"promptTokenCount": input_tokens,
+                                  "candidatesTokenCount": min(emitted["tokens"], output_tokens)},
+            })
+        return StreamingResponse(stream(chunks, chunk), media_type="text/event-stream")
+
+    @app.get("/stats")
+    async def get_stats():
+        return stats
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8802)
+    parser.add_argument("--latency-ms", type=float, default=800, help="delay before the first token")
+    parser.add_argument("--tokens-per-second", type=float, default=80)
+    parser.add_argument("--output-tokens", type=int, default=2000)
+    parser.add_argument("--chunk-tokens", type=int, default=20, help="tokens per streamed event")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 529")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    app = create_app(args.latency_ms, args.tokens_per_second, args.output_tokens, args.chunk_tokens,
+                     args.error_rate, args.seed)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
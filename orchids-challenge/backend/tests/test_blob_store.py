@@ -0,0 +1,27 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from app.blob_store import BlobStore
+
+
+def test_concurrent_puts_count_every_write_and_dedup(tmp_path):
+    store = BlobStore(str(tmp_path))
+    payloads = [bytes([i]) * 100 for i in range(50)] * 4
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        list(pool.map(lambda data: store._put(data, "image/png"), payloads))
+    stats = store.stats()
+    assert stats["blobs"] == 50
+    assert stats["bytes"] == 50 * 100
+    assert stats["writes"] + stats["dedup_hits"] == len(payloads)
+
+
+def test_eviction_drops_least_recently_read(tmp_path):
+    store = BlobStore(str(tmp_path), max_bytes=250)
+    first = asyncio.run(store.put(b"a" * 100, "image/png"))
+    second = asyncio.run(store.put(b"b" * 100, "image/png"))
+    assert asyncio.run(store.read(first)) == b"a" * 100
+    asyncio.run(store.put(b"c" * 100, "image/png"))
+    assert store.has(first) and not store.has(second)
+    assert asyncio.run(store.read(second)) is None
+    stats = store.stats()
+    assert stats["evictions"] == 1 and stats["missing"] == 1 and stats["bytes"] == 200
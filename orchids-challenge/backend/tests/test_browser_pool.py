@@ -0,0 +1,100 @@
+import asyncio
+
+import pytest
+
+from app import browser_pool
+from app.browser_pool import BrowserPool
+
+
+class FakeBrowser:
+    def __init__(self):
+        self.closed = False
+
+    def is_connected(self):
+        return not self.closed
+
+    async def new_context(self, **options):
+        return FakeContext()
+
+    async def close(self):
+        self.closed = True
+
+
+class FakeContext:
+    async def close(self):
+        pass
+
+
+class FakeChromium:
+    async def launch(self, headless=True):
+        return FakeBrowser()
+
+
+class FakePlaywright:
+    chromium = FakeChromium()
+
+    async def stop(self):
+        pass
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    monkeypatch.setattr(browser_pool, "PSUTIL_AVAILABLE", True)
+    monkeypatch.setattr(browser_pool, "_chromium_pids", lambda: set())
+    # Each launched browser gets its own root pid
+    pids = iter(range(100, 200))
+    monkeypatch.setattr(browser_pool, "_browser_root_pid", lambda before: next(pids))
+
+    pool = BrowserPool(max_contexts=2, max_uses_per_browser=100, max_memory_mb=500, memory_check_interval=0)
+    pool._playwright = FakePlaywright()
+
+    async def start():
+        async with pool._launch_lock:
+            await pool._launch()
+        pool._started = True
+
+    asyncio.run(start())
+    return pool
+
+
+def use(pool, times=1):
+    async def scenario():
+        for _ in range(times):
+            async with pool.context():
+                pass
+    asyncio.run(scenario())
+
+
+def test_memory_is_measured_for_the_current_browser_only(pool, monkeypatch):
+    measured = []
+    # The first browser is over budget; its replacement is not
+    memory = {100: 900.0, 101: 300.0}
+    monkeypatch.setattr(browser_pool, "_process_tree_memory_mb", lambda pid: measured.append(pid) or memory[pid])
+
+    use(pool)
+    assert pool.stats()["browsers_launched"] == 1
+    use(pool, times=3)
+    stats = pool.stats()
+    # Recycled once, then the new browser's own (small) tree keeps it alive
+    assert stats["browsers_launched"] == 2
+    assert stats["browsers_recycled"] == 1
+    assert stats["chromium_memory_mb"] == 300.0
+    assert set(measured) == {100, 101}
+
+
+def test_memory_is_sampled_at_most_once_per_interval(pool, monkeypatch):
+    measured = []
+    monkeypatch.setattr(browser_pool, "_process_tree_memory_mb", lambda pid: measured.append(pid) or 100.0)
+    pool.memory_check_interval = 3600
+    use(pool, times=5)
+    assert measured == []
+    pool._current.memory_checked_at -= 3600
+    use(pool, times=5)
+    assert measured == [100]
+
+
+def test_use_budget_recycles_without_psutil(pool, monkeypatch):
+    monkeypatch.setattr(browser_pool, "PSUTIL_AVAILABLE", False)
+    pool.max_uses_per_browser = 2
+    use(pool, times=5)
+    assert pool.stats()["browsers_launched"] == 3
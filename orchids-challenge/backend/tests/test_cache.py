@@ -0,0 +1,138 @@
+import asyncio
+import os
+
+import pytest
+
+from app import cache
+from app.cache import TieredCache, cache_key
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache, "time", clock)
+    return clock
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_cache_key_is_order_independent_for_dicts():
+    assert cache_key("a", {"x": 1, "y": 2}) == cache_key("a", {"y": 2, "x": 1})
+    assert cache_key("a", 1) != cache_key("a", "1", "extra")
+
+
+def test_values_survive_a_restart_and_are_copies(tmp_path, clock):
+    async def scenario():
+        first = TieredCache(str(tmp_path))
+        await first.set("key", {"html": "<p>hi</p>", "items": [1]})
+        value = await first.get("key")
+        value.pop("html")
+        assert (await first.get("key"))["html"] == "<p>hi</p>"
+        # A new instance only has the disk tier
+        second = TieredCache(str(tmp_path))
+        return await second.get("key"), second.stats()
+
+    value, stats = run(scenario())
+    assert value == {"html": "<p>hi</p>", "items": [1]}
+    assert stats["disk_hits"] == 1 and stats["memory_hits"] == 0
+
+
+@pytest.mark.parametrize("tier", ["memory", "disk"])
+def test_entries_expire_after_their_ttl(tmp_path, clock, tier):
+    async def scenario():
+        store = TieredCache(str(tmp_path), default_ttl=60)
+        await store.set("short", {"v": 1}, ttl=10)
+        await store.set("long", {"v": 2})
+        if tier == "disk":
+            store = TieredCache(str(tmp_path), default_ttl=60)
+        clock.now += 30
+        return await store.get("short"), await store.get("long"), store.stats()
+
+    short, long, stats = run(scenario())
+    assert short is None and long == {"v": 2}
+    assert stats["expired"] == 1 and stats["misses"] == 1
+
+
+def test_expired_entries_are_dropped_at_startup(tmp_path, clock):
+    run(TieredCache(str(tmp_path)).set("key", {"v": 1}, ttl=10))
+    clock.now += 11
+    restarted = TieredCache(str(tmp_path))
+    assert restarted.stats()["disk_entries"] == 0
+    assert not [name for name in os.listdir(tmp_path) if name.startswith("key")]
+
+
+def test_memory_tier_evicts_least_recently_used(tmp_path, clock):
+    async def scenario():
+        # Each entry serializes to 18 bytes, so two fit
+        store = TieredCache(str(tmp_path), memory_max_bytes=40)
+        for key in ("a", "b", "c"):
+            await store.set(key, {"v": key * 10})
+        await store.get("a")
+        await store.set("d", {"v": "d" * 10})
+        return store
+
+    store = run(scenario())
+    assert list(store._memory) == ["a", "d"]
+    assert store.stats()["memory_evictions"] == 3
+    assert store.stats()["memory_bytes"] <= 40
+
+
+def test_disk_tier_stays_within_its_byte_budget(tmp_path, clock):
+    # Random hex compresses to about half, so each entry takes about 2 KB on disk
+    payload = os.urandom(2000).hex()
+
+    async def scenario():
+        store = TieredCache(str(tmp_path), max_bytes=5000, memory_max_bytes=0)
+        for key in ("a", "b", "c"):
+            clock.now += 1
+            await store.set(key, {"v": payload + key})
+            if key == "b":
+                clock.now += 1
+                await store.get("a")
+        return store, [await store.get(key) is not None for key in ("a", "b", "c")]
+
+    store, present = run(scenario())
+    stats = store.stats()
+    assert stats["disk_bytes"] <= 5000 and stats["disk_evictions"] == 1
+    # "a" was read after "b" was written, so "b" is the least recently used
+    assert present == [True, False, True]
+
+
+@pytest.mark.parametrize("zstd", [True, False], ids=["zstd", "gzip"])
+@pytest.mark.parametrize("corruption", [b"not compressed json", b""], ids=["garbage", "empty"])
+def test_corrupt_entry_is_a_miss_and_is_removed(tmp_path, clock, monkeypatch, zstd, corruption):
+    if zstd and not cache.ZSTD_AVAILABLE:
+        pytest.skip("zstandard is not installed")
+    monkeypatch.setattr(cache, "ZSTD_AVAILABLE", zstd)
+    run(TieredCache(str(tmp_path)).set("key", {"v": 1}))
+    entry = next(name for name in os.listdir(tmp_path) if name.startswith("key") and not name.endswith(".meta.json"))
+    with open(tmp_path / entry, "wb") as f:
+        f.write(corruption)
+
+    store = TieredCache(str(tmp_path))
+    assert run(store.get("key")) is None
+    stats = store.stats()
+    assert stats["misses"] == 1 and stats["disk_entries"] == 0
+    assert not (tmp_path / entry).exists()
+
+
+def test_set_nowait_is_readable_before_the_write_finishes(tmp_path, clock):
+    async def scenario():
+        store = TieredCache(str(tmp_path))
+        store.set_nowait("key", {"v": 1})
+        value = await store.get("key")
+        await store.flush()
+        return value, store.stats()
+
+    value, stats = run(scenario())
+    assert value == {"v": 1} and stats["writes"] == 1
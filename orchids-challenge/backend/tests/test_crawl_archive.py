@@ -0,0 +1,40 @@
+import asyncio
+
+import pytest
+
+from app.main import crawl_archive_entries, page_file_name
+
+
+@pytest.mark.parametrize("url, expected", [
+    ("https://x.test/", "index.html"),
+    ("https://x.test/docs/intro/", "docs/intro.html"),
+    ("https://x.test/a.html", "a.html"),
+    ("https://x.test/b.HTM", "b.html"),
+    ("https://x.test/caf%C3%A9 menu", "caf_C3_A9_menu.html"),
+])
+def test_page_file_name(url, expected):
+    assert page_file_name(url) == expected
+
+
+def test_page_file_name_with_query_is_distinct():
+    assert page_file_name("https://x.test/search?q=a") != page_file_name("https://x.test/search?q=b")
+
+
+def test_archive_entries_have_unique_names():
+    result = {"pages": [
+        {"url": "https://x.test/", "html": "root"},
+        {"url": "https://x.test/index", "html": "index"},
+        {"url": "https://x.test/index.html", "html": "index file"},
+        {"url": "https://x.test/a", "html": "a"},
+        {"url": "https://x.test/a.html", "html": "a file"},
+        {"url": "https://x.test/broken", "error": "timeout"},
+    ]}
+
+    async def collect():
+        return [entry async for entry in crawl_archive_entries(result)]
+
+    entries = asyncio.run(collect())
+    names = [name for name, _ in entries]
+    assert len(names) == len(set(names))
+    assert names[:5] == ["index.html", "index-2.html", "index-3.html", "a.html", "a-2.html"]
+    assert names[-1] == "manifest.json"
@@ -0,0 +1,170 @@
+import asyncio
+
+import pytest
+
+from app.crawler import CrawlFrontier, SiteCrawler, crawl_url, deduplicate_site
+from app.html_extraction import extract_html_data
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+@pytest.mark.parametrize("url, expected", [
+    ("https://Example.com/about/", "https://example.com/about"),
+    ("https://example.com", "https://example.com/"),
+    ("https://example.com:443/a#team", "https://example.com/a"),
+    ("https://example.com/a?utm_source=x&b=2&a=1", "https://example.com/a?a=1&b=2"),
+    ("https://example.com/brochure.pdf", None),
+    ("mailto:team@example.com", None),
+    ("/relative", None),
+])
+def test_crawl_url(url, expected):
+    assert crawl_url(url) == expected
+
+
+def test_frontier_orders_by_depth_path_and_position():
+    async def scenario():
+        frontier = CrawlFrontier("https://example.com/", max_depth=2)
+        frontier.add("https://example.com/", 0)
+        frontier.add("https://example.com/docs/guide", 1, position=0)
+        frontier.add("https://example.com/pricing", 1, position=5)
+        frontier.add("https://example.com/about", 1, position=2)
+        frontier.add("https://example.com/team", 2, position=0)
+        order = []
+        while len(frontier):
+            url, depth = await frontier.get()
+            order.append(url)
+            frontier.task_done()
+        return order
+
+    assert run(scenario()) == [
+        "https://example.com/",
+        "https://example.com/about",
+        "https://example.com/pricing",
+        "https://example.com/docs/guide",
+        "https://example.com/team",
+    ]
+
+
+def test_frontier_skips_duplicates_other_origins_and_deep_links():
+    async def scenario():
+        frontier = CrawlFrontier("https://example.com/", max_depth=1)
+        return [
+            frontier.add("https://example.com/about", 1),
+            frontier.add("https://example.com/about/?utm_campaign=launch", 1),
+            frontier.add("https://other.com/about", 1),
+            frontier.add("https://example.com/deep", 2),
+        ]
+
+    assert run(scenario()) == [True, False, False, False]
+
+
+def _context(links):
+    return {"page_links": links, "css_rules": [], "layout": {}}
+
+
+SITE = {
+    "https://example.com/": ["https://example.com/about", "https://example.com/blog/", "https://other.com/"],
+    "https://example.com/about": ["https://example.com/"],
+    "https://example.com/blog": ["https://example.com/post-1", "https://example.com/post-2"],
+    "https://example.com/post-1": [],
+    "https://example.com/post-2": [],
+}
+
+
+def test_crawl_follows_links_to_depth_and_page_budget():
+    async def load_page(url):
+        return _context(SITE[url]), False
+
+    crawl = run(SiteCrawler(load_page, concurrency=2).crawl("https://example.com/", max_depth=1, max_pages=10))
+    assert [page["url"] for page in crawl["pages"]] == [
+        "https://example.com/", "https://example.com/about", "https://example.com/blog",
+    ]
+    crawl = run(SiteCrawler(load_page, concurrency=2).crawl("https://example.com/", max_depth=2, max_pages=2))
+    assert crawl["stats"]["pages"] == 2
+
+
+def test_crawl_survives_failing_progress_callback():
+    async def load_page(url):
+        return _context(SITE[url]), False
+
+    async def on_page(page):
+        raise RuntimeError("database is locked")
+
+    async def scenario():
+        crawler = SiteCrawler(load_page, concurrency=2)
+        return await asyncio.wait_for(crawler.crawl("https://example.com/", 1, 10, on_page=on_page), timeout=5)
+
+    assert run(scenario())["stats"]["pages"] == 3
+
+
+def test_crawl_reports_failed_pages():
+    async def load_page(url):
+        if url.endswith("/about"):
+            raise RuntimeError("timeout")
+        return _context(SITE[url]), False
+
+    crawl = run(SiteCrawler(load_page).crawl("https://example.com/", 1, 10))
+    assert crawl["stats"]["failed"] == 1
+    assert next(page for page in crawl["pages"] if "error" in page)["url"] == "https://example.com/about"
+
+
+def test_crawl_follows_links_after_the_start_page_redirects():
+    # http://example.com/ redirects to https://www.example.com/
+    site = {
+        "http://example.com/": ["https://www.example.com/about", "https://www.example.com/blog"],
+        "https://www.example.com/about": ["https://www.example.com/team"],
+        "https://www.example.com/blog": [],
+        "https://www.example.com/team": ["https://elsewhere.com/"],
+    }
+
+    async def load_page(url):
+        final_url = "https://www.example.com/" if url == "http://example.com/" else url
+        return {**_context(site[url]), "final_url": final_url}, False
+
+    crawl = run(SiteCrawler(load_page).crawl("http://example.com", max_depth=2, max_pages=10))
+    assert [page["url"] for page in crawl["pages"]] == [
+        "http://example.com/", "https://www.example.com/about", "https://www.example.com/blog",
+        "https://www.example.com/team",
+    ]
+
+
+def test_relative_links_resolve_against_the_page_url():
+    html = '<html><body><a href="post-1">One</a><a href="/about">About</a><a href="../up">Up</a></body></html>'
+    links = [link["href"] for link in extract_html_data(html, "https://example.com/blog/2024/")["navigation_links"]]
+    assert links == ["https://example.com/blog/2024/post-1", "https://example.com/about", "https://example.com/blog/up"]
+
+
+def _layout(*sections):
+    return {"structure": list(sections)}
+
+
+def _section(tag, depth=5):
+    node = {"tag": "span", "children": []}
+    for _ in range(depth - 1):
+        node = {"tag": tag, "children": [node]}
+    return {**node, "position": {"top": 0}}
+
+
+def test_deduplicate_site_moves_repeated_rules_and_layout_to_shared():
+    header = _section("header")
+    pages = [
+        {"url": "https://example.com/", "depth": 0, "design_context": {
+            "title": "Home", "css_rules": [{"cssText": "body { margin: 0 }"}, {"cssText": ".hero { color: red }"}],
+            "layout": _layout(header, _section("main")),
+        }},
+        {"url": "https://example.com/about", "depth": 1, "design_context": {
+            "title": "About", "css_rules": [{"cssText": "body { margin: 0 }"}],
+            "layout": _layout({**header, "position": {"top": 10}}, _section("article")),
+        }},
+        {"url": "https://example.com/broken", "depth": 1, "error": "timeout"},
+    ]
+    site = deduplicate_site(pages)
+
+    assert site["shared"]["css_rules"] == ["body { margin: 0 }"]
+    assert [page["css_rules"] for page in site["pages"]] == [[{"cssText": ".hero { color: red }"}], []]
+    assert site["stats"]["shared_layout_subtrees"] == 1
+    fingerprint = next(iter(site["shared"]["layout"]))
+    assert site["pages"][1]["layout"]["structure"][0] == {"shared": fingerprint, "position": {"top": 10}}
+    assert site["stats"]["bytes_after"] < site["stats"]["bytes_before"]
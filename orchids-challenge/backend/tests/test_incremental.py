@@ -0,0 +1,106 @@
+import pytest
+
+from app.incremental import describe, diff_page, html_tokens, markup_fingerprint
+
+PAGE = '<html><head><title>Shop</title></head><body><h1>Sale</h1><form><button>Buy</button></form></body></html>'
+
+
+def _section(tag, text=None, cls=None, top=0):
+    node = {"tag": tag, "className": cls, "position": {"top": top}}
+    if text is not None:
+        node["children"] = [{"tag": "p", "text": text, "position": {"top": top + 10}}]
+    return node
+
+
+def _layout(*sections):
+    # A single wrapper around the page's regions, as most sites have
+    if not sections:
+        return {"structure": []}
+    return {"structure": [{"tag": "div", "id": "root", "children": list(sections)}]}
+
+
+@pytest.mark.parametrize("html, expected", [
+    ('<p>Hello   world</p>', ['<p>', 'Hello world', '</p>']),
+    ('<p>a</p>\n\n<p>b</p>', ['<p>', 'a', '</p>', '<p>', 'b', '</p>']),
+    ('<script>var t = 1;</script><p>x</p>', ['<p>', 'x', '</p>']),
+    ('<STYLE media="all">a{}</STYLE><p>x</p>', ['<p>', 'x', '</p>']),
+    ('<noscript><img src=x></noscript><p>x</p>', ['<p>', 'x', '</p>']),
+    ('<input type="hidden" name="csrf" value="abc"><p>x</p>', ['<p>', 'x', '</p>']),
+    ('<input name="_token" value="abc" type=hidden><p>x</p>', ['<p>', 'x', '</p>']),
+    ('<input type="text" name="q">', ['<input type="text" name="q">']),
+    ('<meta name="csrf-token" content="abc"><p>x</p>', ['<p>', 'x', '</p>']),
+    ('<meta content="abc" name="x-nonce"><p>x</p>', ['<p>', 'x', '</p>']),
+    ('<meta name="description" content="abc">', ['<meta name="description" content="abc">']),
+    ('<link rel="stylesheet" href="a.css" integrity="sha384-x" nonce="n1">', ['<link rel="stylesheet" href="a.css">']),
+    ("<link rel=stylesheet nonce='n1' href=a.css>", ['<link rel=stylesheet href=a.css>']),
+    ('<div data-csrf-value="x" data-token=abc>x</div>', ['<div>', 'x', '</div>']),
+    ('', []),
+    (None, []),
+])
+def test_html_tokens(html, expected):
+    assert html_tokens(html) == expected
+
+
+@pytest.mark.parametrize("old, new, same", [
+    (PAGE, PAGE, True),
+    (PAGE, PAGE.replace('<form>', '<form><input type="hidden" name="csrf" value="one">'), True),
+    (PAGE.replace('<head>', '<head><meta name="csrf-token" content="1">'),
+     PAGE.replace('<head>', '<head><meta name="csrf-token" content="2">'), True),
+    (PAGE.replace('<body>', '<body><script nonce="a">x()</script>'),
+     PAGE.replace('<body>', '<body><script nonce="b">y()</script>'), True),
+    (PAGE.replace('<title>', '<title nonce="a">'), PAGE.replace('<title>', "<title nonce='b'>"), True),
+    (PAGE, PAGE.replace('Sale', 'Sold out'), False),
+    (PAGE, PAGE.replace('<h1>', '<h2>').replace('</h1>', '</h2>'), False),
+    (PAGE, PAGE.replace('<button>', '<button class="primary">'), False),
+])
+def test_markup_fingerprint_ignores_volatile_markup(old, new, same):
+    assert (markup_fingerprint(old, "https://shop.test/", [], []) == markup_fingerprint(new, "https://shop.test/", [], [])) is same
+
+
+@pytest.mark.parametrize("change", [
+    {"page_url": "https://shop.test/other"},
+    {"css_rules": [{"cssText": "h1{color:red}"}]},
+    {"unreadable_stylesheets": [{"href": "https://cdn.test/a.css", "index": 0, "media": ""}]},
+])
+def test_markup_fingerprint_covers_url_and_css(change):
+    base = {"html": PAGE, "page_url": "https://shop.test/", "css_rules": [], "unreadable_stylesheets": []}
+    assert markup_fingerprint(**base) != markup_fingerprint(**{**base, **change})
+
+
+HEADER, HERO, FOOTER = _section("header", "Logo"), _section("section", "Sale", cls="hero", top=100), _section("footer", "(c)", top=900)
+
+
+@pytest.mark.parametrize("old, new, statuses, removed", [
+    ([HEADER, HERO, FOOTER], [HEADER, HERO, FOOTER], ["unchanged", "unchanged", "unchanged"], 0),
+    # Positions move whenever anything above changes and are not compared
+    ([HEADER, HERO, FOOTER], [HEADER, {**HERO, "position": {"top": 300}}, FOOTER], ["unchanged", "unchanged", "unchanged"], 0),
+    ([HEADER, HERO, FOOTER], [HEADER, _section("section", "Sold out", cls="hero"), FOOTER], ["unchanged", "changed", "unchanged"], 0),
+    ([HEADER, HERO, FOOTER], [HEADER, _section("aside", "New"), HERO, FOOTER], ["unchanged", "added", "unchanged", "unchanged"], 0),
+    ([HEADER, HERO, FOOTER], [HEADER, FOOTER], ["unchanged", "unchanged"], 1),
+    ([HEADER, HERO, FOOTER], [HEADER, _section("section", "Sale", cls="banner"), FOOTER], ["unchanged", "added", "unchanged"], 1),
+    ([], [HEADER], ["added"], 0),
+])
+def test_diff_page_sections(old, new, statuses, removed):
+    changes = diff_page(_layout(*old), PAGE, _layout(*new), PAGE)
+    assert [section["status"] for section in changes["sections"]] == statuses
+    assert len(changes["removed"]) == removed
+    assert changes["changed"] is (statuses.count("unchanged") != len(statuses) or removed > 0)
+
+
+@pytest.mark.parametrize("new_html, changed", [
+    (PAGE, False),
+    (PAGE.replace('<form>', '<form><input type="hidden" name="csrf" value="x">'), False),
+    (PAGE.replace('Sale', 'Sold out'), True),
+])
+def test_diff_page_markup(new_html, changed):
+    layout = _layout(HEADER, HERO, FOOTER)
+    changes = diff_page(layout, PAGE, layout, new_html)
+    assert changes["changed"] is changed and changes["html"]["changed"] is changed
+    assert (changes["html"]["similarity"] < 1) is changed
+    assert describe(changes).startswith("page unchanged") is not changed
+
+
+def test_diff_page_summary():
+    changes = diff_page(_layout(HEADER, HERO, FOOTER), PAGE, _layout(HEADER, _section("section", "New", cls="hero")), PAGE)
+    assert changes["summary"] == {"unchanged": 1, "changed": 1, "added": 0, "removed": 1}
+    assert describe(changes).startswith("1 of 2 sections changed, 0 added, 1 removed")
@@ -0,0 +1,98 @@
+import asyncio
+
+from app.job_events import JobEventHub
+from app.single_flight import SingleFlight
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_channel_text_from_offset():
+    async def scenario():
+        hub = JobEventHub()
+        hub.update("job", status="generating")
+        hub.attach("job", "channel")
+        for chunk in ("<html>", "<body>", "</body></html>"):
+            hub.append("channel", chunk)
+        return hub.channel_text("channel", 3), hub.snapshot("job", 6)["text"]
+
+    assert run(scenario()) == ("ml><body></body></html>", "<body></body></html>")
+
+
+def test_coalesced_jobs_share_a_channel():
+    async def scenario():
+        hub = JobEventHub()
+        for job_id in ("leader", "follower"):
+            hub.update(job_id, status="generating")
+            hub.attach(job_id, "key:leader")
+        hub.append("key:leader", "<html>A</html>")
+        return hub.snapshot("leader")["text"], hub.snapshot("follower")["text"]
+
+    assert run(scenario()) == ("<html>A</html>", "<html>A</html>")
+
+
+def test_repeat_generation_does_not_append_to_retained_channel():
+    # A second job for the same generation key after the first finished (e.g. a
+    # clone cache replay) must not see the first job's text while it is retained
+    async def scenario():
+        hub = JobEventHub(retention_seconds=60)
+        flight = SingleFlight("generate")
+        snapshots = {}
+        for job_id in ("first", "second"):
+            hub.update(job_id, status="generating")
+            channel = f"key:{flight.leader('key') or job_id}"
+            hub.attach(job_id, channel)
+
+            async def generate():
+                hub.append(channel, "<html>A</html>")
+                return "<html>A</html>"
+
+            await flight.do("key", generate, owner=job_id)
+            snapshots[job_id] = hub.snapshot(job_id)["text"]
+            hub.finish(job_id)
+        return snapshots
+
+    assert run(scenario()) == {"first": "<html>A</html>", "second": "<html>A</html>"}
+
+
+def test_follower_joins_the_leaders_channel():
+    async def scenario():
+        hub = JobEventHub()
+        flight = SingleFlight("generate")
+        release = asyncio.Event()
+
+        async def start(job_id):
+            hub.update(job_id, status="generating")
+            channel = f"key:{flight.leader('key') or job_id}"
+            hub.attach(job_id, channel)
+
+            async def generate():
+                await release.wait()
+                hub.append(channel, "<html>A</html>")
+
+            await flight.do("key", generate, owner=job_id)
+            return channel
+
+        leader = asyncio.create_task(start("leader"))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(start("follower"))
+        await asyncio.sleep(0)
+        release.set()
+        channels = await asyncio.gather(leader, follower)
+        return channels, hub.snapshot("follower")["text"]
+
+    assert run(scenario()) == (["key:leader", "key:leader"], "<html>A</html>")
+
+
+def test_dropped_jobs_release_their_channel():
+    async def scenario():
+        hub = JobEventHub(retention_seconds=0)
+        hub.update("job", status="generating")
+        hub.attach("job", "channel")
+        hub.append("channel", "text")
+        hub.finish("job")
+        await asyncio.sleep(0.01)
+        return hub.snapshot("job"), hub.stats()
+
+    assert run(scenario()) == (None, {"live_jobs": 0, "channels": 0, "buffered_chars": 0})
@@ -0,0 +1,27 @@
+import asyncio
+
+import pytest
+
+from app.job_store import JobStore, MemoryJobStore, SQLiteJobStore
+
+
+def test_incomplete_store_fails_when_created():
+    class PartialStore(JobStore):
+        async def get(self, job_id):
+            return None
+
+    with pytest.raises(TypeError):
+        PartialStore()
+
+
+@pytest.mark.parametrize("make_store", [MemoryJobStore, lambda: SQLiteJobStore(":memory:")], ids=["memory", "sqlite"])
+def test_stores_implement_the_interface(make_store):
+    async def scenario():
+        store = make_store()
+        await store.create("job", {"status": "pending", "url": "https://x.test/"})
+        await store.update("job", status="completed")
+        job = await store.get("job")
+        await store.close()
+        return job
+
+    assert asyncio.run(scenario())["status"] == "completed"
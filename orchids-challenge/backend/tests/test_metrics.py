@@ -0,0 +1,16 @@
+from app.metrics import nearest_rank, percentiles
+
+
+def test_percentiles_of_no_samples():
+    assert percentiles([]) == {"p50": None, "p95": None, "p99": None}
+
+
+def test_percentiles_use_nearest_rank():
+    samples = list(range(1, 101))
+    assert percentiles(samples) == {"p50": 51, "p95": 96, "p99": 100}
+    assert nearest_rank(sorted(samples), 0.0) == 1
+    assert nearest_rank(sorted(samples), 1.0) == 100
+
+
+def test_percentiles_scale_and_round():
+    assert percentiles([0.12345], scale=1000, digits=1) == {"p50": 123.5, "p95": 123.5, "p99": 123.5}
@@ -0,0 +1,150 @@
+import asyncio
+import time
+from email.utils import formatdate
+
+import httpx
+import pytest
+
+from app import provider_client
+from app.provider_client import ProviderClient
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def _client(handler, **options) -> ProviderClient:
+    client = ProviderClient(**{"max_retries": 3, "backoff_base": 0.01, "backoff_max": 5.0, **options})
+    client._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return client
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """Record backoff delays instead of waiting them out"""
+    delays = []
+
+    async def sleep(delay):
+        delays.append(delay)
+
+    monkeypatch.setattr(provider_client.asyncio, "sleep", sleep)
+    return delays
+
+
+def test_retries_wait_at_least_retry_after(sleeps):
+    statuses = iter([429, 503, 200])
+
+    def handler(request):
+        status = next(statuses)
+        return httpx.Response(status, headers={"retry-after": "2"} if status != 200 else {}, text="ok")
+
+    async def scenario():
+        client = _client(handler)
+        async with client.stream("claude", "POST", "https://llm.test/v1") as response:
+            body = await response.aread()
+        return response.status_code, body, client.stats()["providers"]["claude"]
+
+    status, body, stats = run(scenario())
+    assert status == 200 and body == b"ok"
+    assert len(sleeps) == 2 and all(delay >= 2 for delay in sleeps)
+    assert stats["retries"] == 2 and stats["errors"] == 2 and stats["status_codes"] == {429: 1, 503: 1, 200: 1}
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("3", 3.0),
+    ("-1", 0.0),
+    ("120", 5.0),
+    ("soon", 0.0),
+    (None, 0.0),
+])
+def test_retry_after_is_parsed_and_capped(value, expected):
+    client = ProviderClient(backoff_max=5.0)
+    response = httpx.Response(429, headers={"retry-after": value} if value is not None else {})
+    assert client._retry_after(response) == expected
+
+
+def test_retry_after_accepts_an_http_date():
+    client = ProviderClient(backoff_max=60.0)
+    response = httpx.Response(429, headers={"retry-after": formatdate(usegmt=True, timeval=time.time() + 30)})
+    assert 25 <= client._retry_after(response) <= 30
+
+
+def test_non_retryable_errors_are_returned_at_once(sleeps):
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(400, json={"error": {"message": "bad request"}})
+
+    async def scenario():
+        client = _client(handler)
+        async with client.stream("gemini", "POST", "https://llm.test/v1") as response:
+            return response.status_code
+
+    assert run(scenario()) == 400
+    assert len(calls) == 1 and sleeps == []
+
+
+def test_transport_errors_give_up_after_max_retries(sleeps):
+    def handler(request):
+        raise httpx.ConnectError("connection refused", request=request)
+
+    async def scenario():
+        client = _client(handler, max_retries=2)
+        with pytest.raises(httpx.ConnectError):
+            async with client.stream("claude", "POST", "https://llm.test/v1"):
+                pass
+        return client
+
+    client = run(scenario())
+    stats = client.stats()["providers"]["claude"]
+    assert len(sleeps) == 2 and stats["requests"] == 3 and stats["errors"] == 3
+    assert client._semaphores["claude"]._value == client.concurrency("claude")
+
+
+def test_slot_is_released_while_backing_off(monkeypatch):
+    monkeypatch.setenv("LLM_CONCURRENCY_CLAUDE", "1")
+    events = []
+    first_attempt = {"done": False}
+
+    def handler(request):
+        path = request.url.path
+        events.append(path)
+        if path == "/slow" and not first_attempt["done"]:
+            first_attempt["done"] = True
+            return httpx.Response(503, headers={"retry-after": "0.2"})
+        return httpx.Response(200, text=path)
+
+    async def scenario():
+        client = _client(handler, backoff_max=0.2)
+
+        async def call(path):
+            async with client.stream("claude", "POST", f"https://llm.test{path}") as response:
+                await response.aread()
+                events.append(f"done {path}")
+
+        slow = asyncio.create_task(call("/slow"))
+        await asyncio.sleep(0.05)
+        # /slow is backing off; with its slot held this would wait the full 0.2s
+        await asyncio.wait_for(call("/fast"), timeout=0.15)
+        await slow
+        return client._semaphores["claude"]._value
+
+    assert run(scenario()) == 1
+    assert events == ["/slow", "/fast", "done /fast", "/slow", "done /slow"]
+
+
+def test_failed_stream_releases_its_slot():
+    def handler(request):
+        return httpx.Response(200, text="partial")
+
+    async def scenario():
+        client = _client(handler)
+        with pytest.raises(RuntimeError):
+            async with client.stream("claude", "POST", "https://llm.test/v1"):
+                raise RuntimeError("consumer failed")
+        return client
+
+    client = run(scenario())
+    assert client._semaphores["claude"]._value == client.concurrency("claude")
+    assert client.stats()["providers"]["claude"]["errors"] == 1
@@ -0,0 +1,135 @@
+import asyncio
+
+import pytest
+
+from app.provider_routing import ProviderRouter
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def _attempts(behaviour):
+    """attempt(provider, on_text) running behaviour[provider](on_text)"""
+    calls = []
+
+    async def attempt(provider, on_text):
+        calls.append(provider)
+        return await behaviour[provider](on_text)
+
+    return attempt, calls
+
+
+async def _fails(on_text):
+    raise RuntimeError("overloaded")
+
+
+def _streams(text, delay=0.0):
+    async def generate(on_text):
+        await asyncio.sleep(delay)
+        await on_text(text)
+        return text
+    return generate
+
+
+def test_falls_back_to_the_next_provider_on_error():
+    attempt, calls = _attempts({"claude": _fails, "gemini": _streams("<html>gemini</html>")})
+    router = ProviderRouter(fallback=True, hedge=False)
+    streamed = []
+
+    async def on_text(text):
+        streamed.append(text)
+
+    result, report = run(router.run(["claude", "gemini"], attempt, on_text))
+    assert result == "<html>gemini</html>" and streamed == [result]
+    assert calls == ["claude", "gemini"]
+    assert [(a["provider"], a["outcome"]) for a in report["attempts"]] == [("claude", "failed"), ("gemini", "succeeded")]
+    stats = router.stats()["providers"]
+    assert stats["claude"]["failures"] == 1 and stats["gemini"]["fallbacks_to"] == 1
+
+
+def test_raises_the_last_error_when_every_provider_fails():
+    attempt, calls = _attempts({"claude": _fails, "gemini": _fails})
+    with pytest.raises(RuntimeError, match="overloaded"):
+        run(ProviderRouter(fallback=True, hedge=False).run(["claude", "gemini"], attempt))
+    assert calls == ["claude", "gemini"]
+
+
+def test_fallback_after_streaming_is_not_streamed_again():
+    async def streams_then_fails(on_text):
+        await on_text("<html>partial")
+        raise RuntimeError("connection reset")
+
+    attempt, _ = _attempts({"claude": streams_then_fails, "gemini": _streams("<html>full</html>")})
+    streamed = []
+
+    async def on_text(text):
+        streamed.append(text)
+
+    result, _ = run(ProviderRouter(fallback=True, hedge=False).run(["claude", "gemini"], attempt, on_text))
+    assert result == "<html>full</html>" and streamed == ["<html>partial"]
+
+
+def _router_with_history(first_token_seconds, samples=5):
+    router = ProviderRouter(fallback=True, hedge=True, hedge_percentile=95, hedge_min_samples=samples)
+    for _ in range(samples):
+        router._record("claude", True, first_token_seconds)
+    return router
+
+
+def test_hedge_starts_the_next_provider_when_the_first_token_is_late():
+    async def stalls(on_text):
+        await asyncio.sleep(5)
+        return "never"
+
+    attempt, calls = _attempts({"claude": stalls, "gemini": _streams("<html>gemini</html>")})
+    router = _router_with_history(0.02)
+
+    async def scenario():
+        return await asyncio.wait_for(router.run(["claude", "gemini"], attempt), timeout=2)
+
+    result, report = run(scenario())
+    assert result == "<html>gemini</html>" and report["hedged"] and report["provider"] == "gemini"
+    assert calls == ["claude", "gemini"]
+    assert ("claude", "cancelled") in [(a["provider"], a["outcome"]) for a in report["attempts"]]
+    stats = router.stats()["providers"]
+    assert stats["gemini"]["hedges_started"] == 1 and stats["gemini"]["hedges_won"] == 1
+
+
+def test_no_hedge_when_the_first_token_arrives_in_time():
+    attempt, calls = _attempts({"claude": _streams("<html>claude</html>", delay=0.01),
+                                "gemini": _streams("<html>gemini</html>")})
+    result, report = run(_router_with_history(0.5).run(["claude", "gemini"], attempt))
+    assert result == "<html>claude</html>" and not report["hedged"] and calls == ["claude"]
+
+
+def test_no_hedge_without_enough_history():
+    router = _router_with_history(0.01, samples=5)
+    router.hedge_min_samples = 10
+    assert router.hedge_delay("claude") is None
+    assert router.hedge_delay("gemini") is None
+
+
+def test_hedge_delay_is_the_configured_percentile():
+    router = ProviderRouter(hedge=True, hedge_percentile=90, hedge_min_samples=10)
+    for seconds in range(1, 11):
+        router._record("claude", True, seconds / 10)
+    assert router.hedge_delay("claude") == 1.0
+    router.hedge_percentile = 50
+    assert router.hedge_delay("claude") == 0.6
+
+
+def test_rank_puts_the_preferred_provider_first_and_respects_fallback():
+    router = ProviderRouter(fallback=True, hedge=False)
+    assert router.rank(["claude", "gemini"], preferred="gemini") == ["gemini", "claude"]
+    assert ProviderRouter(fallback=False, hedge=False).rank(["claude", "gemini"], preferred="gemini") == ["gemini"]
+
+
+def test_rank_steers_away_from_failing_providers(monkeypatch):
+    router = ProviderRouter(fallback=True, hedge=False)
+    for _ in range(10):
+        router._record("claude", False, None)
+        router._record("gemini", True, 0.2)
+    assert router.weight("claude") == 0
+    firsts = {router.rank(["claude", "gemini"])[0] for _ in range(50)}
+    assert firsts == {"gemini"}
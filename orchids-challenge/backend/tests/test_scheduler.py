@@ -0,0 +1,121 @@
+import asyncio
+
+import pytest
+
+from app.main import scheduler_http_error
+from app.scheduler import JobScheduler, QueueFullError, SchedulerClosedError
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def _scheduler(**options):
+    # Two workers: one per stage slot
+    return JobScheduler(**{"max_queue_depth": 2, "scrape_concurrency": 1, "generate_concurrency": 1,
+                           "drain_timeout": 1, **options})
+
+
+def test_full_queue_rejects_with_429():
+    async def scenario():
+        scheduler = _scheduler()
+        scheduler.start()
+        release = asyncio.Event()
+        scheduler.submit("job-0", release.wait)
+        scheduler.submit("job-1", release.wait)
+        # Let the two workers take the first two jobs, then fill the queue
+        await asyncio.sleep(0)
+        scheduler.submit("job-2", release.wait)
+        scheduler.submit("job-3", release.wait)
+        with pytest.raises(QueueFullError) as raised:
+            scheduler.submit("job-4", release.wait)
+        stats = scheduler.stats()
+        release.set()
+        await scheduler.stop()
+        return raised.value, stats
+
+    error, stats = run(scenario())
+    assert stats["rejected"] == 1 and stats["queue_depth"] == 2 and stats["running"] == 2
+    http_error = scheduler_http_error(error)
+    assert http_error.status_code == 429 and http_error.headers["Retry-After"]
+
+
+def test_queue_positions_follow_submission_order():
+    async def scenario():
+        scheduler = _scheduler(max_queue_depth=10)
+        scheduler.start()
+        release = asyncio.Event()
+        for index in range(5):
+            scheduler.submit(f"job-{index}", release.wait)
+        # The two workers take the first two jobs
+        await asyncio.sleep(0)
+        positions = [scheduler.position(f"job-{index}") for index in range(5)]
+        release.set()
+        await scheduler.stop()
+        return positions
+
+    # The first two are running, so they are no longer queued
+    assert run(scenario()) == [None, None, 1, 2, 3]
+
+
+def test_stop_drains_queued_jobs_then_refuses_new_ones():
+    async def scenario():
+        scheduler = _scheduler(max_queue_depth=10)
+        scheduler.start()
+        finished = []
+
+        def job(name):
+            async def work():
+                await asyncio.sleep(0.01)
+                finished.append(name)
+            return work
+
+        for index in range(5):
+            scheduler.submit(f"job-{index}", job(f"job-{index}"))
+        await scheduler.stop()
+        with pytest.raises(SchedulerClosedError):
+            scheduler.submit("late", job("late"))
+        return finished, scheduler.stats()
+
+    finished, stats = run(scenario())
+    assert sorted(finished) == [f"job-{index}" for index in range(5)]
+    assert stats["completed"] == 5 and stats["abandoned"] == 0 and stats["workers"] == 0
+
+
+def test_stop_abandons_what_does_not_finish_in_time():
+    async def scenario():
+        abandoned = []
+
+        async def on_abandon(job_id):
+            abandoned.append(job_id)
+
+        scheduler = _scheduler(max_queue_depth=10, drain_timeout=0.2, on_abandon=on_abandon)
+        scheduler.start()
+        never = asyncio.Event()
+        for index in range(4):
+            scheduler.submit(f"job-{index}", never.wait)
+        await scheduler.stop()
+        return abandoned, scheduler.stats()
+
+    abandoned, stats = run(scenario())
+    assert sorted(abandoned) == [f"job-{index}" for index in range(4)]
+    assert stats["abandoned"] == 4 and stats["running"] == 0
+
+
+def test_stage_slots_cap_concurrency():
+    async def scenario():
+        scheduler = _scheduler(scrape_concurrency=2, generate_concurrency=3, max_queue_depth=20)
+        scheduler.start()
+        peak = {"scrape": 0}
+
+        async def job():
+            async with scheduler.stage("scrape"):
+                peak["scrape"] = max(peak["scrape"], scheduler.stats()["stages"]["scrape"]["active"])
+                await asyncio.sleep(0.01)
+
+        for index in range(10):
+            scheduler.submit(f"job-{index}", job)
+        await scheduler.stop()
+        return peak["scrape"], scheduler.stats()["completed"]
+
+    assert run(scenario()) == (2, 10)
@@ -0,0 +1,126 @@
+import pytest
+
+from app.sectioned_generation import extract_fragment, plan_regions, region_contexts
+
+
+def _node(tag, y, height, id=None, cls=None, children=None):
+    return {"tag": tag, "id": id, "className": cls, "position": {"x": 0, "y": y, "width": 1280, "height": height},
+            "children": children or []}
+
+
+def _context(*sections, **extra):
+    # Pages usually wrap their regions in a single app root
+    return {"layout": {"height": 800, "structure": [_node("div", 0, 5000, id="app", children=list(sections))]}, **extra}
+
+
+HEADER = _node("header", 0, 80)
+HERO = _node("section", 80, 600, cls="hero")
+BODY = [_node("section", 680 + 500 * i, 500, cls=f"s{i}") for i in range(4)]
+FOOTER = _node("footer", 2680, 300)
+
+
+@pytest.mark.parametrize("sections, roles", [
+    ([HEADER, HERO, *BODY, FOOTER], ["header", "hero", "section", "section", "section", "section", "footer"]),
+    # Header and footer recognized by their names
+    ([_node("div", 0, 80, cls="site-nav"), HERO, _node("div", 680, 300, id="page-footer")], ["header", "hero", "footer"]),
+    ([_node("div", 0, 80, id="masthead"), HERO, FOOTER], ["header", "hero", "footer"]),
+    # A short first section pinned to the top is a header even without a name
+    ([_node("div", 0, 120), HERO, FOOTER], ["header", "hero", "footer"]),
+    ([_node("div", 0, 700, cls="navigation-hero"), HERO, FOOTER], ["hero", "section", "footer"]),
+    # Out-of-flow elements after the footer; the footer still closes the page
+    ([HEADER, HERO, FOOTER, _node("a", 2980, 40, cls="back-to-top")], ["header", "hero", "section", "footer"]),
+    ([HERO, *BODY], ["hero", "section", "section", "section", "section"]),
+    ([HEADER, FOOTER], ["header", "footer"]),
+    ([HERO], []),
+    ([], []),
+])
+def test_plan_regions_roles(sections, roles):
+    assert [region["role"] for region in plan_regions(_context(*sections), max_regions=8)] == roles
+
+
+@pytest.mark.parametrize("max_regions, names", [
+    (8, ["header", "hero", "section-1", "section-2", "section-3", "section-4", "footer"]),
+    (5, ["header", "hero", "section-1", "section-2", "footer"]),
+    (3, ["header", "hero", "section-1", "footer"]),
+])
+def test_plan_regions_groups_sections_within_max_regions(max_regions, names):
+    regions = plan_regions(_context(HEADER, HERO, *BODY, FOOTER), max_regions)
+    assert [region["name"] for region in regions] == names
+    sections = [node for region in regions if region["role"] == "section" for node in region["nodes"]]
+    assert sections == BODY
+
+
+def test_plan_regions_spans_ignore_offscreen_nodes():
+    offscreen = _node("div", -9999, 10, cls="skip-link")
+    regions = plan_regions(_context(HEADER, HERO, offscreen, BODY[0], FOOTER), max_regions=3)
+    section = next(region for region in regions if region["role"] == "section")
+    assert (section["top"], section["bottom"]) == (680, 1180)
+
+
+def _rules(*texts):
+    return [{"selectorText": text[:text.index("{")].strip() if not text.startswith("@") else None, "cssText": text}
+            for text in texts]
+
+
+def test_region_contexts_cut_the_context_down_to_each_region():
+    header = _node("header", 0, 80, children=[_node("nav", 0, 80, cls="menu")])
+    hero = _node("section", 80, 600, cls="hero")
+    footer = _node("footer", 680, 200, cls="legal")
+    context = _context(
+        header, hero, footer,
+        url="https://shop.test/", favicon="/favicon.ico",
+        navigation_links=[{"text": "Home", "href": "/"}],
+        css_rules=_rules(".menu{a:b}", ".hero{c:d}", ".legal{e:f}", "p{g:h}", ".tooltip{i:j}", "@media (max-width:600px){.hero{k:l}}"),
+        ui_components={"buttons": [{"attributes": {"class": "hero cta"}}, {"attributes": {"class": ["legal"]}}]},
+    )
+    contexts = region_contexts(context, plan_regions(context, max_regions=4))
+    by_role = {c["region"]["role"]: c for c in contexts}
+    assert list(by_role) == ["header", "hero", "footer"]
+
+    css = {role: [rule["cssText"] for rule in c["css_rules"]] for role, c in by_role.items()}
+    # Content tags are kept everywhere; .tooltip is in no captured node so it may be anywhere
+    assert css["header"] == [".menu {a:b}", "p {g:h}", ".tooltip {i:j}"]
+    assert css["hero"] == [".hero {c:d}", "p {g:h}", ".tooltip {i:j}", "@media (max-width:600px) { .hero {k:l} }"]
+    assert css["footer"] == [".legal {e:f}", "p {g:h}", ".tooltip {i:j}"]
+
+    assert by_role["header"]["favicon"] == "/favicon.ico" and by_role["hero"]["favicon"] is None
+    assert by_role["footer"]["navigation_links"] and by_role["hero"]["navigation_links"] == []
+    assert by_role["hero"]["ui_components"] == {"buttons": [{"attributes": {"class": "hero cta"}}]}
+    assert by_role["footer"]["ui_components"] == {"buttons": [{"attributes": {"class": ["legal"]}}]}
+    assert by_role["hero"]["layout"]["structure"] == [hero]
+
+
+def test_region_contexts_keep_matching_breakpoint_sections():
+    context = _context(HEADER, HERO, FOOTER)
+    context["breakpoints"] = {"mobile": {"width": 375, "layout": {"structure": [
+        _node("div", 0, 3000, id="app", children=[_node("header", 0, 60), _node("section", 60, 400, cls="hero"), _node("footer", 460, 200)]),
+    ]}}}
+    contexts = region_contexts(context, plan_regions(context, max_regions=4))
+    assert [[node["tag"] for node in c["breakpoints"]["mobile"]["layout"]["structure"]] for c in contexts] == [
+        ["header"], ["section"], ["footer"]]
+    assert contexts[1]["breakpoints"]["mobile"]["width"] == 375
+
+
+FRAGMENT = '<section data-region="hero"><h1>Sale</h1></section>'
+
+
+@pytest.mark.parametrize("text, expected", [
+    (FRAGMENT, FRAGMENT),
+    (f"  \n{FRAGMENT}\n\n", FRAGMENT),
+    (f"```html\n{FRAGMENT}\n```", FRAGMENT),
+    (f"```HTML\n{FRAGMENT}\n```", FRAGMENT),
+    (f"```\n{FRAGMENT}\n```", FRAGMENT),
+    (f"Here is the hero region:\n\n```html\n{FRAGMENT}\n```\n\nLet me know if you need changes.", FRAGMENT),
+    (f"Here is the hero region: {FRAGMENT} Hope this helps!", FRAGMENT),
+    # Truncated before the closing fence
+    (f"```html\n{FRAGMENT}", FRAGMENT),
+    (f"<!DOCTYPE html><html><head><title>x</title></head><body class=\"page\">\n{FRAGMENT}\n</body></html>", FRAGMENT),
+    (f"<html><head><style>[data-region=\"hero\"] h1{{color:red}}</style></head><body>{FRAGMENT}</body></html>",
+     f"<style>[data-region=\"hero\"] h1{{color:red}}</style>\n{FRAGMENT}"),
+    (f"```html\n<!DOCTYPE html>\n<html><body>{FRAGMENT}</body></html>\n```", FRAGMENT),
+    # Truncated inside the body
+    (f"<html><body>{FRAGMENT}<section><p>cut", f"{FRAGMENT}<section><p>"),
+    ("no markup at all", "no markup at all"),
+])
+def test_extract_fragment(text, expected):
+    assert extract_fragment(text) == expected
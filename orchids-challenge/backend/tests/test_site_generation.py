@@ -0,0 +1,107 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from app.context_compaction import compact_site_context
+from app.crawler import deduplicate_site
+from app.llm_clone import SITE_CONTEXT_PROMPT, WebsiteCloner
+from app.provider_client import ProviderClient
+from app.provider_routing import ProviderRouter
+
+SHARED_RULE = "body { margin: 0 }"
+
+
+def _header():
+    node = {"tag": "span", "children": []}
+    for _ in range(5):
+        node = {"tag": "header", "children": [node]}
+    return node
+
+
+def _page(path, own_rule):
+    return {"url": f"https://example.com{path}", "depth": 1, "design_context": {
+        "url": f"https://example.com{path}", "base_domain": "https://example.com",
+        "structure": {"title": path, "headings": []}, "colors": [], "fonts": [], "meta_tags": {},
+        "navigation_links": [], "css_rules": [{"cssText": SHARED_RULE}, {"cssText": own_rule}],
+        "layout": {"structure": [{**_header(), "position": {"y": 0}}, {"tag": "main", "children": []}]},
+    }}
+
+
+@pytest.fixture
+def site_pages():
+    pages = [_page("/", ".hero { color: red }"), _page("/about", ".team { color: blue }")]
+    site = deduplicate_site(pages)
+    return pages, [
+        {"shared": site["shared"], "page": {"css_rules": own["css_rules"], "layout": own["layout"]}}
+        for own in site["pages"]
+    ]
+
+
+def _page_context(page, site):
+    return {**page["design_context"], **site["page"]}
+
+
+def test_shared_context_is_one_identical_prefix(tmp_path, site_pages, monkeypatch):
+    monkeypatch.setenv("ANTHROPIC_API_KEY", "test")
+    cloner = WebsiteCloner(cache_dir=str(tmp_path))
+    pages, sites = site_pages
+    prepared = [cloner._prepare_prompt_inputs(_page_context(page, site), "claude", "single", site["shared"])
+                for page, site in zip(pages, sites)]
+
+    (first_json, first_site, first_report, first_key), (second_json, second_site, _, second_key) = prepared
+    assert first_site == second_site
+    assert "margin:0" in first_site and json.loads(first_site)["components"]
+    assert "margin:0" not in first_json and ".hero" in first_json
+    assert '"shared"' in first_json
+    assert first_report["site"]["estimated_tokens"] > 0
+    # The shared context is part of the key, and keys differ from full-context clones
+    full_key = cloner._prepare_prompt_inputs(pages[0]["design_context"], "claude")[3]
+    assert len({first_key, second_key, full_key}) == 3
+
+
+def test_site_context_respects_its_budget():
+    shared = {"css_rules": [f".rule-{i} {{ color: red }}" for i in range(200)], "layout": {}}
+    site_json, report = compact_site_context(shared, budget_tokens=100)
+    assert report["estimated_tokens"] <= 100
+    assert report["truncated"]["css_rules"].endswith("/200 items")
+    assert compact_site_context({"css_rules": [], "layout": {}}, 100)[0] == "{}"
+
+
+def test_claude_request_marks_the_shared_prefix_for_caching(tmp_path, site_pages, monkeypatch):
+    monkeypatch.setenv("ANTHROPIC_API_KEY", "test")
+    requests = []
+
+    def handler(request):
+        requests.append(json.loads(request.content))
+        events = [
+            {"type": "message_start", "message": {"usage": {"input_tokens": 50, "cache_read_input_tokens": 400}}},
+            {"type": "content_block_delta", "delta": {"type": "text_delta", "text": "<html></html>"}},
+            {"type": "message_delta", "usage": {"output_tokens": 5}},
+        ]
+        body = "".join(f"data: {json.dumps(event)}\n\n" for event in events)
+        return httpx.Response(200, text=body, headers={"content-type": "text/event-stream"})
+
+    client = ProviderClient(max_retries=0)
+    client._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    cloner = WebsiteCloner(http_client=client, cache_dir=str(tmp_path), router=ProviderRouter(hedge=False))
+    pages, sites = site_pages
+
+    async def scenario():
+        results = []
+        for page, site in zip(pages, sites):
+            results.append(await cloner.generate_clone(dict(page["design_context"]), "claude", mode="single", site=site))
+        await client.stop()
+        return results
+
+    results = asyncio.run(scenario())
+    prefixes = []
+    for request in requests:
+        prefix, page_part = request["messages"][1]["content"][:2]
+        assert prefix["cache_control"] == {"type": "ephemeral"}
+        assert prefix["text"].startswith(SITE_CONTEXT_PROMPT)
+        assert "margin:0" not in page_part["text"]
+        prefixes.append(prefix["text"])
+    assert len(requests) == 2 and prefixes[0] == prefixes[1]
+    assert results[1]["usage"]["cache_read_input_tokens"] == 400
@@ -0,0 +1,99 @@
+import pytest
+
+from app.stylesheets import parse_css, prune_unused_rules, selector_matches, split_rules
+
+USED = {"tags": ["html", "body", "div", "a", "nav"], "classes": ["hero", "btn", "a:b"], "ids": ["main"]}
+
+
+def _prune(css):
+    rules, _ = prune_unused_rules(parse_css(css)["rules"], USED)
+    return [rule["cssText"] for rule in rules]
+
+
+@pytest.mark.parametrize("css, expected", [
+    ("a{color:red}b{color:blue}", ["a{color:red}", "b{color:blue}"]),
+    ("/* a{} */ .x{content:'}'}", [".x{content:'}'}"]),
+    ("@import url(x.css); a{}", ["@import url(x.css);", "a{}"]),
+    ("@media (min-width:1px){a{b:c}d{e:f}} p{}", ["@media (min-width:1px){a{b:c}d{e:f}}", "p{}"]),
+    ("a{}}b{}", ["a{}", "b{}"]),
+])
+def test_split_rules(css, expected):
+    assert split_rules(css) == expected
+
+
+@pytest.mark.parametrize("css, base_url, rules, imports", [
+    (".a, .b { color: red }", None, [{"selectorText": ".a, .b", "cssText": ".a, .b { color: red }"}], []),
+    ("@charset \"utf-8\"; a{}", None, [{"selectorText": "a", "cssText": "a{}"}], []),
+    ("@import 'reset.css'; @import url(\"https://cdn.test/x.css\");", "https://site.test/css/main.css",
+     [], ["https://site.test/css/reset.css", "https://cdn.test/x.css"]),
+    (".bg{background:url(img/a.png)}", "https://site.test/css/main.css",
+     [{"selectorText": ".bg", "cssText": '.bg{background:url("https://site.test/css/img/a.png")}'}], []),
+    (".bg{background:url(data:image/png;base64,AA)}", "https://site.test/",
+     [{"selectorText": ".bg", "cssText": ".bg{background:url(data:image/png;base64,AA)}"}], []),
+    ("@media print{a{}}", None, [{"selectorText": None, "cssText": "@media print{a{}}"}], []),
+])
+def test_parse_css(css, base_url, rules, imports):
+    assert parse_css(css, base_url) == {"rules": rules, "imports": imports}
+
+
+@pytest.mark.parametrize("selector, expected", [
+    ("div", True),
+    ("span", False),
+    (".hero", True),
+    (".missing", False),
+    ("#main", True),
+    ("#other", False),
+    ("div.hero#main", True),
+    ("div.hero.missing", False),
+    (".missing > a", True),
+    ("nav a.missing", False),
+    ("a:hover", True),
+    ("a::before", True),
+    (".btn:not(.missing)", True),
+    ("input[type=text]", False),
+    ("[data-x]", True),
+    ("*", True),
+    (":root", True),
+    (".a\\:b", True),
+    ("SPAN", False),
+    ("DIV", True),
+])
+def test_selector_matches(selector, expected):
+    used = {key: set(values) for key, values in USED.items()}
+    assert selector_matches(selector, used) is expected
+
+
+@pytest.mark.parametrize("css, expected", [
+    (".hero{a:b}.gone{c:d}", [".hero {a:b}"]),
+    (".hero, .gone, #main {a:b}", [".hero, #main {a:b}"]),
+    (".gone, span{a:b}", []),
+    ("@media (max-width:600px){.hero{a:b}.gone{c:d}}", ["@media (max-width:600px) { .hero {a:b} }"]),
+    ("@media print{.gone{c:d}}", []),
+    ("@supports (display:grid){@media screen{.gone{a:b}div{c:d}}}",
+     ["@supports (display:grid) { @media screen { div {c:d} } }"]),
+    ("@supports (display:grid){@media screen{.gone{a:b}}}", []),
+    ("@MEDIA screen{span{a:b}}", []),
+    ("@page{margin:0}", ["@page{margin:0}"]),
+])
+def test_prune_unused_rules(css, expected):
+    assert _prune(css) == expected
+
+
+@pytest.mark.parametrize("css, expected", [
+    ("@keyframes spin{to{x:y}} .hero{animation:spin 1s}", ["@keyframes spin{to{x:y}}", ".hero {animation:spin 1s}"]),
+    ("@keyframes spin{to{x:y}} .gone{animation:spin 1s}", []),
+    ("@-webkit-keyframes spin{to{x:y}} .hero{animation:spin 1s}", ["@-webkit-keyframes spin{to{x:y}}", ".hero {animation:spin 1s}"]),
+    ("@font-face{font-family:'Brand';src:url(x)} div{font-family:Brand,sans-serif}",
+     ["@font-face{font-family:'Brand';src:url(x)}", "div {font-family:Brand,sans-serif}"]),
+    ("@font-face{font-family:'Brand';src:url(x)} span{font-family:Brand}", []),
+    ("@media screen{.hero{animation:spin 1s}} @keyframes spin{to{x:y}}",
+     ["@media screen { .hero {animation:spin 1s} }", "@keyframes spin{to{x:y}}"]),
+])
+def test_prune_keeps_referenced_keyframes_and_fonts(css, expected):
+    assert _prune(css) == expected
+
+
+def test_prune_stats_and_plain_rules():
+    rules, stats = prune_unused_rules([{"cssText": ".hero{a:b}"}, ".gone{c:d}", {"cssText": ""}], USED)
+    assert rules == [{"selectorText": ".hero", "cssText": ".hero {a:b}"}]
+    assert stats == {"rules_before": 2, "rules_after": 1, "chars_before": 20, "chars_after": 11}
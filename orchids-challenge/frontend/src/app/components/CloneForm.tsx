@@ -6,6 +6,7 @@ import { useRouter } from 'next/navigation';
 export const CloneForm = () => {
   const [url, setUrl] = useState('');
   const [model, setModel] = useState('claude');
+  const [forceRefresh, setForceRefresh] = useState(false);
   const [isLoading, setIsLoading] = useState(false);
   const [error, setError] = useState('');
   const router = useRouter();
@@ -33,6 +34,7 @@ export const CloneForm = () => {
         body: JSON.stringify({
           url,
           model,
+          force_refresh: forceRefresh,
         }),
       });
 
@@ -95,6 +97,22 @@ export const CloneForm = () => {
           </select>
         </div>
 
+        <div className="flex items-center">
+          <input
+            id="force-refresh"
+            type="checkbox"
+            checked={forceRefresh}
+            onChange={(e) => setForceRefresh(e.target.checked)}
+            className="h-4 w-4 rounded border-slate-600/50 bg-slate-700/70 text-purple-500 focus:ring-purple-500"
+          />
+          <label
+            htmlFor="force-refresh"
+            className="ml-2 text-sm text-slate-300"
+          >
+            Regenerate even if this clone is cached
+          </label>
+        </div>
+
         {error && (
           <div className="text-red-400 text-sm mt-2">{error}</div>
         )}
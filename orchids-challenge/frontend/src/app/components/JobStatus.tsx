@@ -15,6 +15,8 @@ interface JobData {
   model: string | null;
   started_at: string | null;
   completed_at: string | null;
+  queue_position?: number | null;
+  streamed_chars?: number | null;
   result?: {
     html: string;
     model_used: string;
@@ -25,9 +27,14 @@ export default function JobStatus({ jobId }: JobStatusProps) {
   const [jobData, setJobData] = useState<JobData | null>(null);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState('');
+  const [streamedHtml, setStreamedHtml] = useState('');
 
   useEffect(() => {
-    const fetchJobStatus = async () => {
+    let events: EventSource | null = null;
+    let pollTimer: ReturnType<typeof setTimeout> | null = null;
+    let closed = false;
+
+    const fetchJobStatus = async (poll: boolean) => {
       try {
         const response = await fetch(`http://localhost:8000/jobs/${jobId}`);
         
@@ -39,18 +46,63 @@ export default function JobStatus({ jobId }: JobStatusProps) {
         setJobData(data);
         setLoading(false);
         
-        // If job is still processing, poll for updates
-        if (['pending', 'scraping', 'generating'].includes(data.status)) {
-          setTimeout(() => fetchJobStatus(), 2000);
+        // Without a stream, poll while the job is still processing
+        if (poll && !closed && ['pending', 'scraping', 'generating'].includes(data.status)) {
+          pollTimer = setTimeout(() => fetchJobStatus(true), 2000);
         }
+        return data;
       } catch (error) {
         console.error('Error fetching job status:', error);
         setError('Failed to fetch job status');
         setLoading(false);
+        return null;
       }
     };
 
-    fetchJobStatus();
+    const streamJob = () => {
+      events = new EventSource(`http://localhost:8000/jobs/${jobId}/stream`);
+      
+      events.addEventListener('status', (event) => {
+        const { status, message } = JSON.parse((event as MessageEvent).data);
+        setJobData((current) => current ? { ...current, status, message } : current);
+        if (status === 'failed') {
+          events?.close();
+          fetchJobStatus(false);
+        }
+      });
+      
+      events.addEventListener('chunk', (event) => {
+        const { offset, text } = JSON.parse((event as MessageEvent).data);
+        setStreamedHtml((current) => current.slice(0, offset) + text);
+      });
+      
+      events.addEventListener('completed', () => {
+        events?.close();
+        fetchJobStatus(false);
+      });
+      
+      // Fall back to polling if the stream cannot be used
+      events.onerror = () => {
+        events?.close();
+        if (!closed) {
+          fetchJobStatus(true);
+        }
+      };
+    };
+
+    fetchJobStatus(false).then((data) => {
+      if (!closed && data && ['pending', 'scraping', 'generating'].includes(data.status)) {
+        streamJob();
+      }
+    });
+
+    return () => {
+      closed = true;
+      events?.close();
+      if (pollTimer) {
+        clearTimeout(pollTimer);
+      }
+    };
   }, [jobId]);
 
   if (loading) {
@@ -150,10 +202,16 @@ export default function JobStatus({ jobId }: JobStatusProps) {
               ></div>
             </div>
             <p className="mt-2 text-sm text-gray-500 dark:text-gray-400">
-              {jobData.status === 'pending' ? 'Starting job...' : 
+              {jobData.status === 'pending' && jobData.queue_position ? `Queued (position ${jobData.queue_position})...` :
+               jobData.status === 'pending' ? 'Starting job...' : 
                jobData.status === 'scraping' ? 'Scraping website...' : 
                jobData.status === 'generating' ? 'Generating clone with AI...' : ''}
             </p>
+            {jobData.status === 'generating' && streamedHtml && (
+              <pre className="mt-4 w-full max-h-64 overflow-auto bg-gray-100 dark:bg-gray-900 text-xs text-gray-700 dark:text-gray-300 p-3 rounded whitespace-pre-wrap">
+                {streamedHtml.slice(-4000)}
+              </pre>
+            )}
           </div>
         ) : null}
         